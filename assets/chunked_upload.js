@@ -0,0 +1,101 @@
+// Chunked, resumable upload of large data files (server side: components/upload.py).
+// Clicking the 'upload-large' button picks a file, which is sent in chunks to /upload.
+// An interrupted upload resumes from the offset the server reports.
+// When the upload completes, its ID is pushed to the URL ('?upload=<id>&n=<nonce>'),
+// where the 'upload-location' dcc.Location hands it to the dashboard.
+// The nonce changes the URL for each upload, so uploading the same file again (same ID) is read again.
+
+(function () {
+    var CHUNK_SIZE = 8 * 1024 * 1024;
+    var MAX_RETRIES = 5;
+
+    function setLabel(button, text) {
+        if (button) {
+            button.textContent = text;
+        }
+    }
+
+    function postJSON(url, body) {
+        return fetch(url, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(body)
+        }).then(function (response) {
+            return response.json().then(function (data) {
+                return {status: response.status, data: data};
+            });
+        });
+    }
+
+    function sendChunks(file, uploadId, offset, button, retries) {
+        if (offset >= file.size) {
+            return postJSON('/upload/' + uploadId + '/complete', {}).then(function (result) {
+                if (result.status === 409) {
+                    return sendChunks(file, uploadId, result.data.offset, button, retries);
+                }
+                if (result.status !== 200) {
+                    throw new Error(result.data.error);
+                }
+                return uploadId;
+            });
+        }
+        var chunk = file.slice(offset, offset + CHUNK_SIZE);
+        return fetch('/upload/' + uploadId + '?offset=' + offset, {method: 'PUT', body: chunk})
+            .then(function (response) {
+                return response.json().then(function (data) {
+                    if (response.status === 200 || response.status === 409) {
+                        // 409: server has a different offset, continue from there
+                        setLabel(button, 'Uploading ' + Math.floor(100 * data.offset / Math.max(file.size, 1)) + '%');
+                        return sendChunks(file, uploadId, data.offset, button, MAX_RETRIES);
+                    }
+                    throw new Error(data.error);
+                });
+            }, function (error) {
+                // network error: retry the same chunk after a short wait
+                if (retries <= 0) {
+                    throw error;
+                }
+                return new Promise(function (resolve) { setTimeout(resolve, 2000); })
+                    .then(function () { return sendChunks(file, uploadId, offset, button, retries - 1); });
+            });
+    }
+
+    function uploadFile(file, button) {
+        var label = button ? button.textContent : '';
+        setLabel(button, 'Uploading 0%');
+        postJSON('/upload/init', {
+            filename: file.name,
+            size: file.size,
+            fingerprint: file.name + '|' + file.size + '|' + file.lastModified
+        }).then(function (result) {
+            if (result.status !== 200) {
+                throw new Error(result.data.error);
+            }
+            return sendChunks(file, result.data.upload_id, result.data.offset, button, MAX_RETRIES);
+        }).then(function (uploadId) {
+            setLabel(button, label);
+            window.history.pushState({}, '', '?upload=' + uploadId + '&n=' + Date.now());
+            window.dispatchEvent(new CustomEvent('_dashprivate_pushstate'));
+        }).catch(function (error) {
+            setLabel(button, 'Upload failed, click to resume');
+            console.error(error);
+        });
+    }
+
+    // Dash renders the layout after this script loads, so listen on the document
+    document.addEventListener('click', function (event) {
+        var button = event.target.closest ? event.target.closest('#upload-large') : null;
+        if (!button) {
+            return;
+        }
+        var input = document.createElement('input');
+        input.type = 'file';
+        input.accept = '.csv,.gz,.zst,.zip,.xls,.xlsx,.xlsm,.parquet,.feather';
+        input.addEventListener('change', function () {
+            if (input.files.length > 0) {
+                uploadFile(input.files[0], button);
+            }
+        });
+        input.click();
+    });
+})();
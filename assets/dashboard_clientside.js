@@ -0,0 +1,107 @@
+// Browser-side callbacks of the dashboard (registered in dashboard.py with app.clientside_callback).
+// These only switch layout or dropdown options, using data rendered with the main div,
+// so they don't need a request to the server.
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    dashboard: {
+        // Update the distribution options to the histogram or map view (see get_hist_div and get_map_div).
+        // Defaults to the histogram view, switches on click based on the button label.
+        update_dist_view: function (n_clicks, children, layouts) {
+            if (!layouts) {
+                return window.dash_clientside.no_update;
+            }
+            if (!n_clicks || children === 'Show Histogram') {
+                return layouts.hist;
+            }
+            return layouts.map;
+        },
+
+        // Set subspecies dropdown options for the selected species.
+        set_subspecies_options: function (selected_species, dataset_info) {
+            if (!dataset_info || !dataset_info.all_species[selected_species]) {
+                return window.dash_clientside.no_update;
+            }
+            return dataset_info.all_species[selected_species].map(function (subspecies) {
+                return {label: subspecies, value: subspecies};
+            });
+        },
+
+        // Show the sheet picker for workbooks with several sheets (see load_data), with the sheet read selected.
+        set_sheet_picker: function (jsonified_data) {
+            var data = jsonified_data ? JSON.parse(jsonified_data) : {};
+            if (data.job) {
+                return window.dash_clientside.no_update;
+            }
+            if (!data.sheets || data.sheets.length < 2) {
+                return [[], null, {display: 'none'}];
+            }
+            return [data.sheets, data.sheet, {width: '30%', 'margin-top': 5}];
+        },
+
+        // Start polling the upload processing job (see poll_job) once its ID is saved.
+        start_job_polling: function (jsonified_data) {
+            var data = jsonified_data ? JSON.parse(jsonified_data) : {};
+            if (!data.job) {
+                return window.dash_clientside.no_update;
+            }
+            return false;
+        },
+
+        // Save the view of a map showing the markers in view (see make_map) once it is panned or zoomed.
+        set_map_viewport: function (relayout_data, figure, viewport) {
+            var meta = figure && figure.layout && figure.layout.meta;
+            if (!relayout_data || !meta || !meta.lod) {
+                return window.dash_clientside.no_update;
+            }
+            var geo = figure.layout.geo || {};
+            var center = geo.center || {};
+            var projection = geo.projection || {};
+            var updated = {
+                lat: relayout_data['geo.center.lat'],
+                lon: relayout_data['geo.center.lon'],
+                scale: relayout_data['geo.projection.scale']
+            };
+            if (updated.lat === undefined && updated.lon === undefined && updated.scale === undefined) {
+                return window.dash_clientside.no_update;
+            }
+            viewport = viewport || {};
+            return {
+                lat: updated.lat !== undefined ? updated.lat : (viewport.lat !== undefined ? viewport.lat : center.lat),
+                lon: updated.lon !== undefined ? updated.lon : (viewport.lon !== undefined ? viewport.lon : center.lon),
+                scale: updated.scale !== undefined ? updated.scale : (viewport.scale !== undefined ? viewport.scale : projection.scale)
+            };
+        },
+
+        // Set the page of histogram categories (see make_hist_plot): back to the first when the variable changes
+        // (and when the order changes, see update_dist_sort).
+        set_hist_page: function (prev_clicks, next_clicks, x_var, figure, page) {
+            var triggered = window.dash_clientside.callback_context.triggered.map(function (t) { return t.prop_id; });
+            var meta = (figure && figure.layout && figure.layout.meta) || {};
+            page = page || 0;
+            if (triggered.indexOf('hist-prev-btn.n_clicks') !== -1) {
+                return Math.max(page - 1, 0);
+            }
+            if (triggered.indexOf('hist-next-btn.n_clicks') !== -1) {
+                return Math.min(page + 1, (meta.pages || 1) - 1);
+            }
+            return page === 0 ? window.dash_clientside.no_update : 0;
+        },
+
+        // Show the histogram page buttons when its categories span several pages.
+        set_hist_pager: function (figure) {
+            var meta = (figure && figure.layout && figure.layout.meta) || {};
+            if (!meta.pages || meta.pages < 2) {
+                return [{display: 'none'}, ''];
+            }
+            return [{'margin-top': 5, 'text-align': 'center'}, 'Page ' + (meta.page + 1) + ' of ' + meta.pages];
+        },
+
+        // Select the first subspecies option.
+        set_subspecies_value: function (available_options) {
+            if (!available_options || available_options.length === 0) {
+                return window.dash_clientside.no_update;
+            }
+            return available_options[0].value;
+        }
+    }
+});
@@ -0,0 +1,52 @@
+'''
+Benchmark of Excel ingestion (components/ingest.py): the streaming reader of the columns the dashboard uses
+(`read_workbook`, with python-calamine and with the openpyxl read-only fallback), compared against
+`pd.read_excel` of the whole sheet, on generated workbooks with several sheets and unused columns.
+
+Run from the repository root:
+    python -m benchmarks.bench_excel --rows 10000 100000 --sheets 3 --extra-columns 10
+'''
+import os
+import time
+import argparse
+import tempfile
+import pandas as pd
+from benchmarks.generate import make_dataset, write_workbook
+import components.ingest
+from components.ingest import read_workbook, DATA_COLUMNS
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type = int, nargs = '+', default = [10000, 50000])
+    parser.add_argument('--sheets', type = int, default = 3)
+    parser.add_argument('--extra-columns', type = int, default = 10)
+    args = parser.parse_args()
+
+    def read_openpyxl(path):
+        calamine = components.ingest.CalamineWorkbook
+        components.ingest.CalamineWorkbook = None
+        try:
+            return read_workbook(path, None, DATA_COLUMNS)
+        finally:
+            components.ingest.CalamineWorkbook = calamine
+
+    readers = {
+        'read_excel': lambda path: pd.read_excel(path),
+        'openpyxl': read_openpyxl
+    }
+    if components.ingest.CalamineWorkbook is not None:
+        readers['calamine'] = lambda path: read_workbook(path, None, DATA_COLUMNS)
+    print(f"{'rows':>10} {'reader':>12} {'time s':>8} {'file MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_rows in args.rows:
+            path = os.path.join(tmp_dir, f'data_{n_rows}.xlsx')
+            write_workbook(make_dataset(n_rows), path, args.sheets, args.extra_columns)
+            for name, read in readers.items():
+                start = time.perf_counter()
+                df = read(path)
+                elapsed = time.perf_counter() - start
+                assert len(df) == n_rows
+                print(f'{n_rows:>10} {name:>12} {elapsed:>8.2f} {os.path.getsize(path) / 2**20:>8.2f}')
+
+if __name__ == '__main__':
+    main()
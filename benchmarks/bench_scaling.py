@@ -0,0 +1,172 @@
+'''
+Scaling benchmark of the dashboard's data path on synthetic datasets (benchmarks/generate.py):
+wall time, peak memory (traced Python allocations, including NumPy and pandas buffers)
+and payload bytes of each stage, from the upload (`parse_contents`) to the figures.
+Uploads are processed in the benchmark process (`load_contents`, as run by the background job).
+
+Payload is the size of what the stage receives from or sends to the browser:
+the base64 upload for `parse_contents`, the JSON of the figure for the figure builders,
+and the JSON of the result for the other stages.
+
+Run from the repository root, eg.:
+    python -m benchmarks.bench_scaling --rows 1000 100000 1000000 --localities 5000
+    python -m benchmarks.bench_scaling --rows 10000000 --stages get_data make_map --no-memory
+Use --json to save the results (one JSON object per line) to compare between versions.
+'''
+import os
+import gc
+import json
+import time
+import base64
+import argparse
+import tempfile
+import tracemalloc
+import plotly.io
+
+from benchmarks.generate import make_dataset
+from dashboard import load_contents
+from components.store import dataset_store, get_dataset_key
+from components.index import build_index
+from components.profile import check_features
+from components.query import get_data, get_species_options, get_filenames
+from components.graphs import make_hist_plot, make_map, make_pie_plot
+
+STAGES = ['parse_contents', 'get_data', 'get_species_options', 'get_filenames',
+          'make_hist_plot', 'make_map', 'make_pie_plot']
+
+def get_upload_contents(df, filename = 'synthetic.csv'):
+    # Contents of the upload component for `df` as a CSV file, and the key of its processed dataset
+    content = df.to_csv(index = False).encode('utf-8')
+    encoded = base64.b64encode(content).decode('ascii')
+    return 'data:text/csv;base64,' + encoded, filename, get_dataset_key(content, filename)
+
+def forget_dataset(key):
+    # Remove a processed dataset from the store, so `parse_contents` processes the upload again
+    dataset_store.remove(key)
+
+def get_payload_bytes(stage, result):
+    if stage.startswith('make_'):
+        return len(plotly.io.to_json(result, validate = False))
+    return len(json.dumps(result, default = str))
+
+def measure(func, args, repeat = 1, memory = True, setup = None):
+    '''
+    Function to measure a call of `func(*args)`.
+
+    Parameters:
+    -----------
+    func - Function to measure.
+    args - Tuple of arguments of `func`.
+    repeat - Integer. Number of timed calls, the best time is kept.
+    memory - Boolean. Measure the peak memory in one more (traced) call, since tracing slows down the call.
+    setup - Function to call (untimed) before each call, eg. to clear caches.
+
+    Returns:
+    --------
+    seconds - Best wall time of a call.
+    peak_bytes - Peak traced memory allocated during a call, None if not measured.
+    result - Return value of the last call.
+    '''
+    seconds = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    peak_bytes = None
+    if memory:
+        if setup is not None:
+            setup()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = func(*args)
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return seconds, peak_bytes, result
+
+def run_stages(df, stages = STAGES, repeat = 1, memory = True):
+    '''
+    Function to run the benchmark stages on a raw (uploaded) DataFrame.
+
+    Parameters:
+    -----------
+    df - DataFrame with the columns of the test data (from `make_dataset`).
+    stages - List of stages (in `STAGES`) to measure.
+    repeat - Integer. Number of timed calls per stage.
+    memory - Boolean. Measure peak memory of each stage.
+
+    Returns:
+    --------
+    results - List of dictionaries with 'stage', 'seconds', 'peak_bytes', and 'payload_bytes'.
+    '''
+    included_features, mapping, images, missing = check_features(df.columns)
+    processed_df, _ = get_data(df, mapping, list(included_features))
+    index = build_index(processed_df)
+    contents, filename, dataset_key = get_upload_contents(df)
+    calls = {
+        'parse_contents': (load_contents, (contents, filename), lambda: forget_dataset(dataset_key)),
+        # `get_data` adds to the list of features, pass a new list to each call
+        'get_data': (lambda df, mapping, features: get_data(df, mapping, list(features))[0],
+                     (df, mapping, included_features), None),
+        'get_species_options': (get_species_options, (processed_df,), None),
+        'get_filenames': (get_filenames, (processed_df, 'Any', processed_df.View.unique().tolist(),
+                                          processed_df.Sex.unique().tolist(), processed_df.hybrid_stat.unique().tolist(),
+                                          12, index), None),
+        'make_hist_plot': (make_hist_plot, (processed_df, 'Subspecies', 'Species', 'sum descending'), None),
+        'make_map': (make_map, (processed_df, 'Species'), None),
+        'make_pie_plot': (make_pie_plot, (processed_df, 'Subspecies'), None)
+    }
+    results = []
+    for stage in stages:
+        func, args, setup = calls[stage]
+        seconds, peak_bytes, result = measure(func, args, repeat, memory, setup)
+        # the upload is received from the browser, the processed DataFrame stays on the server
+        if stage == 'parse_contents':
+            payload_bytes = len(args[0])
+        elif stage == 'get_data':
+            payload_bytes = None
+        else:
+            payload_bytes = get_payload_bytes(stage, result)
+        results.append({'stage': stage, 'seconds': seconds, 'peak_bytes': peak_bytes, 'payload_bytes': payload_bytes})
+    forget_dataset(dataset_key)
+    return results
+
+def format_mb(n_bytes):
+    return '-' if n_bytes is None else f'{n_bytes / 2**20:.2f}'
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type = int, nargs = '+', default = [1000, 10000, 100000])
+    parser.add_argument('--species', type = int, default = 2)
+    parser.add_argument('--subspecies', type = int, default = 30)
+    parser.add_argument('--localities', type = int, default = 200)
+    parser.add_argument('--views', type = int, default = 2)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--stages', nargs = '+', choices = STAGES, default = STAGES)
+    parser.add_argument('--repeat', type = int, default = 1, help = 'Number of timed runs per stage, the best is reported.')
+    parser.add_argument('--no-memory', action = 'store_true', help = 'Skip the (slower) peak memory measurement.')
+    parser.add_argument('--json', help = 'Path of a file to append results to, one JSON object per line.')
+    args = parser.parse_args()
+
+    # Keep the processed datasets of the benchmark out of the dashboard's cache directory
+    dataset_store.cache_dir = tempfile.mkdtemp(prefix = 'dashboard-bench-')
+    print(f"{'rows':>10} {'stage':>20} {'time ms':>10} {'peak MB':>9} {'payload MB':>11}")
+    for n_rows in args.rows:
+        df = make_dataset(n_rows, args.species, args.subspecies, args.localities, args.views, seed = args.seed)
+        results = run_stages(df, args.stages, args.repeat, not args.no_memory)
+        for result in results:
+            print(f"{n_rows:>10} {result['stage']:>20} {1000 * result['seconds']:>10.1f} "
+                  f"{format_mb(result['peak_bytes']):>9} {format_mb(result['payload_bytes']):>11}")
+            if args.json:
+                with open(args.json, 'a') as file:
+                    file.write(json.dumps(dict(result, rows = n_rows, species = args.species, subspecies = args.subspecies,
+                                               localities = args.localities, views = args.views)) + '\n')
+    os.rmdir(dataset_store.cache_dir)
+
+if __name__ == '__main__':
+    main()
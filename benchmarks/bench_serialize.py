@@ -0,0 +1,50 @@
+'''
+Benchmark of the processed dataset serialization formats (components/serialize.py):
+encode and decode time and size of each format, compared against the JSON path.
+
+Run from the repository root:
+    python -m benchmarks.bench_serialize --rows 200000
+'''
+import time
+import argparse
+import pandas as pd
+from components.query import get_data
+from components.serialize import SERIALIZERS, serialize_df, deserialize_df
+
+FEATURES = ['Species', 'Subspecies', 'View', 'Sex', 'hybrid_stat', 'lat', 'lon', 'file_url', 'Image_filename']
+
+def get_processed_df(filepath, n_rows):
+    # Repeat the test dataset up to `n_rows` rows and process it as the dashboard does
+    df = pd.read_csv(filepath)
+    df = pd.concat([df] * (n_rows // len(df) + 1), ignore_index = True).iloc[:n_rows]
+    features = [feature for feature in FEATURES if feature in df.columns]
+    processed_df, _ = get_data(df, True, features)
+    return processed_df
+
+def time_call(func, *args, repeat = 3):
+    # Best of `repeat` runs, in seconds
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type = int, nargs = '+', default = [10000, 100000])
+    parser.add_argument('--data', default = 'test_data/HCGSD_full_filepath.csv')
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'format':>8} {'encode ms':>10} {'decode ms':>10} {'size MB':>9}")
+    for n_rows in args.rows:
+        df = get_processed_df(args.data, n_rows)
+        for format in SERIALIZERS:
+            encode_time, (used_format, data) = time_call(serialize_df, df, format)
+            decode_time, _ = time_call(deserialize_df, used_format, data)
+            label = format if used_format == format else f'{format}->{used_format}'
+            print(f'{n_rows:>10} {label:>8} {1000 * encode_time:>10.1f} {1000 * decode_time:>10.1f} {len(data) / 2**20:>9.2f}')
+
+if __name__ == '__main__':
+    main()
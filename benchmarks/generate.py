@@ -0,0 +1,117 @@
+'''
+Generator of synthetic datasets with the schema of the test data (test_data/HCGSD_full_filepath.csv),
+for benchmarks at sizes beyond the test datasets.
+
+Each specimen has one row per view; subspecies belong to a single species and
+each locality has fixed coordinates, as in the real data.
+
+Write a dataset to CSV (or an Excel workbook) from the repository root, eg.:
+    python -m benchmarks.generate --rows 1000000 --out tmp/synthetic_1M.csv
+    python -m benchmarks.generate --rows 100000 --sheets 3 --out tmp/synthetic_100k.xlsx
+'''
+import argparse
+import numpy as np
+import pandas as pd
+
+BASE_VIEWS = ['dorsal', 'ventral']
+SEXES = ['male', 'female']
+HYBRID_STATS = ['valid subspecies', 'subspecies synonym', 'hybrid']
+IMAGE_URL = 'https://example.com/images'
+
+def get_views(n_views):
+    # Views of the test data first, then numbered ones
+    return (BASE_VIEWS + [f'view{i}' for i in range(len(BASE_VIEWS), n_views)])[:n_views]
+
+def make_dataset(n_rows, n_species = 2, n_subspecies = 30, n_localities = 200, n_views = 2,
+                 null_fraction = 0.01, seed = 0):
+    '''
+    Function to generate a synthetic dataset with the columns of the test data.
+
+    Parameters:
+    -----------
+    n_rows - Integer. Number of rows (images) to generate.
+    n_species - Integer. Number of distinct species.
+    n_subspecies - Integer. Number of distinct subspecies (at least `n_species`), each belonging to one species.
+    n_localities - Integer. Number of distinct localities, each with its own lat/lon.
+    n_views - Integer. Number of views (rows) per specimen.
+    null_fraction - Float. Fraction of null values in 'Sex', 'hybrid_stat', 'lat', and 'lon'.
+    seed - Integer. Seed of the random generator, the same arguments give the same dataset.
+
+    Returns:
+    --------
+    df - DataFrame of `n_rows` rows.
+    '''
+    rng = np.random.default_rng(seed)
+    n_subspecies = max(n_subspecies, n_species)
+    n_specimens = -(-n_rows // n_views) # ceiling division
+
+    # Specimen-level attributes, repeated for each view
+    specimen = np.repeat(np.arange(10**7, 10**7 + n_specimens), n_views)[:n_rows]
+    subspecies = np.repeat(rng.integers(0, n_subspecies, n_specimens), n_views)[:n_rows]
+    locality = np.repeat(rng.integers(0, n_localities, n_specimens), n_views)[:n_rows]
+    sex = np.repeat(rng.integers(0, len(SEXES), n_specimens), n_views)[:n_rows]
+    hybrid = np.repeat(rng.integers(0, len(HYBRID_STATS), n_specimens), n_views)[:n_rows]
+    view = np.tile(np.arange(n_views), n_specimens)[:n_rows]
+
+    species_names = np.array([f'species{i}' for i in range(n_species)], dtype = object)
+    subspecies_names = np.array([f'subspecies{i}' for i in range(n_subspecies)], dtype = object)
+    locality_names = np.array([f'locality{i}' for i in range(n_localities)], dtype = object)
+    views = np.array(get_views(n_views), dtype = object)
+    locality_lat = np.round(rng.uniform(-20, 20, n_localities), 2)
+    locality_lon = np.round(rng.uniform(-90, -40, n_localities), 2)
+
+    view_names = pd.Series(views[view])
+    image_filename = pd.Series(specimen).astype(str) + '_' + view_names + '.png'
+    df = pd.DataFrame({
+        'NHM_Specimen': specimen,
+        'Image_filename': image_filename,
+        'View': view_names,
+        'Species': species_names[subspecies % n_species],
+        'Subspecies': subspecies_names[subspecies],
+        'Sex': np.array(SEXES, dtype = object)[sex],
+        'hybrid_stat': np.array(HYBRID_STATS, dtype = object)[hybrid],
+        'locality': locality_names[locality],
+        'lat': locality_lat[locality],
+        'lon': locality_lon[locality],
+        'file_url': IMAGE_URL + '/' + view_names + '_images/'
+    })
+    for feature in ['Sex', 'hybrid_stat', 'lat', 'lon']:
+        df.loc[rng.random(n_rows) < null_fraction, feature] = np.nan
+    return df
+
+def write_workbook(df, path, n_sheets = 1, n_extra_columns = 0):
+    '''
+    Function to write a dataset to an Excel workbook, as the first of `n_sheets` copies of it
+    (other sheets named 'Sheet2', ...), with `n_extra_columns` columns the dashboard doesn't use.
+    '''
+    import openpyxl
+    df = df.assign(**{f'extra{i}': np.arange(len(df)) * i for i in range(n_extra_columns)})
+    df = df.astype(object).where(df.notna(), None)
+    workbook = openpyxl.Workbook(write_only = True)
+    for i in range(n_sheets):
+        sheet = workbook.create_sheet('Data' if i == 0 else f'Sheet{i + 1}')
+        sheet.append(list(df.columns))
+        for row in df.itertuples(index = False):
+            sheet.append(row)
+    workbook.save(path)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type = int, default = 10000)
+    parser.add_argument('--species', type = int, default = 2)
+    parser.add_argument('--subspecies', type = int, default = 30)
+    parser.add_argument('--localities', type = int, default = 200)
+    parser.add_argument('--views', type = int, default = 2)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--sheets', type = int, default = 1, help = 'Number of sheets, for Excel workbooks.')
+    parser.add_argument('--out', required = True, help = 'Path of the file to write: CSV, or Excel workbook (.xlsx).')
+    args = parser.parse_args()
+
+    df = make_dataset(args.rows, args.species, args.subspecies, args.localities, args.views, seed = args.seed)
+    if args.out.endswith('.xlsx'):
+        write_workbook(df, args.out, args.sheets)
+    else:
+        df.to_csv(args.out, index = False)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+# Generic in-process cache used by the dataset store and figure cache
+
+class LRUCache:
+    '''
+    Thread-safe least-recently-used cache with an optional time-to-live and total size bound.
+    Entries are evicted oldest-first once either `max_items` or `max_bytes` is exceeded,
+    and are dropped on access once they are older than `ttl` seconds.
+    Counts hits and misses of `get` in `hits` and `misses`.
+
+    Parameters:
+    -----------
+    max_items - Integer. Maximum number of entries to hold.
+    max_bytes - Integer. Maximum total size of entries (as measured by `sizeof`), None for no bound.
+    ttl - Number of seconds an entry stays valid after it was stored, None for no expiry.
+    sizeof - Function returning the size in bytes of a stored value.
+
+    '''
+    def __init__(self, max_items = 16, max_bytes = None, ttl = None, sizeof = sys.getsizeof):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (value, size, time stored)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._get_entry(key) is not None
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.monotonic() - stored_at > self.ttl
+
+    def _get_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry[2]):
+            self._remove(key)
+            return None
+        return entry
+
+    def _remove(self, key):
+        value, size, stored_at = self._entries.pop(key)
+        self.total_bytes -= size
+        return value
+
+    def get(self, key, default = None):
+        '''
+        Return the value stored for `key` (marking it most recently used), or `default` if absent or expired.
+        '''
+        with self._lock:
+            entry = self._get_entry(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        '''
+        Store `value` under `key`, evicting least recently used entries to stay within bounds.
+        A value larger than `max_bytes` on its own is not stored.
+        '''
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, time.monotonic())
+            self.total_bytes += size
+            while len(self._entries) > self.max_items or \
+                    (self.max_bytes is not None and self.total_bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def pop(self, key, default = None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            return self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import tempfile
+from components.store import DatasetStore, get_file_key, make_private_dir
+
+# Catalog of datasets kept on the server, listed in a picker instead of being uploaded.
+# Each catalog file is processed once: its processed dataset is kept (without expiry) in a store of its own,
+# shared by the workers and sessions, under the content hash of the file.
+# The hash is recomputed only when the file's size or modification time changes, the dataset
+# processed from the previous content is then removed.
+
+CATALOG_DIR = os.environ.get('DASHBOARD_CATALOG_DIR') # None disables the catalog
+CATALOG_CACHE_DIR = os.environ.get('DASHBOARD_CATALOG_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'dashboard-catalog'))
+CATALOG_EXTENSIONS = ('.csv', '.csv.gz', '.csv.zst', '.parquet', '.feather')
+
+catalog_store = DatasetStore(cache_dir = CATALOG_CACHE_DIR, ttl = None)
+
+def set_catalog_dir(catalog_dir):
+    '''
+    Function to set the catalog directory (eg., from the command line), overriding DASHBOARD_CATALOG_DIR.
+    '''
+    global CATALOG_DIR
+    CATALOG_DIR = catalog_dir
+
+def list_catalog(catalog_dir = None):
+    '''
+    Function to list the dataset files (CSV, possibly compressed, Parquet, or Feather) of the catalog directory.
+
+    Parameters:
+    -----------
+    catalog_dir - Path of the catalog directory, defaults to `CATALOG_DIR`.
+
+    Returns:
+    --------
+    names - Sorted list of the file names, empty if there is no catalog directory.
+    '''
+    catalog_dir = catalog_dir or CATALOG_DIR
+    if catalog_dir is None:
+        return []
+    try:
+        entries = list(os.scandir(catalog_dir))
+    except OSError:
+        return []
+    return sorted(entry.name for entry in entries
+                  if entry.is_file() and entry.name.lower().endswith(CATALOG_EXTENSIONS))
+
+def get_catalog_path(name, catalog_dir = None):
+    '''
+    Function to get the path of a catalog file, None if `name` is not in the catalog.
+    Names come back from the browser, so only the listed files are accepted.
+    '''
+    catalog_dir = catalog_dir or CATALOG_DIR
+    if name not in list_catalog(catalog_dir):
+        return None
+    return os.path.join(catalog_dir, name)
+
+def get_catalog_key(name, catalog_dir = None, store = None):
+    '''
+    Function to get the key of the processed dataset of a catalog file.
+
+    Parameters:
+    -----------
+    name - String. Name of the catalog file.
+    catalog_dir - Path of the catalog directory, defaults to `CATALOG_DIR`.
+    store - DatasetStore of the processed catalog datasets, defaults to `catalog_store`.
+
+    Returns:
+    --------
+    key - String. Content hash of the file (as `get_file_key`), None if `name` is not in the catalog.
+    '''
+    store = store or catalog_store
+    path = get_catalog_path(name, catalog_dir)
+    if path is None:
+        return None
+    stat = os.stat(path)
+    version = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    # hash of the file recorded by the first worker to see this version of it
+    version_path = os.path.join(store.cache_dir, 'files', hashlib.sha256(path.encode('utf-8')).hexdigest() + '.json')
+    # only records of the server's own directories are trusted
+    make_private_dir(store.cache_dir)
+    make_private_dir(os.path.dirname(version_path))
+    try:
+        with open(version_path) as file:
+            recorded = json.load(file)
+    except (OSError, ValueError):
+        recorded = {}
+    if recorded.get('version') == version:
+        return recorded['key']
+    key = get_file_key(path, name)
+    if recorded.get('key') not in (None, key):
+        store.remove(recorded['key'])
+    fd, tmp_path = tempfile.mkstemp(dir = os.path.dirname(version_path), suffix = '.tmp')
+    with os.fdopen(fd, 'w') as file:
+        json.dump({'version': version, 'key': key}, file)
+    os.replace(tmp_path, version_path)
+    return key
@@ -140,23 +140,25 @@ def get_map_div():
     
     return map_div
 
-def get_img_div(df, all_species, img_url):
+def get_img_div(profile, url_checks = False):
     '''
     Function to generate the Image Sampling options section of the dashboard, including button to display images. 
     Provides empty list if no URLS are provided in the DataFrame for the entries.
 
     Parameters:
     -----------
-    df - DataFrame with relevant data for display.
-    all_species - All available species options for get_image dropdown.
-    img_url - Boolean. If False, does not render "Data Sample Image Selection" section of Dashboard. 
+    profile - DatasetProfile of the data for display: filter values ('facets'), species options for get_image dropdown ('all_species'),
+              and whether image urls are available ('images'). If `profile.images` is False, does not render "Data Sample Image Selection" section of Dashboard.
+    url_checks - Boolean. If True, renders the status of the background check of image URLs (updated by an interval).
 
     Returns:
     --------
-    img_div - HTML Div containing all user options for sample image selection. Returns an empty list if no image urls available (img_url is False).
+    img_div - HTML Div containing all user options for sample image selection. Returns an empty list if no image urls available.
 
     '''
-    if img_url:
+    if profile.images:
+        all_species = profile.all_species
+        facets = profile.facets
         img_div =[
                     html.H1("Data Sample Image Selection", style = H1_STYLE),
 
@@ -180,20 +182,20 @@ def get_img_div(df, all_species, img_url):
                         # Further Refine by Features
                         html.H4("that are ...", style = H4_STYLE),
                         html.Div([
-                            dcc.Checklist(df.Sex.unique(), 
-                                            df.Sex.unique()[0:2],
+                            dcc.Checklist(facets['Sex'], 
+                                            facets['Sex'][0:2],
                                             id = 'which-sex')],
                             style = QUARTER_DIV_STYLE
                             ),
                         html.Div([
-                            dcc.Checklist(df.View.unique(), 
-                                            df.View.unique()[0:2],
+                            dcc.Checklist(facets['View'], 
+                                            facets['View'][0:2],
                                             id = 'which-view')],
                             style = QUARTER_DIV_STYLE
                             ),
                         html.Div([
-                            dcc.Checklist(df.hybrid_stat.unique(), 
-                                            df.hybrid_stat.unique()[0:2],
+                            dcc.Checklist(facets['hybrid_stat'], 
+                                            facets['hybrid_stat'][0:2],
                                             id = 'hybrid?')],
                             style = QUARTER_DIV_STYLE
                             ),
@@ -206,6 +208,19 @@ def get_img_div(df, all_species, img_url):
                                         placeholder = '#',
                                         id = 'num-images')],
                             style = QUARTER_DIV_STYLE
+                            ),
+                        # Sampling options: seed to show the same images again, even spread across the selected groups
+                        html.Div([
+                            dcc.Input(type = 'number',
+                                        min = 0,
+                                        step = 1,
+                                        placeholder = 'Seed (optional)',
+                                        id = 'img-seed'),
+                            dcc.Checklist([{'label': 'Spread across selected subspecies, views, and sexes', 'value': 'stratify'}],
+                                            [],
+                                            id = 'img-stratify',
+                                            inline = True)],
+                            style = {'margin-top': 10}
                             )
                     ], id = 'dropdown-images'),
 
@@ -225,24 +240,33 @@ def get_img_div(df, all_species, img_url):
                     # Image Should appear
                     html.Div(id = 'image-1')
         ]
+        if url_checks:
+            img_div[2:2] = [html.P(id = 'url-check-status', style = H4_STYLE),
+                            dcc.Interval(id = 'url-check-interval', interval = 3000)]
     else:
         img_div = []
     return img_div
 
-def get_main_div(hist_div, img_div):
+def get_main_div(hist_div, img_div, dataset_info = None):
     '''
     Function to return main div based on upload of data.
+    Includes the data used by the browser-side callbacks: the histogram and map option divs ('dist-layouts')
+    and the dataset lookup data ('dataset-info').
 
     Parameters:
     -----------
     hist_div - HTML Div for histogram view.
     img_div - HTML Div for sample image selector.
+    dataset_info - Dictionary with species options ('all_species') and mapping (boolean on lat/lon availability).
 
     Returns:
     --------
     main_div - HTML Div containing all user options, graphs, and image return.
     '''
     main_div = html.Div([
+        dcc.Store(id = 'dataset-info', data = dataset_info),
+        dcc.Store(id = 'dist-layouts', data = {'hist': hist_div, 'map': get_map_div()}),
+
         html.H1("Data Distribution Statistics", style = H1_STYLE),
 
         # Distribution Options, default start on histogram
@@ -267,7 +291,19 @@ def get_main_div(hist_div, img_div):
         
         # Graphs - Distribution (histogram or map), then pie chart
         html.Div([
-            dcc.Graph(id = 'dist-plot')], style = HALF_DIV_STYLE),
+            dcc.Graph(id = 'dist-plot'),
+            # map view, for maps with too many markers to show at once (see make_map)
+            dcc.Store(id = 'map-viewport'),
+            # page of the histogram categories, for variables with too many to show at once (see make_hist_plot)
+            dcc.Store(id = 'hist-page', data = 0),
+            html.Div([
+                html.Button("Previous", style = BUTTON_STYLE, id = 'hist-prev-btn', n_clicks = 0),
+                html.Span(id = 'hist-page-label', style = {'color': 'MidnightBlue', 'margin': '0 10px'}),
+                html.Button("Next", style = BUTTON_STYLE, id = 'hist-next-btn', n_clicks = 0)
+                ],
+                id = 'hist-pager',
+                style = {'display': 'none'})
+            ], style = HALF_DIV_STYLE),
         html.Div([
             dcc.Graph(id = 'pie-plot')], style = HALF_DIV_STYLE),
 
@@ -290,7 +326,7 @@ def get_error_div(error_dict):
 
     Parameters:
     -----------
-    error_dict - Dictionary containing information about the error. Potential keys are 'feature', 'type', 'unicode', and 'other'.
+    error_dict - Dictionary containing information about the error. Potential keys are 'feature', 'type', 'expired', 'cancelled', 'unicode', and 'other'.
 
     Returns:
     --------
@@ -312,7 +348,7 @@ def get_error_div(error_dict):
                         ])
     elif 'type' in error_dict.keys():
         error_div = html.Div([
-                            html.H4(["The source file is not a valid CSV format, please see the ",
+                            html.H4(["The source file is not a supported format (CSV, compressed CSV, ZIP, Excel, Parquet, or Feather), please see the ",
                                      html.A("documentation", 
                                             href=DOCS_URL,
                                             target='_blank',
@@ -320,6 +356,16 @@ def get_error_div(error_dict):
                                      "."],
                             style = ERROR_STYLE)
         ])
+    elif 'expired' in error_dict.keys():
+        error_div = html.Div([
+            html.H4("This dataset is no longer available on the server, please upload it again.",
+                    style = ERROR_STYLE)
+        ])
+    elif 'cancelled' in error_dict.keys():
+        error_div = html.Div([
+            html.H4("Processing of this file was cancelled.",
+                    style = ERROR_STYLE)
+        ])
     elif 'unicode' in error_dict.keys():
         error_div = html.Div([
             html.H4("There was a UnicodeDecode error processing this file.",
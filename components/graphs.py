@@ -1,8 +1,130 @@
+import os
+import numpy as np
+import pandas as pd
 import plotly.express as px
+from components.cache import LRUCache
+from components.metrics import timed
+from components.spatial import MAP_MARKER_LIMIT, get_cell_size, bin_markers, get_viewport, in_viewport
 
-def make_hist_plot(df, x_var, color_by, sort_by):
+# Trace properties holding the data of the figures (one value per point, bar, or slice)
+ARRAY_PROPERTIES = ['x', 'y', 'lat', 'lon', 'customdata', 'labels', 'values', 'text', 'hovertext']
+
+def get_array_size(value):
+    # bytes of a data array, Python objects (eg., strings) counted at about the size of their JSON
+    array = value if isinstance(value, np.ndarray) else np.asarray(value, dtype = object)
+    return array.size * 24 if array.dtype == object else array.nbytes
+
+def get_figure_size(fig):
+    '''
+    Estimates the memory held by a figure from the lengths of its data arrays, without serializing it.
+    '''
+    size = 4096 # layout
+    for trace in fig.data:
+        for name in ARRAY_PROPERTIES:
+            if name in trace and trace[name] is not None:
+                size += get_array_size(trace[name])
+        marker = trace['marker'] if 'marker' in trace else None
+        if marker is not None and 'size' in marker and marker.size is not None and not np.isscalar(marker.size):
+            size += get_array_size(marker.size)
+    return size
+
+# Figures already made for a dataset, keyed by (dataset key, figure function, arguments)
+FIGURE_CACHE_MB = int(os.environ.get('DASHBOARD_FIGURE_CACHE_MB', 256))
+figure_cache = LRUCache(max_items = 512,
+                        max_bytes = FIGURE_CACHE_MB * 2**20,
+                        sizeof = get_figure_size)
+# Number of categories shown by the histogram at once, the others are summed in an "Other" bar
+HIST_TOP_K = int(os.environ.get('DASHBOARD_HIST_TOP_K', 50))
+# Orderings of the histogram categories (values of the sort-by options)
+SORT_ORDERS = ['alpha', 'sum ascending', 'sum descending']
+
+def drop_unused_categories(df):
+    '''
+    Removes categories without rows (eg., after filtering) from categorical columns, which plotly express can't group by.
+    '''
+    df = df.copy()
+    for column in df.select_dtypes('category').columns:
+        df[column] = df[column].cat.remove_unused_categories()
+    return df
+
+@timed
+def get_figure(dataset_key, make_figure, df, *args):
+    '''
+    Returns the figure made by `make_figure(df, *args)`, reusing the one made before for the same dataset and arguments.
+    
+    Parameters:
+    -----------
+    dataset_key - String. Key of the dataset `df` was loaded from, None to skip the cache.
+    make_figure - Function making the figure (eg., make_hist_plot, make_map, or make_pie_plot).
+    df - DataFrame of specimens.
+    args - Remaining arguments of `make_figure`.
+
+    Returns: 
+    --------
+    fig - Figure returned by `make_figure`.
+    '''
+    if dataset_key is None:
+        return make_figure(df, *args)
+    key = (dataset_key, make_figure.__name__, args)
+    fig = figure_cache.get(key)
+    if fig is None:
+        fig = make_figure(df, *args)
+        figure_cache.put(key, fig)
+    return fig
+
+def get_hist_counts(df, x_var, color_by, sort_by, page = 0, top_k = None):
+    '''
+    Counts specimens by `x_var` and `color_by` values, keeping the `x_var` categories of a page, the others grouped as "Other".
+
+    Parameters:
+    -----------
+    df - DataFrame of specimens.
+    x_var - Variable to plot distribution.
+    color_by - Property to color the plot by.
+    sort_by - Ordering of the categories ('alpha', 'sum ascending', or 'sum descending'), applied to the counts.
+    page - Integer. Page of categories to keep, in `sort_by` order (clamped to the pages available).
+    top_k - Integer. Number of categories per page, defaults to `HIST_TOP_K`.
+
+    Returns:
+    --------
+    counts - DataFrame with `x_var`, `color_by` (unless the same), and 'count' columns, the categories out of the page summed
+             in an "Other (n)" row per `color_by` value (a single row when coloring by `x_var`).
+    categories - List of the `x_var` values of the page in order, followed by the "Other" label if any.
+    page - Integer. Page kept.
+    n_pages - Integer. Number of pages.
+    Raises ValueError if `sort_by` is not one of `SORT_ORDERS`.
+    '''
+    if sort_by not in SORT_ORDERS:
+        raise ValueError(f'Unknown sort order: {sort_by}')
+    top_k = top_k or HIST_TOP_K
+    keys = list(dict.fromkeys([x_var, color_by])) # a single column when coloring by the plotted variable
+    counts = df.groupby(keys, sort = False, observed = True).size().rename('count').reset_index()
+    counts = counts.astype({key: object for key in keys})
+    totals = counts.groupby(x_var, sort = False)['count'].sum()
+    order = sorted(totals.index, key = str)
+    if sort_by != 'alpha':
+        # stable, so ties stay in alphabetical order
+        order = sorted(order, key = totals.get, reverse = sort_by == 'sum descending')
+
+    n_pages = max(-(-len(order) // top_k), 1)
+    page = min(max(int(page), 0), n_pages - 1)
+    categories = order[page * top_k:(page + 1) * top_k]
+    shown = counts[x_var].isin(categories)
+    if shown.all():
+        return counts, categories, page, n_pages
+    other = f'Other ({len(order) - len(categories)})'
+    if color_by == x_var:
+        other_counts = pd.DataFrame({x_var: [other], 'count': [counts.loc[~shown, 'count'].sum()]})
+    else:
+        other_counts = counts.loc[~shown].groupby(color_by, sort = False)['count'].sum().reset_index().assign(**{x_var: other})
+    counts = pd.concat([counts.loc[shown], other_counts[keys + ['count']]], ignore_index = True)
+    return counts, categories + [other], page, n_pages
+
+@timed
+def make_hist_plot(df, x_var, color_by, sort_by, page = 0):
     '''
     Generates interactive histogram of selected variable, with option of properties to color by and order in which to sort.
+    Shows at most `HIST_TOP_K` categories, a page of them (see `get_hist_counts`), the others summed in an "Other" bar.
     
     Parameters:
     -----------
@@ -10,69 +132,146 @@ def make_hist_plot(df, x_var, color_by, sort_by):
     x_var - Variable to plot distribution.
     color_by - Property to color the plot by.
     sort_by - Ordering of bar charts (Alphabetical, Ascending, or Descending).
+    page - Integer. Page of categories to show.
 
     Returns: 
     --------
-    fig - Histogram of the distribution of the requested variable.
+    fig - Histogram of the distribution of the requested variable, with the page shown and number of pages in its `meta`.
     '''
-    if sort_by == 'alpha':
-        fig = px.histogram(df.sort_values(x_var),
-                        x = x_var,
-                        color = color_by,
-                        color_discrete_sequence = px.colors.qualitative.Bold)
-    else:
-        fig = px.histogram(df,
-                        x = x_var,
-                        color = color_by,
-                        color_discrete_sequence = px.colors.qualitative.Bold).update_xaxes(categoryorder = sort_by)
+    counts, categories, page, n_pages = get_hist_counts(df, x_var, color_by, sort_by, page)
+    fig = px.histogram(counts,
+                    x = x_var,
+                    y = 'count',
+                    histfunc = 'sum',
+                    color = color_by,
+                    # same colors on every page
+                    category_orders = {x_var: categories, color_by: sorted(df[color_by].dropna().unique(), key = str)},
+                    color_discrete_sequence = px.colors.qualitative.Bold)
 
-    fig.update_layout(title = {'text': f'Distribution of {x_var} Colored by {color_by}'})
+    title = f'Distribution of {x_var} Colored by {color_by}'
+    if n_pages > 1:
+        title += f' (page {page + 1} of {n_pages})'
+    fig.update_layout(title = {'text': title}, yaxis_title = 'count', meta = {'page': page, 'pages': n_pages})
 
     return fig
 
-def make_map(df, color_by):
+def get_map_markers(df, color_by):
     '''
-    Generates interactive map of species and subspecies by location.
-    
+    Aggregates specimens to one row per locality (lat-lon) and `color_by` value, so each map marker is drawn once.
+
     Parameters:
     -----------
-    df - DataFrame of specimens.
+    df - DataFrame of specimens with valid lat & lon.
     color_by - Selected categorical variable by which to color.
 
-    Returns: 
+    Returns:
     --------
-    fig - Map of their locations.
+    markers - DataFrame with 'lat-lon', `color_by`, 'lat', 'lon', the locality hover columns
+              ('Samples_at_locality', 'Species_at_locality', 'Subspecies_at_locality'),
+              and 'Samples' (number of specimens of the `color_by` value at the locality).
     '''
-    df = df.copy()
-    # only use entries that have valid lat & lon for mapping
-    df = df.loc[df['lat-lon'].str.contains('unknown') == False]
-    fig = px.scatter_geo(df,
-                        lat = df.lat,
-                        lon = df.lon,
-                        projection = "natural earth",
-                        custom_data = ["Samples_at_locality", "Species_at_locality", "Subspecies_at_locality"],
-                        size = df.Samples_at_locality,
-                        color = color_by,
-                        color_discrete_sequence = px.colors.qualitative.Bold,
-                        title = "Distribution of Samples")
-    
-    fig.update_geos(fitbounds = "locations",
-                    showcountries = True, countrycolor = "Grey",
+    # locality columns are the same for all rows of a lat-lon, so they are taken from the first row of each marker
+    # (positions, rather than `first` over the categorical columns, which is slow for many localities)
+    groups = df.groupby(['lat-lon', color_by], sort = False, observed = True).ngroup().to_numpy()
+    mapped = ~np.isnan(groups) if groups.dtype.kind == 'f' else np.ones(len(groups), dtype = bool)
+    groups = groups[mapped].astype(np.int64)
+    _, first = np.unique(groups, return_index = True)
+    markers = df.loc[mapped, ['lat-lon', color_by, 'lat', 'lon',
+                              'Samples_at_locality', 'Species_at_locality', 'Subspecies_at_locality']].iloc[first]
+    markers = markers.assign(Samples = np.bincount(groups))
+    return drop_unused_categories(markers.reset_index(drop = True))
+
+def style_map(fig):
+    fig.update_geos(showcountries = True, countrycolor = "Grey",
                     showrivers = True,
                     showlakes = True,
                     showland = True, landcolor = "wheat",
                     showocean = True, oceancolor = "LightBlue")
+    return fig
+
+def make_marker_map(markers, color_by):
+    # Map with a marker per locality and `color_by` value (from `get_map_markers`)
+    fig = px.scatter_geo(markers,
+                        lat = markers.lat,
+                        lon = markers.lon,
+                        projection = "natural earth",
+                        custom_data = ["Samples_at_locality", "Species_at_locality", "Subspecies_at_locality", "Samples"],
+                        size = markers.Samples_at_locality,
+                        color = color_by,
+                        color_discrete_sequence = px.colors.qualitative.Bold,
+                        title = "Distribution of Samples")
     
     fig.update_traces(hovertemplate = 
                         "Latitude: %{lat}<br>"+
                         "Longitude: %{lon}<br>" +
                         "Samples at lat/lon: %{customdata[0]}<br>" +
                         "Species at lat/lon: %{customdata[1]}<br>" +
-                        "Subspecies at lat/lon: %{customdata[2]}<br>"
+                        "Subspecies at lat/lon: %{customdata[2]}<br>" +
+                        f"Samples of this {color_by}: " + "%{customdata[3]}<br>"
+    )
+    return style_map(fig)
+
+def make_bin_map(bins, color_by, cell_size):
+    # Map with a marker per grid cell (from `bin_markers`), colored by its most frequent `color_by` value
+    fig = px.scatter_geo(bins,
+                        lat = bins.lat,
+                        lon = bins.lon,
+                        projection = "natural earth",
+                        custom_data = ["Samples", "Localities", color_by, "Share"],
+                        size = bins.Samples,
+                        color = color_by,
+                        color_discrete_sequence = px.colors.qualitative.Bold,
+                        title = f"Distribution of Samples (grouped by {cell_size}° cells, zoom in for details)")
+
+    fig.update_traces(hovertemplate =
+                        "Cell center: %{lat:.2f}, %{lon:.2f}<br>" +
+                        "Samples in cell: %{customdata[0]}<br>" +
+                        "Localities in cell: %{customdata[1]}<br>" +
+                        f"Most samples of {color_by}: " + "%{customdata[2]} (%{customdata[3]:.0%})<br>"
     )
+    return style_map(fig)
+
+@timed
+def make_map(df, color_by, viewport = None):
+    '''
+    Generates interactive map of species and subspecies by location.
+    Past `MAP_MARKER_LIMIT` markers, the map shows the markers in view, or grid cells aggregating them
+    if there are still too many (see components/spatial.py).
+    
+    Parameters:
+    -----------
+    df - DataFrame of specimens.
+    color_by - Selected categorical variable by which to color.
+    viewport - Tuple of center latitude, center longitude, and projection scale of the map view (see `clean_viewport`),
+               None to fit all specimens. Only used past `MAP_MARKER_LIMIT` markers.
+
+    Returns: 
+    --------
+    fig - Map of their locations.
+    '''
+    # only use entries that have valid lat & lon for mapping
+    df = df.loc[df['lat-lon'].str.contains('unknown') == False]
+    # one marker per locality and `color_by` value
+    markers = get_map_markers(df, color_by)
+    if len(markers) <= MAP_MARKER_LIMIT:
+        fig = make_marker_map(markers, color_by)
+        fig.update_geos(fitbounds = "locations")
+        return fig
 
+    # level of detail: markers or grid cells in view, the browser reports the view when it changes
+    viewport = viewport or get_viewport(markers)
+    markers = drop_unused_categories(in_viewport(markers, viewport))
+    if len(markers) <= MAP_MARKER_LIMIT:
+        fig = make_marker_map(markers, color_by)
+    else:
+        cell_size = get_cell_size(markers.lat, markers.lon)
+        fig = make_bin_map(bin_markers(markers, color_by, cell_size), color_by, cell_size)
+    lat, lon, scale = viewport
+    fig.update_geos(center = {'lat': lat, 'lon': lon}, projection_rotation_lon = lon, projection_scale = scale)
+    fig.update_layout(meta = {'lod': True})
     return fig
 
+@timed
 def make_pie_plot(df, var):
     '''
     Generates interactive pie chart of dataset specimens with option of properties to color by.
@@ -86,6 +285,7 @@ def make_pie_plot(df, var):
     --------
     fig - Pie chart of the percentage breakdown of the `var` samples in the dataset.
     '''
+    df = drop_unused_categories(df[list(dict.fromkeys([var, 'Species']))])
     if(var == 'Subspecies'):
         pie_fig = px.pie(df,
                  names = var,
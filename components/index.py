@@ -0,0 +1,73 @@
+import numpy as np
+from components.metrics import timed
+
+# Inverted index of the processed dataset for the sample image filters.
+# Built once at upload: groups the rows by their combination of all filter values, so filters are answered
+# from the groups matching them, without scanning the DataFrame (see components/sampling.py).
+
+INDEX_FEATURES = ['Species', 'Subspecies', 'View', 'Sex', 'hybrid_stat']
+EMPTY_IDS = np.array([], dtype = np.int32)
+
+@timed
+def build_index(df):
+    '''
+    Function to build the inverted index of a processed DataFrame.
+
+    Parameters:
+    -----------
+    df - Processed DataFrame with image metadata.
+
+    Returns:
+    --------
+    index - Dictionary with 'images': sorted row positions of entries with both filename and URL (not 'unknown'),
+            'groups': dictionary of tuple of `INDEX_FEATURES` values to the sorted row positions of its entries with images,
+            'missing': dictionary of the same tuples to the number of its entries without filename or URL,
+            and 'n_rows': number of rows in `df`.
+    '''
+    index = {'n_rows': len(df)}
+    has_image = np.ones(len(df), dtype = bool)
+    for feature in ['Image_filename', 'file_url']:
+        if feature in df.columns:
+            has_image &= (df[feature] != 'unknown').to_numpy()
+    index['images'] = np.flatnonzero(has_image).astype(np.int32)
+    index['groups'], index['missing'] = get_groups(df, has_image)
+    return index
+
+def get_groups(df, has_image):
+    # rows with images and number of rows without, by combination of the filter values (None without all the features)
+    if not all(feature in df.columns for feature in INDEX_FEATURES):
+        return None, None
+    groups, missing = {}, {}
+    for key, ids in df.groupby(INDEX_FEATURES, sort = False, observed = True).indices.items():
+        with_image = has_image[ids]
+        groups[key] = ids[with_image].astype(np.int32)
+        missing[key] = int(len(ids) - with_image.sum())
+    return groups, missing
+
+@timed
+def extend_index(index, new_df):
+    '''
+    Function to add rows appended to a processed DataFrame to its inverted index, indexing only the new rows.
+
+    Parameters:
+    -----------
+    index - Inverted index (from `build_index`) of the DataFrame before the new rows.
+    new_df - Processed DataFrame of the new rows, appended after `index['n_rows']` rows.
+
+    Returns:
+    --------
+    index - Inverted index of the DataFrame with the new rows.
+    '''
+    offset = index['n_rows']
+    new_index = build_index(new_df)
+    extended = {'n_rows': offset + new_index['n_rows'],
+                'images': np.concatenate([index['images'], new_index['images'] + offset]).astype(np.int32)}
+    extended['groups'], extended['missing'] = index.get('groups'), index.get('missing')
+    if extended['groups'] is not None and new_index['groups'] is not None:
+        extended['groups'], extended['missing'] = dict(extended['groups']), dict(extended['missing'])
+        for key, ids in new_index['groups'].items():
+            extended['groups'][key] = np.concatenate([extended['groups'].get(key, EMPTY_IDS), ids + offset]).astype(np.int32)
+            extended['missing'][key] = extended['missing'].get(key, 0) + new_index['missing'][key]
+    else:
+        extended['groups'] = extended['missing'] = None
+    return extended
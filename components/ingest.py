@@ -0,0 +1,241 @@
+import os
+import zipfile
+import pandas as pd
+from components.metrics import timed
+from components.profile import FEATURES
+
+# Reading of uploaded data files
+
+# Columns the dashboard uses, others are skipped when parsing uploads
+DATA_COLUMNS = FEATURES + ['locality']
+# Text columns are parsed as strings without type inference; lat/lon are left to inference,
+# as some files hold text (eg., 'unknown') in them, which the processing turns to NaN
+TEXT_DTYPES = {column: str for column in DATA_COLUMNS if column not in ('lat', 'lon')}
+
+# File types by name ending, CSV files may be compressed (decompressed as a stream while parsing)
+CSV_COMPRESSIONS = {'.csv': None, '.csv.gz': 'gzip', '.csv.zst': 'zstd'}
+COLUMNAR_FORMATS = {'.parquet': 'parquet', '.feather': 'feather'}
+
+# Workbooks are read with python-calamine if installed (much faster), else with openpyxl in read-only mode
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Parquet and Feather files are read with pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+def get_file_type(filename):
+    '''
+    Function to get the type of a data file from its name.
+
+    Returns:
+    --------
+    file_type - String. 'csv' (plain or compressed, see `CSV_COMPRESSIONS`), 'excel', 'parquet', 'feather',
+                or 'zip' (archive of one CSV, Parquet, or Feather file). None if the file type is not supported.
+    '''
+    name = filename.lower()
+    if name.endswith(tuple(CSV_COMPRESSIONS)):
+        return 'csv'
+    if name.endswith(('.xls', '.xlsx', '.xlsm')):
+        return 'excel'
+    if name.endswith('.zip'):
+        return 'zip'
+    for extension, file_type in COLUMNAR_FORMATS.items():
+        if name.endswith(extension):
+            return file_type
+    return None
+
+def is_supported_file(filename):
+    '''
+    Function to check whether the uploaded file type can be read (CSV, possibly compressed, Excel, Parquet, Feather, or ZIP).
+    '''
+    return get_file_type(filename) is not None
+
+def get_csv_compression(filename):
+    name = filename.lower()
+    for extension, compression in CSV_COMPRESSIONS.items():
+        if name.endswith(extension):
+            return compression
+
+def get_zip_member(archive):
+    '''
+    Function to find the data file (CSV, Parquet, or Feather) of a ZIP archive.
+
+    Parameters:
+    -----------
+    archive - ZipFile of the uploaded archive.
+
+    Returns:
+    --------
+    member - ZipInfo of the data file.
+    Raises ValueError if the archive doesn't hold exactly one data file.
+    '''
+    members = [info for info in archive.infolist()
+               if not info.is_dir() and not os.path.basename(info.filename).startswith('.')
+               and get_file_type(info.filename) in ('csv', 'parquet', 'feather')]
+    if len(members) != 1:
+        raise ValueError(f'ZIP archive should hold one data file (CSV, Parquet, or Feather), found {len(members)}')
+    return members[0]
+
+def is_workbook(filename):
+    '''
+    Function to check whether a file is an Excel workbook read by the streaming reader (.xlsx or .xlsm).
+    '''
+    return (CalamineWorkbook is not None or openpyxl is not None) and filename.lower().endswith(('.xlsx', '.xlsm'))
+
+def open_calamine(source):
+    if isinstance(source, (str, os.PathLike)):
+        return CalamineWorkbook.from_path(str(source))
+    source.seek(0)
+    return CalamineWorkbook.from_filelike(source)
+
+def get_sheet_names(source):
+    '''
+    Function to list the sheets of an Excel workbook (path or binary file-like object).
+    '''
+    if CalamineWorkbook is not None:
+        return open_calamine(source).sheet_names
+    workbook = openpyxl.load_workbook(source, read_only = True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+def iter_workbook_rows(source, sheet_name = None):
+    '''
+    Generator of the rows (sequences of cell values) of a sheet of an Excel workbook, defaulting to the first sheet.
+    '''
+    if CalamineWorkbook is not None:
+        workbook = open_calamine(source)
+        sheet = workbook.get_sheet_by_name(sheet_name) if sheet_name is not None else workbook.get_sheet_by_index(0)
+        yield from sheet.iter_rows()
+        return
+    workbook = openpyxl.load_workbook(source, read_only = True, data_only = True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name is not None else workbook.worksheets[0]
+        yield from sheet.iter_rows(values_only = True)
+    finally:
+        workbook.close()
+
+def read_workbook(source, sheet_name = None, columns = None):
+    '''
+    Function to read a sheet of an Excel workbook, streaming its rows and keeping only the given columns.
+
+    Parameters:
+    -----------
+    source - Path to the workbook or binary file-like object with its contents.
+    sheet_name - String. Name of the sheet to read, defaults to the first sheet.
+    columns - List of columns to keep (others are skipped), None to keep all.
+
+    Returns:
+    --------
+    df - DataFrame of the sheet, with the first row as header. Empty cells are null.
+    '''
+    rows = iter_workbook_rows(source, sheet_name)
+    header = next(rows, ())
+    positions = [i for i, name in enumerate(header)
+                 if name not in (None, '') and (columns is None or str(name) in columns)]
+    values = {i: [] for i in positions}
+    for row in rows:
+        for i in positions:
+            value = row[i] if i < len(row) else None
+            values[i].append(None if value == '' else value)
+    return pd.DataFrame({str(header[i]): values[i] for i in positions})
+
+def rewind(source):
+    # file-like sources are read again after their header
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+@timed
+def read_header(source, filename, sheet_name = None):
+    '''
+    Function to read the column names of an uploaded data file, without parsing its rows
+    (only the first rows are read, or the schema of Parquet and Feather files).
+
+    Parameters:
+    -----------
+    source - Path to the file or binary file-like object with its contents (rewound after reading).
+    filename - String. Original name of the file (determines how it is parsed).
+    sheet_name - String. Sheet to read from an Excel file, defaults to the first sheet.
+
+    Returns:
+    --------
+    columns - List of the column names.
+    Raises ValueError if the file type is not supported.
+    '''
+    file_type = get_file_type(filename)
+    try:
+        if file_type == 'csv':
+            return pd.read_csv(source, nrows = 0, encoding = 'utf-8', compression = get_csv_compression(filename)).columns.tolist()
+        elif file_type == 'zip':
+            with zipfile.ZipFile(source) as archive:
+                member = get_zip_member(archive)
+                with archive.open(member) as file:
+                    return read_header(file, member.filename)
+        elif is_workbook(filename):
+            header = next(iter_workbook_rows(source, sheet_name), ())
+            return [str(name) for name in header if name not in (None, '')]
+        elif file_type == 'excel':
+            return pd.read_excel(source, sheet_name = sheet_name or 0, nrows = 0).columns.tolist()
+        elif file_type in ('parquet', 'feather') and pa is None:
+            raise ValueError('reading Parquet and Feather files requires pyarrow')
+        elif file_type == 'parquet':
+            return pa.parquet.read_schema(source).names
+        elif file_type == 'feather':
+            return pa.ipc.open_file(source).schema.names
+    finally:
+        rewind(source)
+    raise ValueError('wrong file type')
+
+@timed
+def read_data(source, filename, sheet_name = None, columns = None):
+    '''
+    Function to read an uploaded data file into a DataFrame, based on the file type given by its name (see `get_file_type`).
+    Reads directly from the bytes, without building a decoded text copy of the file; compressed CSV files (.csv.gz, .csv.zst)
+    and ZIP archives are decompressed as a stream while parsing.
+    Excel workbooks (.xlsx, .xlsm) are streamed; the dashboard always reads them in a background job (see dashboard.start_job).
+    Only `columns` are parsed, text columns as strings (see `TEXT_DTYPES`).
+
+    Parameters:
+    -----------
+    source - Path to the file or binary file-like object with its contents.
+    filename - String. Original name of the file (determines how it is parsed).
+    sheet_name - String. Sheet to read from an Excel file, defaults to the first sheet.
+    columns - List of the columns to read (found with `read_header`), None to read all columns.
+
+    Returns:
+    --------
+    df - DataFrame of the uploaded data.
+    Raises ValueError if the file type is not supported.
+    '''
+    file_type = get_file_type(filename)
+    dtype = {column: dtype for column, dtype in TEXT_DTYPES.items() if columns is None or column in columns}
+    if file_type == 'csv':
+        return pd.read_csv(source, usecols = columns, dtype = dtype, encoding = 'utf-8',
+                           compression = get_csv_compression(filename))
+    elif file_type == 'zip':
+        with zipfile.ZipFile(source) as archive:
+            member = get_zip_member(archive)
+            with archive.open(member) as file:
+                return read_data(file, member.filename, columns = columns)
+    elif is_workbook(filename):
+        return read_workbook(source, sheet_name, columns)
+    elif file_type == 'excel':
+        return pd.read_excel(source, sheet_name = sheet_name or 0, usecols = columns, dtype = dtype)
+    elif file_type == 'parquet':
+        return pd.read_parquet(source, columns = columns)
+    elif file_type == 'feather':
+        return pd.read_feather(source, columns = columns)
+    raise ValueError('wrong file type')
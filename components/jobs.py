@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import uuid
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from components.metrics import save_metrics
+from components.store import make_private_dir
+
+# Local job queue running upload processing in a pool of processes, so the web workers stay free.
+# The state of each job (stage reached, result) is kept in a file of JOB_DIR, shared by the (gunicorn) workers,
+# so the browser can poll any worker for the progress of a job and cancel it.
+# A job is cancelled at its next stage once its cancel file exists.
+# JOB_DIR is only used if the server's user alone can access it, so other users can't read the results or plant states.
+
+JOB_DIR = os.environ.get('DASHBOARD_JOB_DIR', os.path.join(tempfile.gettempdir(), 'dashboard-jobs'))
+JOB_WORKERS = int(os.environ.get('DASHBOARD_JOB_WORKERS', 2)) # processes per web worker
+JOB_TTL = 24 * 60 * 60 # seconds job states are kept
+# Stages of upload processing, in order (reported with `report_progress`)
+STAGES = ['decode', 'validate', 'parse', 'locality', 'index', 'save']
+
+_executor = None
+_current_job = None # (ID, state directory) of the job running in this process
+
+class JobCancelled(BaseException):
+    '''
+    Raised in a job when it was cancelled.
+    Not an Exception, so the error handling of the processing (`except Exception`) doesn't stop it.
+    '''
+
+def get_job_path(job_id, extension = 'json', job_dir = None):
+    return os.path.join(job_dir or JOB_DIR, f'{job_id}.{extension}')
+
+def write_state(job_id, state, job_dir = None):
+    # write to a temporary file first so a poll never reads a partial state
+    job_dir = job_dir or JOB_DIR
+    make_private_dir(job_dir)
+    fd, tmp_path = tempfile.mkstemp(dir = job_dir, suffix = '.tmp')
+    with os.fdopen(fd, 'w') as file:
+        json.dump(dict(state, updated_at = time.time()), file)
+    os.replace(tmp_path, get_job_path(job_id, job_dir = job_dir))
+
+def get_job(job_id, job_dir = None):
+    '''
+    Function to get the state of a job.
+
+    Parameters:
+    -----------
+    job_id - String. ID of the job (from `submit_job`).
+    job_dir - Directory of the job states, defaults to `JOB_DIR`.
+
+    Returns:
+    --------
+    state - Dictionary with 'status' ('queued', 'running', 'done', 'failed', or 'cancelled'), current 'stage',
+            'progress' (fraction of `STAGES` done), 'result' of the job once done, and 'error' message if failed.
+            None if there is no such job.
+    '''
+    if not isinstance(job_id, str) or not job_id.isalnum():
+        return None
+    try:
+        # states planted in a directory of another user are not read
+        make_private_dir(job_dir or JOB_DIR)
+        with open(get_job_path(job_id, job_dir = job_dir)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def cancel_job(job_id, job_dir = None):
+    '''
+    Function to request a job to stop, which it does at its next stage.
+    '''
+    if get_job(job_id, job_dir) is None:
+        return
+    with open(get_job_path(job_id, 'cancel', job_dir), 'w'):
+        pass
+
+def in_job():
+    '''
+    Function to check whether the code is running in a job.
+    '''
+    return _current_job is not None
+
+def report_progress(stage):
+    '''
+    Function to record the stage (one of `STAGES`) a running job has reached.
+    Raises JobCancelled if the job was cancelled. Does nothing outside of a job.
+    '''
+    if _current_job is None:
+        return
+    job_id, job_dir = _current_job
+    if os.path.exists(get_job_path(job_id, 'cancel', job_dir)):
+        raise JobCancelled()
+    write_state(job_id, {'status': 'running', 'stage': stage, 'progress': STAGES.index(stage) / len(STAGES)}, job_dir)
+
+def run_job(job_id, job_dir, func, args):
+    '''
+    Function running a job in a pool process, recording its state.
+    '''
+    global _current_job
+    _current_job = job_id, job_dir
+    try:
+        report_progress(STAGES[0])
+        result = func(*args)
+        state = {'status': 'done', 'stage': STAGES[-1], 'progress': 1, 'result': result}
+    except JobCancelled:
+        state = {'status': 'cancelled'}
+    except Exception as e:
+        traceback.print_exc()
+        state = {'status': 'failed', 'error': str(e)}
+    finally:
+        _current_job = None
+    write_state(job_id, state, job_dir)
+    # stage metrics of the job, reported with the web workers' if DASHBOARD_METRICS_DIR is set
+    save_metrics(force = True)
+
+def init_job_process():
+    # Datasets processed in the pool are passed to the web workers through the store's directory,
+    # keeping them in the pool processes' memory would only duplicate them
+    from components.store import dataset_store
+    from components.catalog import catalog_store
+    for store in (dataset_store, catalog_store):
+        store.memory.max_items = 0
+        store.memory.clear()
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers = JOB_WORKERS, initializer = init_job_process)
+    return _executor
+
+def submit_job(func, *args, job_dir = None):
+    '''
+    Function to run `func(*args)` as a job in the process pool.
+
+    Parameters:
+    -----------
+    func - Function to run, its return value (JSON-serializable) is saved as the job result.
+           It reports its progress with `report_progress`.
+    args - Arguments of `func`.
+    job_dir - Directory of the job states, defaults to `JOB_DIR`.
+
+    Returns:
+    --------
+    job_id - String. ID of the job, to follow it with `get_job`.
+    '''
+    job_dir = job_dir or JOB_DIR
+    prune_jobs(job_dir)
+    job_id = uuid.uuid4().hex
+    write_state(job_id, {'status': 'queued', 'stage': None, 'progress': 0}, job_dir)
+    get_executor().submit(run_job, job_id, job_dir, func, args)
+    return job_id
+
+def prune_jobs(job_dir = None):
+    '''
+    Function to remove the files of jobs older than `JOB_TTL`.
+    '''
+    job_dir = job_dir or JOB_DIR
+    try:
+        entries = list(os.scandir(job_dir))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if time.time() - entry.stat().st_mtime > JOB_TTL:
+                os.remove(entry.path)
+        except OSError:
+            continue
@@ -0,0 +1,266 @@
+import os
+import sys
+import copy
+import json
+import glob
+import time
+import bisect
+import tempfile
+import threading
+import functools
+from contextlib import contextmanager
+from flask import Blueprint, Response, request, g, has_request_context
+from dash.exceptions import PreventUpdate
+
+# Instrumentation of the dashboard: latency, payload size and errors of each Dash callback request,
+# and duration of the processing stages within them (functions decorated with `timed`).
+# Metrics are served in the Prometheus text format on '/metrics'.
+#
+# Each (gunicorn) worker process records its own metrics. When DASHBOARD_METRICS_DIR is set,
+# workers save them there (at most every SAVE_INTERVAL seconds) and '/metrics' reports the sum over all workers;
+# empty this directory when the server is restarted.
+# When DASHBOARD_TIMING_LOG is set (a file path, or '-' for stderr), each callback request is also logged
+# as a line of JSON with its stage timings.
+
+METRICS_DIR = os.environ.get('DASHBOARD_METRICS_DIR')
+TIMING_LOG = os.environ.get('DASHBOARD_TIMING_LOG')
+SAVE_INTERVAL = 5
+CALLBACK_PATH = '/_dash-update-component'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = tuple(4**i for i in range(4, 16)) # 256 B to 1 GiB
+
+# name -> (type, help, buckets of histograms)
+METRICS = {
+    'dashboard_callback_duration_seconds': ('histogram', 'Latency of Dash callback requests.', LATENCY_BUCKETS),
+    'dashboard_callback_request_bytes': ('histogram', 'Size of Dash callback request bodies.', SIZE_BUCKETS),
+    'dashboard_callback_response_bytes': ('histogram', 'Size of Dash callback responses.', SIZE_BUCKETS),
+    'dashboard_callback_errors_total': ('counter', 'Dash callback requests answered with an error status.', None),
+    'dashboard_stage_duration_seconds': ('histogram', 'Duration of processing stages.', LATENCY_BUCKETS),
+    'dashboard_stage_errors_total': ('counter', 'Processing stages that raised an exception.', None)
+}
+
+class MetricsRegistry:
+    '''
+    Thread-safe store of the counters and histograms in `METRICS`, by metric name and labels.
+    A counter's value is a number, a histogram's is a list of [count per bucket (last for +Inf), sum, count].
+    '''
+    def __init__(self):
+        self._values = {name: {} for name in METRICS}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels, amount = 1):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[name][key] = self._values[name].get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            entry = self._values[name].get(key)
+            if entry is None:
+                entry = self._values[name][key] = [[0] * (len(buckets) + 1), 0, 0]
+            entry[0][bisect.bisect_left(buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self):
+        '''
+        Return the current values as a JSON-serializable dictionary (see `merge_snapshots`).
+        '''
+        with self._lock:
+            return {name: [[list(key), copy.deepcopy(value)] for key, value in values.items()]
+                    for name, values in self._values.items()}
+
+    def clear(self):
+        with self._lock:
+            for values in self._values.values():
+                values.clear()
+
+registry = MetricsRegistry()
+callback_names = {} # Dash callback output ID -> name of the callback function
+_last_save = 0
+_log_lock = threading.Lock()
+
+def merge_snapshots(snapshots):
+    '''
+    Function to sum snapshots of metrics (eg., of several workers).
+
+    Parameters:
+    -----------
+    snapshots - List of dictionaries from `MetricsRegistry.snapshot`.
+
+    Returns:
+    --------
+    values - Dictionary of metric name to dictionary of labels (tuple of (name, value) pairs) to value.
+    '''
+    values = {name: {} for name in METRICS}
+    for snapshot in snapshots:
+        for name, entries in snapshot.items():
+            if name not in values:
+                continue
+            for key, value in entries:
+                key = tuple(tuple(label) for label in key)
+                current = values[name].get(key)
+                if current is None:
+                    values[name][key] = value
+                elif METRICS[name][0] == 'counter':
+                    values[name][key] = current + value
+                else:
+                    values[name][key] = [[a + b for a, b in zip(current[0], value[0])],
+                                         current[1] + value[1], current[2] + value[2]]
+    return values
+
+def format_labels(labels):
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for name, value in labels]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}' if escaped else ''
+
+def format_metrics(values):
+    '''
+    Function to write metric values (from `merge_snapshots`) in the Prometheus text format.
+    '''
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for key, value in sorted(values[name].items()):
+            if metric_type == 'counter':
+                lines.append(f'{name}{format_labels(key)} {value}')
+                continue
+            bucket_counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ['+Inf'], bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{format_labels(key + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(key)} {total}')
+            lines.append(f'{name}_count{format_labels(key)} {count}')
+    return '\n'.join(lines) + '\n'
+
+def get_snapshot_path():
+    return os.path.join(METRICS_DIR, f'metrics-{os.getpid()}.json')
+
+def save_metrics(force = False):
+    '''
+    Function to save this worker's metrics to `METRICS_DIR` (if set), at most every `SAVE_INTERVAL` seconds unless `force`.
+    '''
+    global _last_save
+    if METRICS_DIR is None or (not force and time.monotonic() - _last_save < SAVE_INTERVAL):
+        return
+    _last_save = time.monotonic()
+    os.makedirs(METRICS_DIR, exist_ok = True)
+    # write to a temporary file first so other workers never read a partial file
+    fd, tmp_path = tempfile.mkstemp(dir = METRICS_DIR, suffix = '.tmp')
+    with os.fdopen(fd, 'w') as file:
+        json.dump(registry.snapshot(), file)
+    os.replace(tmp_path, get_snapshot_path())
+
+def collect_metrics():
+    '''
+    Function to collect the metrics of this worker and, if `METRICS_DIR` is set, of the other workers.
+    Returns the metrics in the Prometheus text format.
+    '''
+    snapshots = [registry.snapshot()]
+    if METRICS_DIR is not None:
+        save_metrics(force = True)
+        for path in glob.glob(os.path.join(METRICS_DIR, 'metrics-*.json')):
+            if path == get_snapshot_path():
+                continue
+            try:
+                with open(path) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+    return format_metrics(merge_snapshots(snapshots))
+
+@contextmanager
+def stage_timer(stage):
+    '''
+    Context manager recording the duration (and any exception) of a processing stage.
+    Within a callback request, the duration is also kept for the timing log.
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    except PreventUpdate:
+        raise
+    except Exception:
+        registry.inc('dashboard_stage_errors_total', {'stage': stage})
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe('dashboard_stage_duration_seconds', {'stage': stage}, seconds)
+        if has_request_context() and 'stage_timings' in g:
+            g.stage_timings.append((stage, round(seconds, 6)))
+
+def timed(func):
+    '''
+    Decorator recording each call of `func` as a processing stage named after it (see `stage_timer`).
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with stage_timer(func.__qualname__):
+            return func(*args, **kwargs)
+    return wrapper
+
+def set_callback_names(callback_map):
+    '''
+    Function to name callback requests after their callback function rather than their output ID.
+
+    Parameters:
+    -----------
+    callback_map - Dictionary of output ID to callback information, of the Dash app (`app.callback_map`).
+    '''
+    for output_id, callback in callback_map.items():
+        if callback.get('callback') is not None:
+            callback_names[output_id] = callback['callback'].__name__
+
+def log_timing(record):
+    line = json.dumps(record)
+    with _log_lock:
+        if TIMING_LOG == '-':
+            print(line, file = sys.stderr, flush = True)
+        else:
+            with open(TIMING_LOG, 'a') as file:
+                file.write(line + '\n')
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.before_app_request
+def start_callback_timer():
+    if request.path.endswith(CALLBACK_PATH):
+        g.callback_start = time.perf_counter()
+        g.stage_timings = []
+
+@metrics_bp.after_app_request
+def record_callback(response):
+    start = g.pop('callback_start', None)
+    if start is None:
+        return response
+    seconds = time.perf_counter() - start
+    output_id = (request.get_json(silent = True) or {}).get('output', 'unknown')
+    callback = callback_names.get(output_id, output_id)
+    request_bytes = request.content_length or 0
+    response_bytes = response.calculate_content_length() or 0
+    labels = {'callback': callback}
+    registry.observe('dashboard_callback_duration_seconds', labels, seconds)
+    registry.observe('dashboard_callback_request_bytes', labels, request_bytes)
+    registry.observe('dashboard_callback_response_bytes', labels, response_bytes)
+    if response.status_code >= 400:
+        registry.inc('dashboard_callback_errors_total', dict(labels, status = response.status_code))
+    save_metrics()
+    if TIMING_LOG:
+        log_timing({'time': time.time(),
+                    'pid': os.getpid(),
+                    'callback': callback,
+                    'status': response.status_code,
+                    'seconds': round(seconds, 6),
+                    'request_bytes': request_bytes,
+                    'response_bytes': response_bytes,
+                    'stages': g.pop('stage_timings', [])})
+    return response
+
+@metrics_bp.route('/metrics')
+def metrics():
+    return Response(collect_metrics(), mimetype = 'text/plain; version=0.0.4')
@@ -0,0 +1,139 @@
+from dataclasses import dataclass, field
+from components.query import get_species_options, merge_species_options, LOCALITY_FEATURES
+from components.metrics import timed
+
+# Dataset metadata computed once at upload and saved with the dataset,
+# so layout builders don't rescan the DataFrame.
+
+# Suggested columns, in the order they are checked and kept
+FEATURES = ['Species', 'Subspecies', 'View', 'Sex', 'hybrid_stat', 'lat', 'lon', 'file_url', 'Image_filename']
+# Features offered as filters in the image selection
+FACET_FEATURES = ['Species', 'Subspecies', 'View', 'Sex', 'hybrid_stat']
+
+@dataclass
+class DatasetProfile:
+    '''
+    Summary of a processed dataset.
+
+    Attributes:
+    -----------
+    n_rows - Integer. Number of rows in the dataset.
+    columns - List of columns of the processed DataFrame.
+    mapping - Boolean. True when lat/lon are given in dataset.
+    images - Boolean. True when image urls are given in dataset.
+    facets - Dictionary of each feature in `FACET_FEATURES` to its distinct values (in order of first appearance).
+    all_species - Dictionary of all potential species options and their subspecies (see `get_species_options`).
+    null_counts - Dictionary of feature to number of null values in the uploaded data.
+    unknown_counts - Dictionary of feature to number of 'unknown' values in the processed data (nulls included).
+    '''
+    n_rows: int
+    columns: list
+    mapping: bool
+    images: bool
+    facets: dict = field(default_factory = dict)
+    all_species: dict = field(default_factory = dict)
+    null_counts: dict = field(default_factory = dict)
+    unknown_counts: dict = field(default_factory = dict)
+
+def check_features(columns):
+    '''
+    Function to check the uploaded columns for the suggested features.
+    If no lat/lon, there is no map view; if no image urls, there are no sample image options.
+
+    Parameters:
+    -----------
+    columns - List of columns of the uploaded data.
+
+    Returns:
+    --------
+    included_features - List of suggested features included in `columns`.
+    mapping - Boolean. True when lat/lon are included.
+    images - Boolean. True when image urls are included.
+    missing - String. Required feature that is missing, None if all required features are included.
+    '''
+    columns = set(columns)
+    mapping = True
+    images = True
+    included_features = []
+    for feature in FEATURES:
+        if feature not in columns:
+            if feature == 'lat' or feature == 'lon':
+                mapping = False
+            elif feature == 'file_url':
+                images = False
+            elif feature == 'Image_filename':
+                # If 'Image_filename' missing, return missing column if 'file_url' is included.
+                if images:
+                    return included_features, mapping, images, feature
+            else:
+                return included_features, mapping, images, feature
+        else:
+            included_features.append(feature)
+    return included_features, mapping, images, None
+
+@timed
+def get_profile(df, mapping, images, null_counts = None):
+    '''
+    Function to compute the profile of a processed dataset.
+
+    Parameters:
+    -----------
+    df - Processed DataFrame (from `get_data`).
+    mapping - Boolean. True when lat/lon are given in dataset.
+    images - Boolean. True when image urls are given in dataset.
+    null_counts - Dictionary of feature to number of null values in the uploaded data, if known.
+
+    Returns:
+    --------
+    profile - DatasetProfile of `df`.
+    '''
+    facets = {feature: list(df[feature].unique()) for feature in FACET_FEATURES if feature in df.columns}
+    unknown_counts = {}
+    for feature in df.columns:
+        if df[feature].dtype == 'category' or df[feature].dtype == object:
+            unknown_counts[feature] = int((df[feature] == 'unknown').sum())
+    return DatasetProfile(n_rows = len(df),
+                          columns = list(df.columns),
+                          mapping = mapping,
+                          images = images,
+                          facets = facets,
+                          all_species = get_species_options(df) if 'Species' in df.columns else {},
+                          null_counts = dict(null_counts or {}),
+                          unknown_counts = unknown_counts)
+
+@timed
+def update_profile(profile, df, new_df, null_counts = None):
+    '''
+    Function to update the profile of a processed dataset with appended rows, from the new rows only
+    (and the locality aggregates, updated for the whole dataset by `append_data`).
+
+    Parameters:
+    -----------
+    profile - DatasetProfile of the dataset before the new rows.
+    df - Processed DataFrame with the new rows (from `append_data`).
+    new_df - Processed DataFrame of the new rows.
+    null_counts - Dictionary of feature to number of null values in the new rows.
+
+    Returns:
+    --------
+    profile - DatasetProfile of `df`.
+    '''
+    new_profile = get_profile(new_df, profile.mapping, profile.images, null_counts)
+    facets = {}
+    for feature, values in profile.facets.items():
+        known = set(values)
+        facets[feature] = values + [value for value in new_profile.facets.get(feature, []) if value not in known]
+    unknown_counts = {feature: count + new_profile.unknown_counts.get(feature, 0)
+                      for feature, count in profile.unknown_counts.items()}
+    for feature in LOCALITY_FEATURES:
+        if feature in unknown_counts:
+            unknown_counts[feature] = int((df[feature] == 'unknown').sum())
+    null_counts = {feature: count + new_profile.null_counts.get(feature, 0) for feature, count in profile.null_counts.items()}
+    return DatasetProfile(n_rows = len(df),
+                          columns = list(df.columns),
+                          mapping = profile.mapping,
+                          images = profile.images,
+                          facets = facets,
+                          all_species = merge_species_options(profile.all_species, new_profile.all_species),
+                          null_counts = null_counts,
+                          unknown_counts = unknown_counts)
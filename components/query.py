@@ -1,16 +1,30 @@
 import numpy as np
+import pandas as pd
 from dash import html
+from components.index import build_index
+from components.sampling import sample_images
+from components.metrics import timed
+from components.thumbnails import get_thumbnail_url
 
 # Helper functions for Dashboard
 
 PRINT_STYLE = {"color": "MidnightBlue"}
+# Processed columns with few distinct values, stored as pandas categoricals
+CATEGORICAL_FEATURES = ['Species', 'Subspecies', 'View', 'Sex', 'hybrid_stat', 'locality',
+                        'lat-lon', 'Species_at_locality', 'Subspecies_at_locality']
+# Processed columns stored as numbers ('unknown' becomes NaN, 'lat-lon' keeps 'unknown')
+NUMERIC_FEATURES = ['lat', 'lon']
+# Processed columns aggregated over the rows at each lat-lon
+LOCALITY_FEATURES = ['Samples_at_locality', 'Species_at_locality', 'Subspecies_at_locality']
 
+@timed
 def get_data(df, mapping, features):
     '''
     Function to read in DataFrame and perform required manipulations: 
         - fill null values in required columns with 'unknown'
         - add 'lat-lon', `Samples_at_locality`, 'Species_at_locality', and 'Subspecies_at_locality' columns.
         - make list of categorical columns.
+        - store categorical features as pandas categoricals and lat/lon as numbers (see `get_compact_df`).
 
     Parameters:
     -----------
@@ -43,18 +57,15 @@ def get_data(df, mapping, features):
     if not mapping:
         if 'locality' not in df.columns:
             df['locality'] = 'unknown'
-        return df[features], cat_list      
+        return get_compact_df(df[features]), cat_list      
     
     # else lat and lon are in dataset, so process locality information
     df['lat-lon'] = df['lat'].astype(str) + '|' + df['lon'].astype(str)
     df["Samples_at_locality"] = df['lat-lon'].map(df['lat-lon'].value_counts()) # will duplicate if multiple views of same sample
 
-    # Count and record number of species and subspecies at each lat-lon
-    for lat_lon in df['lat-lon']:
-        species_list = ['{}'.format(i) for i in df.loc[df['lat-lon'] == lat_lon]['Species'].unique()]
-        subspecies_list = ['{}'.format(i) for i in df.loc[df['lat-lon'] == lat_lon]['Subspecies'].unique()]
-        df.loc[df['lat-lon'] == lat_lon, "Species_at_locality"] = ", ".join(species_list)
-        df.loc[df['lat-lon'] == lat_lon, "Subspecies_at_locality"] = ", ".join(subspecies_list)
+    # Record species and subspecies at each lat-lon
+    df["Species_at_locality"] = get_values_at_locality(df, 'Species')
+    df["Subspecies_at_locality"] = get_values_at_locality(df, 'Subspecies')
 
     if 'locality' not in df.columns:
         df['locality'] = df['lat-lon'] # contains "unknown" if lat or lon null
@@ -63,11 +74,108 @@ def get_data(df, mapping, features):
     for feature in new_features:
         features.append(feature)
 
-    return df[features], cat_list
+    return get_compact_df(df[features]), cat_list
 
+def get_compact_df(df):
+    '''
+    Function to convert processed DataFrame columns to compact types: categorical features (`CATEGORICAL_FEATURES`) to
+    pandas categoricals and lat/lon to floats, with NaN for 'unknown'. Other columns are unchanged.
+
+    Parameters:
+    -----------
+    df - Processed DataFrame (null values filled with 'unknown').
+
+    Returns:
+    --------
+    df - DataFrame with the same columns in compact types.
+    '''
+    df = df.copy()
+    for feature in df.columns:
+        if feature in CATEGORICAL_FEATURES:
+            df[feature] = df[feature].astype('category')
+        elif feature in NUMERIC_FEATURES:
+            df[feature] = pd.to_numeric(df[feature], errors = 'coerce')
+    return df
+
+def get_values_at_locality(df, column):
+    '''
+    Function to list the distinct values of a column found at each lat-lon pair, in order of first appearance.
+
+    Parameters:
+    -----------
+    df - DataFrame with 'lat-lon' column.
+    column - String. Column to collect values from (eg., 'Species' or 'Subspecies').
+
+    Returns:
+    --------
+    values_at_locality - Series aligned with `df` of comma-separated distinct values of `column` at each row's lat-lon.
+    '''
+    # one row per (lat-lon, value), then group values by locality in a single pass
+    # (a dictionary avoids pandas' per-group overhead when most localities are distinct)
+    pairs = df[['lat-lon', column]].drop_duplicates()
+    values_by_locality = {}
+    for lat_lon, value in zip(pairs['lat-lon'].tolist(), pairs[column].astype(str).tolist()):
+        values_by_locality.setdefault(lat_lon, []).append(value)
+    joined = {lat_lon: ", ".join(values) for lat_lon, values in values_by_locality.items()}
+    return df['lat-lon'].map(joined)
+
+def concat_compact(df, new_df):
+    '''
+    Function to append the rows of `new_df` to `df` (processed DataFrames with the same columns), keeping compact types:
+    categories of `new_df` are added after those of `df`, so the codes of `df` are unchanged.
+    '''
+    columns = {}
+    for feature in df.columns:
+        if df[feature].dtype == 'category' and new_df[feature].dtype == 'category':
+            columns[feature] = pd.api.types.union_categoricals([df[feature], new_df[feature]])
+        else:
+            columns[feature] = pd.concat([df[feature], new_df[feature]], ignore_index = True)
+    return pd.DataFrame(columns)
+
+@timed
+def append_data(df, new_df):
+    '''
+    Function to append newly uploaded rows to a processed DataFrame, updating the locality aggregates in place:
+    only the rows at the lat-lon pairs of the new rows are aggregated again.
+
+    Parameters:
+    -----------
+    df - Processed DataFrame (from `get_data`).
+    new_df - New rows, processed with `get_data` on their own (same features as `df`).
+
+    Returns:
+    --------
+    df - Processed DataFrame of all rows, `df` rows first.
+    '''
+    n_rows = len(df)
+    combined = concat_compact(df, new_df)
+    if 'lat-lon' not in combined.columns:
+        return combined
+    # all rows at the new rows' localities, old rows first (order of first appearance is kept)
+    affected = combined['lat-lon'].iloc[:n_rows].isin(set(new_df['lat-lon'].tolist())).to_numpy()
+    positions = np.concatenate([np.flatnonzero(affected), np.arange(n_rows, len(combined))])
+    rows = combined.iloc[positions]
+    lat_lon = rows['lat-lon'].astype(object)
+    values = {'Samples_at_locality': lat_lon.map(lat_lon.value_counts()).to_numpy(),
+              'Species_at_locality': get_values_at_locality(rows, 'Species').to_numpy(),
+              'Subspecies_at_locality': get_values_at_locality(rows, 'Subspecies').to_numpy()}
+    for feature, feature_values in values.items():
+        column = combined[feature]
+        if column.dtype == 'category':
+            column = column.cat.add_categories(pd.Index(feature_values).unique().difference(column.cat.categories))
+            column.iloc[positions] = feature_values
+            column = column.cat.remove_unused_categories()
+        else:
+            column = column.copy()
+            column.iloc[positions] = feature_values
+        combined[feature] = column
+    return combined
+
+@timed
 def get_species_options(df):
     '''
-    Function to pull in DataFrame and produce a dictionary of species options (Melpomene, Erato, and Any)
+    Function to pull in DataFrame and produce a dictionary of species options (Melpomene, Erato, and Any).
+    Uses one pass over the distinct (Species, Subspecies) pairs.
 
     Parameters:
     -----------
@@ -78,20 +186,39 @@ def get_species_options(df):
     all_species - Dictionary of all potential species options and their subspecies.
 
     '''
-    species_list = list(df.Species.unique())
+    pairs = df[['Species', 'Subspecies']].drop_duplicates()
+    subspecies_by_species = {}
+    all_subspecies = {} # insertion-ordered set
+    for species, subspecies in zip(pairs['Species'].tolist(), pairs['Subspecies'].tolist()):
+        subspecies_by_species.setdefault(species, []).append(subspecies)
+        all_subspecies.setdefault(subspecies, None)
     all_species = {}
-    for species in species_list:
-        subspecies_list = df.loc[df.Species == species, 'Subspecies'].unique()
-        subspecies_list = np.insert(subspecies_list, 0 , 'Any-' + species.capitalize())
-        all_species[species.capitalize()] = list(subspecies_list)
-    all_subspecies = np.insert(df.Subspecies.unique(), 0, 'Any')
-    all_species['Any'] = list(all_subspecies)
+    for species, subspecies_list in subspecies_by_species.items():
+        all_species[species.capitalize()] = ['Any-' + species.capitalize()] + subspecies_list
+    all_species['Any'] = ['Any'] + list(all_subspecies)
     
     return all_species
 
+def merge_species_options(all_species, new_species):
+    '''
+    Function to add the species options of new rows (`get_species_options` of them) to those of a dataset,
+    keeping the order of first appearance ('Any' last).
+    '''
+    merged = {species: list(subspecies_list) for species, subspecies_list in all_species.items() if species != 'Any'}
+    any_subspecies = list(all_species.get('Any', ['Any']))
+    for species, subspecies_list in new_species.items():
+        if species == 'Any':
+            any_subspecies += [subspecies for subspecies in subspecies_list if subspecies not in any_subspecies]
+            continue
+        merged_list = merged.setdefault(species, subspecies_list[:1])
+        merged_list += [subspecies for subspecies in subspecies_list[1:] if subspecies not in merged_list]
+    merged['Any'] = any_subspecies
+    return merged
+
 # Retrieve selected number of images
 
-def get_images(df, subspecies, view, sex, hybrid, num_images):
+@timed
+def get_images(df, subspecies, view, sex, hybrid, num_images, index = None, find_broken = None, seed = None, stratify = False):
     '''
     Function to retrieve the user-selected number of images.
 
@@ -103,33 +230,53 @@ def get_images(df, subspecies, view, sex, hybrid, num_images):
     sex - String. Sex of specimen selected by the user.
     hybrid - String. Hybrid status of specimen selected by the user.
     num_images - Integer. Number of images requested by the user.
+    index - Inverted index of `df` (from `build_index`), built from `df` if not given.
+    find_broken - Function of a list of image URLs returning the set of those known to be broken, which are not shown.
+    seed - Integer. Seed of the selection, the same seed giving the same images. None for a new selection.
+    stratify - Boolean. If True, spreads the images evenly across the selected subspecies, views, and sexes.
 
     Returns:
     --------
-    Imgs - List of html image elements with `src` element pointing to paths for the requested number of images matching given parameters.
+    Imgs - List of html image elements with `src` element pointing to thumbnails (see `get_thumbnail_url`) of the requested number of images matching given parameters.
            Returns html header4 "No Such Images. Please make another selection." if no images matching parameters exist.
            Returns html header4 indicating number of matching entries without filename or filepath.
+           Starts with an html header4 noting it if fewer images than requested and available are shown, as some had broken links.
     '''
     try:
-        filenames, filepaths = get_filenames(df, subspecies, view, sex, hybrid, num_images)
+        filenames, filepaths, limited = get_filenames(df, subspecies, view, sex, hybrid, num_images, index, find_broken, seed, stratify)
     except ValueError as e:
         return html.H4(str(e) + " Please make another selection.", 
                     style = PRINT_STYLE)
     Imgs = []
+    if limited:
+        Imgs.append(html.H4(f"Showing {len(filenames)} image(s): the others drawn have broken links.",
+                            style = PRINT_STYLE))
     for i in range(len(filenames)):
-        if filenames[i] in filepaths[i]:
-            image_path = filepaths[i]
-        else:
-            if filepaths[i][-1] == '/':
-                image_path = filepaths[i] + filenames[i]
-            else:
-                image_path = filepaths[i] + '/' + filenames[i]
-        Imgs.append(html.Img(src = image_path))
+        Imgs.append(html.Img(src = get_thumbnail_url(get_image_path(filenames[i], filepaths[i]))))
     return Imgs
 
-def get_filenames(df, subspecies, view, sex, hybrid, num_images):
+def get_image_path(filename, filepath):
+    '''
+    Function to get the URL of an image from its filename and filepath (URL of the image or of its folder).
+    '''
+    if filename in filepath:
+        return filepath
+    elif filepath[-1] == '/':
+        return filepath + filename
+    else:
+        return filepath + '/' + filename
+
+def get_image_paths(df, ids):
     '''
-    Funtion to randomly select the given number of filenames for images adhering to specified filters.
+    Function to get the URLs of the images at the given row positions of `df` (see `get_image_path`).
+    '''
+    rows = df.iloc[ids]
+    return [get_image_path(filename, filepath) for filename, filepath in
+            zip(rows.Image_filename.astype(str).tolist(), rows.file_url.astype(str).tolist())]
+
+def get_filenames(df, subspecies, view, sex, hybrid, num_images, index = None, find_broken = None, seed = None, stratify = False):
+    '''
+    Funtion to randomly select the given number of filenames for images adhering to specified filters (see components/sampling.py).
     Raises ValueError indicating no such images if none match the user selections.
     
     Parameters:
@@ -140,42 +287,47 @@ def get_filenames(df, subspecies, view, sex, hybrid, num_images):
     sex - String. Sex of specimen selected by the user.
     hybrid - String. Hybrid status of specimen selected by the user.
     num_images - Integer. Number of images requested by the user. Defaults to 1 if no selection.
+    index - Inverted index of `df` (from `build_index`), built from `df` if not given.
+    find_broken - Function of a list of image URLs returning the set of those known to be broken, which are not selected.
+                  Only called on the candidate images drawn.
+    seed - Integer. Seed of the selection, the same seed giving the same images. None for a new selection.
+    stratify - Boolean. If True, spreads the images evenly across the selected subspecies, views, and sexes.
 
     Returns:
     --------
     filenames - List of filenames meeting specified conditions (the lesser of the requested amount or number available). 
     filepaths - List of filepaths (URLs) corresponding to the selected filenames. 
+    limited - Boolean. True if fewer images than requested and available were selected, as candidates drawn had broken links
+              (the number of candidates checked is bounded, see `sample_arrays`).
     
     '''
+    if index is None or index.get('groups') is None:
+        # datasets indexed before the groups were added
+        index = build_index(df)
+    filters = {'View': view, 'Sex': sex, 'hybrid_stat': hybrid}
     if 'Any' in subspecies and type(subspecies) == str:
-        if subspecies == 'Any':
-            df_sub = df.copy()
-        else:
-            species = subspecies.split('-')[1].lower()
-            df_sub = df.loc[df.Species == species].copy()
+        if subspecies != 'Any':
+            filters['Species'] = [subspecies.split('-')[1].lower()]
     else:
-        df_sub = df.loc[df.Subspecies.isin(subspecies)].copy()
-    df_sub = df_sub.loc[df_sub.View.isin(view)]
-    df_sub = df_sub.loc[df_sub.Sex.isin(sex)]
-    df_sub = df_sub.loc[df_sub.hybrid_stat.isin(hybrid)]
-
-    num_entries = len(df_sub)
-    # Filter out any entries that have missing filenames or URLs:
-    df_sub = df_sub.loc[df_sub.Image_filename != 'unknown']
-    df_sub = df_sub.loc[df_sub.file_url != 'unknown']
-    max_imgs = len(df_sub)
-    missing_vals = num_entries - max_imgs
-    if max_imgs > 0:
-        if num_images == None:
-            num = 1
-        else:
-            num = min(num_images, max_imgs)
-        df_filtered = df_sub.sample(num)
+        filters['Subspecies'] = subspecies
+    num = 1 if num_images == None else num_images
+    # Entries with missing filenames or URLs are not candidates (counted in `missing_vals`)
+    accept = None
+    if find_broken is not None:
+        def accept(ids):
+            paths = get_image_paths(df, ids)
+            broken = find_broken(paths)
+            return np.array([path not in broken for path in paths], dtype = bool)
+    selected_ids, max_imgs, missing_vals = sample_images(index, filters, num, seed, stratify, accept)
+    if len(selected_ids) > 0:
+        df_filtered = df.iloc[selected_ids]
         filenames = df_filtered.Image_filename.astype('string').values
         filepaths = df_filtered.file_url.astype('string').values
         #return list of filenames for min(user-selected, available) images randomly selected images from the filtered dataset
-        return list(filenames), list(filepaths)
-    # If there aren't any images to display, check if there are no such entries or just missing information.
+        return list(filenames), list(filepaths), len(selected_ids) < min(num, max_imgs)
+    # If there aren't any images to display, check if there are no such entries, just missing information, or broken links.
+    elif max_imgs > 0:
+        raise ValueError("No Such Images. Broken image link(s).")
     elif missing_vals == 0:
         raise ValueError("No Such Images.")
     else:
@@ -0,0 +1,118 @@
+import numpy as np
+from components.index import INDEX_FEATURES
+from components.metrics import timed
+
+# Sampling of the sample images from the groups of the inverted index (see build_index): the rows with images
+# of each combination of filter values. Images are drawn from the groups matching the filters, in O(k) for k images
+# (plus the number of groups), without listing the matching rows, and the entries without filename or URL
+# are counted from the groups. The same seed gives the same images for the same selection.
+# Stratified sampling spreads the images evenly across the selected subspecies, views, and sexes.
+
+STRATA = ['Subspecies', 'View', 'Sex']
+# Bounds on the candidates checked when some are rejected (eg., broken URLs), keeping a draw O(k):
+# at most MAX_ROUNDS batches of at most MAX_BATCH_FACTOR * k candidates
+MAX_ROUNDS = 4
+MAX_BATCH_FACTOR = 8
+
+def select_groups(index, filters):
+    '''
+    Function to get the keys of the index groups matching all filters: for each feature, any of the selected values.
+    '''
+    positions = [(INDEX_FEATURES.index(feature), set(values)) for feature, values in filters.items()]
+    return [key for key in index['groups'] if all(key[i] in values for i, values in positions)]
+
+def draw_ids(arrays, num, rng):
+    '''
+    Function to draw `num` row positions, without replacement and in random order, from the union of the disjoint `arrays`.
+    Positions in the union are mapped to their array, so the union isn't built.
+    '''
+    sizes = np.array([len(ids) for ids in arrays], dtype = np.int64)
+    ends = np.cumsum(sizes)
+    positions = rng.choice(int(ends[-1]), num, replace = False) if len(ends) else np.array([], dtype = np.int64)
+    which = np.searchsorted(ends, positions, side = 'right')
+    return np.array([arrays[a][p - ends[a] + sizes[a]] for a, p in zip(which, positions)], dtype = np.int64)
+
+def sample_arrays(arrays, num, rng, accept = None):
+    '''
+    Function to draw up to `num` row positions from the union of the disjoint `arrays`, keeping those accepted.
+
+    Parameters:
+    -----------
+    arrays - List of arrays of row positions.
+    num - Integer. Number of row positions to draw.
+    rng - numpy Generator drawing them.
+    accept - Function of an array of row positions returning which to keep (boolean array), None to keep all.
+             Candidates are drawn in batches of increasing size until enough are accepted, for at most `MAX_ROUNDS`
+             batches of at most `MAX_BATCH_FACTOR` * `num` candidates.
+
+    Returns:
+    --------
+    ids - Array of the row positions drawn, in random order. Fewer than `num` (and than available) if too many
+          candidates were rejected.
+    '''
+    total = sum(len(ids) for ids in arrays)
+    if accept is None or total == 0:
+        return draw_ids(arrays, min(num, total), rng)
+    selected, seen = [], set()
+    size = 2 * num
+    for _ in range(MAX_ROUNDS):
+        if len(selected) >= num or len(seen) >= total:
+            break
+        batch = np.array([i for i in draw_ids(arrays, min(size, total), rng) if i not in seen], dtype = np.int64)
+        seen.update(batch.tolist())
+        selected.extend(batch[accept(batch)].tolist())
+        size = min(2 * size, MAX_BATCH_FACTOR * num)
+    return np.array(selected[:num], dtype = np.int64)
+
+def allocate(sizes, num, rng):
+    '''
+    Function to split `num` draws as evenly as possible across strata of the given sizes, none getting more than its size.
+    Smaller strata are filled first, the remainder going to the larger ones (in random order among equal sizes).
+    '''
+    sizes = np.asarray(sizes, dtype = np.int64)
+    counts = np.zeros(len(sizes), dtype = np.int64)
+    remaining = min(num, int(sizes.sum()))
+    order = np.lexsort((rng.random(len(sizes)), sizes))
+    for i, stratum in enumerate(order):
+        counts[stratum] = min(sizes[stratum], remaining // (len(order) - i))
+        remaining -= counts[stratum]
+    return counts
+
+@timed
+def sample_images(index, filters, num, seed = None, stratify = False, accept = None):
+    '''
+    Function to randomly select row positions of entries with images matching the filters.
+
+    Parameters:
+    -----------
+    index - Inverted index with its groups (from `build_index`).
+    filters - Dictionary of feature (of `INDEX_FEATURES`) to list of selected values.
+    num - Integer. Number of images requested.
+    seed - Integer. Seed of the selection, the same seed giving the same images for the same filters. None for a new selection.
+    stratify - Boolean. If True, spreads the images evenly across the combinations of `STRATA` values matching the filters.
+    accept - Function of an array of row positions returning which can be shown (boolean array), eg. to skip broken URLs.
+
+    Returns:
+    --------
+    ids - Array of the selected row positions (the lesser of `num` or the number available), in random order.
+          Fewer if most candidates drawn were not accepted (see `sample_arrays`).
+    n_candidates - Integer. Number of entries with images matching the filters.
+    n_skipped - Integer. Number of entries matching the filters without filename or URL.
+    '''
+    rng = np.random.default_rng(seed)
+    keys = select_groups(index, filters)
+    n_candidates = sum(len(index['groups'][key]) for key in keys)
+    n_skipped = sum(index['missing'][key] for key in keys)
+    if not stratify:
+        return sample_arrays([index['groups'][key] for key in keys], num, rng, accept), n_candidates, n_skipped
+
+    # groups of each stratum, in a fixed order so a seed gives the same images
+    strata = {}
+    positions = [INDEX_FEATURES.index(feature) for feature in STRATA]
+    for key in sorted(keys, key = str):
+        strata.setdefault(tuple(key[i] for i in positions), []).append(index['groups'][key])
+    strata = list(strata.values())
+    counts = allocate([sum(len(ids) for ids in arrays) for arrays in strata], num, rng)
+    ids = [sample_arrays(arrays, count, rng, accept) for arrays, count in zip(strata, counts) if count > 0]
+    ids = rng.permutation(np.concatenate(ids)) if ids else np.array([], dtype = np.int64)
+    return ids, n_candidates, n_skipped
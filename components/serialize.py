@@ -0,0 +1,80 @@
+import io
+import os
+import pandas as pd
+from components.metrics import timed
+
+# Serialization of processed DataFrames for storage outside the worker's memory.
+# Arrow IPC and Parquet keep dtypes and decode much faster than JSON, but require pyarrow
+# and columns of a single type; JSON is used when those are not available.
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+DEFAULT_FORMAT = os.environ.get('DASHBOARD_SERIALIZER', 'arrow')
+
+def to_arrow(df):
+    table = pa.Table.from_pandas(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def from_arrow(data):
+    return pa.ipc.open_file(pa.py_buffer(data)).read_pandas()
+
+def to_parquet(df):
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, engine = 'pyarrow')
+    return buffer.getvalue()
+
+def from_parquet(data):
+    return pd.read_parquet(io.BytesIO(data), engine = 'pyarrow')
+
+def to_json(df):
+    return df.to_json(date_format = 'iso', orient = 'split').encode('utf-8')
+
+def from_json(data):
+    return pd.read_json(io.BytesIO(data), orient = 'split')
+
+# format -> (serialize function, deserialize function)
+SERIALIZERS = {
+    'arrow': (to_arrow, from_arrow),
+    'parquet': (to_parquet, from_parquet),
+    'json': (to_json, from_json)
+}
+
+@timed
+def serialize_df(df, format = None):
+    '''
+    Function to serialize a DataFrame, falling back to JSON if the requested format can't encode it.
+
+    Parameters:
+    -----------
+    df - DataFrame to serialize.
+    format - String. Preferred format: 'arrow', 'parquet', or 'json'. Defaults to DASHBOARD_SERIALIZER ('arrow').
+
+    Returns:
+    --------
+    format - String. Format used to serialize `df`.
+    data - Bytes of the serialized DataFrame.
+    '''
+    format = format or DEFAULT_FORMAT
+    if format not in SERIALIZERS:
+        raise ValueError(f'Unknown serialization format: {format}')
+    if format != 'json' and pa is not None:
+        try:
+            return format, SERIALIZERS[format][0](df)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            # eg., object column mixing numbers and strings
+            pass
+    return 'json', to_json(df)
+
+@timed
+def deserialize_df(format, data):
+    '''
+    Function to read a DataFrame serialized by `serialize_df` in the given format.
+    '''
+    return SERIALIZERS[format][1](data)
@@ -0,0 +1,116 @@
+import os
+import numpy as np
+import pandas as pd
+from components.metrics import timed
+
+# Spatial aggregation of the map markers for large datasets (level of detail).
+# Past MAP_MARKER_LIMIT markers, the map shows square lat/lon grid cells instead: each cell has the number
+# of samples in it and the category with the most samples. The cell size is the finest of GRID_LEVELS
+# giving at most MAX_BINS cells in view, so zooming in (the view is reported by the browser) refines the grid, down to
+# the exact markers once the view holds few enough of them.
+
+MAP_MARKER_LIMIT = int(os.environ.get('DASHBOARD_MAP_MARKER_LIMIT', 5000))
+MAX_BINS = 2000
+GRID_LEVELS = [20, 10, 5, 2, 1, 0.5, 0.2, 0.1, 0.05, 0.02] # cell sizes in degrees, coarse to fine
+
+def get_cell_ids(lat, lon, cell_size):
+    # Index of the grid cell of each point, row-major from (-90, -180)
+    rows = np.floor((np.asarray(lat) + 90) / cell_size).astype(np.int64)
+    cols = np.floor((np.asarray(lon) + 180) / cell_size).astype(np.int64)
+    return rows * int(np.ceil(360 / cell_size) + 1) + cols
+
+def get_cell_size(lat, lon, max_bins = MAX_BINS):
+    '''
+    Function to choose the grid level for points: the finest of `GRID_LEVELS` with at most `max_bins` occupied cells.
+    '''
+    cell_size = GRID_LEVELS[0]
+    for size in GRID_LEVELS:
+        if len(np.unique(get_cell_ids(lat, lon, size))) > max_bins:
+            break
+        cell_size = size
+    return cell_size
+
+@timed
+def bin_markers(markers, color_by, cell_size):
+    '''
+    Function to aggregate map markers (see graphs.get_map_markers) to the cells of a square lat/lon grid.
+
+    Parameters:
+    -----------
+    markers - DataFrame with 'lat', 'lon', 'lat-lon', `color_by`, and 'Samples' (number of specimens) columns.
+    color_by - Selected categorical variable by which to color.
+    cell_size - Number. Width and height of the cells in degrees.
+
+    Returns:
+    --------
+    bins - DataFrame with one row per occupied cell: 'lat' and 'lon' (mean position of its samples),
+           'Samples' (number of samples), 'Localities' (number of distinct lat-lon), `color_by` (value with the most samples),
+           and 'Share' (fraction of the samples with that value).
+    '''
+    weights = markers['Samples'].to_numpy(dtype = float)
+    lat = markers['lat'].to_numpy(dtype = float)
+    lon = markers['lon'].to_numpy(dtype = float)
+    cells, cell_index = np.unique(get_cell_ids(lat, lon, cell_size), return_inverse = True)
+    samples = np.bincount(cell_index, weights = weights)
+
+    # samples of each (cell, value) pair, then the value with the most samples in each cell
+    codes, values = pd.factorize(markers[color_by])
+    pairs, pair_index = np.unique(cell_index * (len(values) + 1) + codes, return_inverse = True)
+    pair_samples = np.bincount(pair_index, weights = weights)
+    pair_cells = pairs // (len(values) + 1)
+    order = np.lexsort((-pair_samples, pair_cells))
+    first = order[np.r_[True, pair_cells[order][1:] != pair_cells[order][:-1]]]
+    dominant = pairs[first] % (len(values) + 1)
+
+    localities = np.unique(cell_index * (len(markers) + 1) + pd.factorize(markers['lat-lon'])[0]) // (len(markers) + 1)
+    return pd.DataFrame({'lat': np.bincount(cell_index, weights = lat * weights) / samples,
+                         'lon': np.bincount(cell_index, weights = lon * weights) / samples,
+                         'Samples': samples.astype(np.int64),
+                         'Localities': np.bincount(localities, minlength = len(cells)),
+                         color_by: np.asarray(values, dtype = object)[dominant],
+                         'Share': np.round(pair_samples[first] / samples, 3)})
+
+def get_viewport(df):
+    '''
+    Function to get the map view fitting the points of `df` (with 'lat' and 'lon').
+
+    Returns:
+    --------
+    viewport - Tuple of center latitude, center longitude, and projection scale (1 shows the whole world).
+    '''
+    lat_span = max(df['lat'].max() - df['lat'].min(), 1)
+    lon_span = max(df['lon'].max() - df['lon'].min(), 1)
+    scale = min(180 / lat_span, 360 / lon_span) * 0.9
+    return clean_viewport({'lat': (df['lat'].max() + df['lat'].min()) / 2,
+                           'lon': (df['lon'].max() + df['lon'].min()) / 2,
+                           'scale': scale})
+
+def clean_viewport(viewport):
+    '''
+    Function to check the map view reported by the browser (dictionary with 'lat', 'lon', and 'scale'),
+    rounded so nearby views share cached figures.
+
+    Returns:
+    --------
+    viewport - Tuple of center latitude, center longitude, and projection scale, None if `viewport` is not a valid view.
+    '''
+    try:
+        lat, lon, scale = (float(viewport[name]) for name in ('lat', 'lon', 'scale'))
+    except (TypeError, KeyError, ValueError):
+        return None
+    if not (np.isfinite(lat) and np.isfinite(lon) and np.isfinite(scale)) or scale <= 0:
+        return None
+    scale = min(max(scale, 1), 10**4)
+    # rounded to a tenth of the view's height
+    step = 18 / scale
+    return (round(round(lat / step) * step, 4), round(round(lon / step) * step, 4), round(scale, 2))
+
+def in_viewport(df, viewport, margin = 0.5):
+    '''
+    Function to select the rows of `df` (with 'lat' and 'lon') in view, with a `margin` (fraction of the view) on each side.
+    '''
+    lat, lon, scale = viewport
+    half_lat = 90 / scale * (1 + margin)
+    half_lon = 180 / scale * (1 + margin)
+    lon_offset = (df['lon'] - lon + 180) % 360 - 180 # wraps around the antimeridian
+    return df[((df['lat'] - lat).abs() <= half_lat) & (lon_offset.abs() <= half_lon)]
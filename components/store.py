@@ -0,0 +1,281 @@
+import os
+import io
+import re
+import json
+import time
+import hashlib
+import tempfile
+import dataclasses
+import numpy as np
+from components.cache import LRUCache
+from components.profile import DatasetProfile
+from components.serialize import serialize_df, deserialize_df
+from components.metrics import timed
+
+# Server-side storage of processed datasets.
+# The browser only holds the dataset key; callbacks resolve it to the parsed DataFrame here.
+# Entries are also written to a shared cache directory so any gunicorn worker can resolve a key:
+# the processed DataFrame through components.serialize (Arrow IPC by default), the index arrays with numpy (.npz),
+# and the rest of the dataset as JSON. Nothing read back can run code (no pickle), and the directory
+# is only used if it belongs to the server's user, who alone can access it.
+
+CACHE_DIR = os.environ.get('DASHBOARD_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'dashboard-cache'))
+MAX_DATASETS = int(os.environ.get('DASHBOARD_MAX_DATASETS', 8))
+MAX_DATASET_BYTES = int(os.environ.get('DASHBOARD_MAX_DATASET_MB', 2048)) * 2**20
+DATASET_TTL = int(os.environ.get('DASHBOARD_DATASET_TTL', 6 * 60 * 60))
+KEY_PATTERN = re.compile(r'[0-9a-f]{64}')
+# Version of the stored dataset layout, persisted datasets of another version are ignored (reprocessed)
+LAYOUT_VERSION = 3
+
+def get_dataset_key(content, filename):
+    '''
+    Function to compute the key of an uploaded dataset from its content and filename.
+
+    Parameters:
+    -----------
+    content - Bytes of the uploaded file.
+    filename - String. Name of the uploaded file (determines how it is parsed).
+
+    Returns:
+    --------
+    key - String. Hex digest identifying the upload.
+    '''
+    digest = hashlib.sha256(content)
+    digest.update(filename.encode('utf-8'))
+    return digest.hexdigest()
+
+def get_file_key(filepath, filename, chunk_size = 2**20):
+    '''
+    Function to compute the key of a dataset uploaded to a file on disk, equal to `get_dataset_key` of its content.
+    Reads the file in chunks so it is never fully held in memory.
+    '''
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    digest.update(filename.encode('utf-8'))
+    return digest.hexdigest()
+
+def get_sheet_key(key, sheet_name):
+    '''
+    Function to compute the key of the dataset read from a given sheet of an uploaded workbook (of key `key`).
+    The first sheet, read by default (`sheet_name` None), keeps the key of the upload.
+    '''
+    if sheet_name is None:
+        return key
+    return hashlib.sha256((key + '/' + sheet_name).encode('utf-8')).hexdigest()
+
+def get_append_key(base_key, key):
+    '''
+    Function to compute the key of the dataset made by appending an upload (of key `key`) to the dataset of key `base_key`.
+    '''
+    return hashlib.sha256((base_key + '+' + key).encode('utf-8')).hexdigest()
+
+def make_private_dir(path):
+    '''
+    Function to create a directory only the server's user can access, unless it exists.
+    Raises PermissionError if the directory belongs to another user (eg., planted in a shared temporary directory).
+    '''
+    os.makedirs(path, mode = 0o700, exist_ok = True)
+    info = os.stat(path)
+    if info.st_uid != os.getuid():
+        raise PermissionError(f'{path} belongs to another user, set its environment variable to a directory of the server')
+    if info.st_mode & 0o077:
+        os.chmod(path, 0o700)
+
+def to_json_value(value):
+    # numpy scalars (eg., counts) in the dataset metadata
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def encode_meta(dataset):
+    '''
+    Function to split the stored part of a dataset, other than its DataFrame, into JSON-serializable metadata
+    and the arrays of its index (see index.build_index).
+    '''
+    meta, arrays = {}, {}
+    for name, value in dataset.items():
+        if name == 'processed_df':
+            continue
+        elif name == 'profile':
+            meta['profile'] = dataclasses.asdict(value)
+        elif name == 'index':
+            groups = value.get('groups')
+            keys = list(groups or {})
+            arrays['images'] = value['images']
+            meta['index'] = {'n_rows': value['n_rows'], 'groups': None}
+            if groups is not None:
+                arrays['group_ids'] = np.concatenate([groups[key] for key in keys] + [np.array([], dtype = np.int32)])
+                meta['index'].update(groups = [list(key) for key in keys],
+                                     group_sizes = [len(groups[key]) for key in keys],
+                                     missing = [value['missing'][key] for key in keys])
+        else:
+            meta[name] = value
+    return meta, arrays
+
+def decode_meta(meta, arrays):
+    '''
+    Function to rebuild the part of a dataset other than its DataFrame from `encode_meta`.
+    '''
+    dataset = dict(meta)
+    if 'profile' in meta:
+        dataset['profile'] = DatasetProfile(**meta['profile'])
+    if 'index' in meta:
+        index = {'n_rows': meta['index']['n_rows'], 'images': arrays['images'], 'groups': None, 'missing': None}
+        if meta['index']['groups'] is not None:
+            keys = [tuple(key) for key in meta['index']['groups']]
+            ids = np.split(arrays['group_ids'], np.cumsum(meta['index']['group_sizes'])[:-1]) if keys else []
+            index['groups'] = dict(zip(keys, ids))
+            index['missing'] = dict(zip(keys, meta['index']['missing']))
+        dataset['index'] = index
+    return dataset
+
+def get_dataset_size(dataset):
+    '''
+    Function to estimate the in-memory size of a stored dataset (bytes), dominated by its processed DataFrame.
+    '''
+    return int(dataset['processed_df'].memory_usage(deep = True).sum())
+
+class DatasetStore:
+    '''
+    Store of processed datasets keyed by content hash.
+    Holds recently used datasets in memory (LRU with TTL and a total size bound) and persists each one
+    to `cache_dir`, so a dataset evicted from memory, or stored by another worker process, can be reloaded.
+
+    Parameters:
+    -----------
+    cache_dir - Path of the directory shared by all workers for persisted datasets, None to keep datasets in memory only.
+    max_items - Integer. Maximum number of datasets held in memory.
+    max_bytes - Integer. Maximum total in-memory size of datasets.
+    ttl - Number of seconds a dataset is kept (in memory and on disk) after it was stored.
+
+    '''
+    def __init__(self, cache_dir = CACHE_DIR, max_items = MAX_DATASETS, max_bytes = MAX_DATASET_BYTES, ttl = DATASET_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.memory = LRUCache(max_items = max_items, max_bytes = max_bytes, ttl = ttl, sizeof = get_dataset_size)
+        self.pinned = {} # datasets held regardless of the memory bounds (see `pin`)
+
+    def _path(self, key, extension = 'json'):
+        return os.path.join(self.cache_dir, key + '.' + extension)
+
+    def _write(self, path, data):
+        # write to a temporary file first so other workers never read a partial file
+        fd, tmp_path = tempfile.mkstemp(dir = self.cache_dir, suffix = '.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def __contains__(self, key):
+        return key in self.pinned or key in self.memory or self._on_disk(key)
+
+    def _on_disk(self, key):
+        # keys come back from the browser, only accept digests as file names
+        if self.cache_dir is None or not KEY_PATTERN.fullmatch(str(key)):
+            return False
+        try:
+            make_private_dir(self.cache_dir)
+            age = time.time() - os.path.getmtime(self._path(key))
+            return self.ttl is None or age <= self.ttl
+        except OSError:
+            return False
+
+    @timed
+    def put(self, key, dataset):
+        '''
+        Store a processed dataset (dictionary with 'processed_df' and its static options) under `key`.
+        The stored dataset records its key under 'key' (eg., for caching figures made from it).
+        '''
+        dataset = dict(dataset, key = key)
+        self.memory.put(key, dataset)
+        if self.cache_dir is None:
+            return
+        make_private_dir(self.cache_dir)
+        format, data = serialize_df(dataset['processed_df'])
+        self._write(self._path(key, format), data)
+        meta, arrays = encode_meta(dataset)
+        if arrays:
+            buffer = io.BytesIO()
+            np.savez(buffer, **arrays)
+            self._write(self._path(key, 'npz'), buffer.getvalue())
+        # the JSON metadata is written last, its presence marks a complete dataset
+        meta['serializer'] = format
+        meta['layout_version'] = LAYOUT_VERSION
+        self._write(self._path(key), json.dumps(meta, default = to_json_value).encode('utf-8'))
+        self.prune()
+
+    @timed
+    def get(self, key):
+        '''
+        Return the dataset stored under `key`, or None if it is unknown or has expired.
+        '''
+        if key in self.pinned:
+            return self.pinned[key]
+        dataset = self.memory.get(key)
+        if dataset is not None or not self._on_disk(key):
+            return dataset
+        try:
+            with open(self._path(key), 'rb') as file:
+                meta = json.load(file)
+            if meta.pop('layout_version', None) != LAYOUT_VERSION:
+                return None
+            format = meta.pop('serializer')
+            arrays = {}
+            if 'index' in meta:
+                with np.load(self._path(key, 'npz'), allow_pickle = False) as npz:
+                    arrays = {name: npz[name] for name in npz.files}
+            dataset = decode_meta(meta, arrays)
+            with open(self._path(key, format), 'rb') as file:
+                dataset['processed_df'] = deserialize_df(format, file.read())
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        self.memory.put(key, dataset)
+        return dataset
+
+    def pin(self, key):
+        '''
+        Hold the dataset stored under `key` in memory for the life of the process, out of the LRU bounds.
+        Used for datasets loaded before the server forks its workers, which then share its memory pages.
+        Returns the dataset, or None if it is unknown.
+        '''
+        dataset = self.get(key)
+        if dataset is not None:
+            self.pinned[key] = dataset
+            self.memory.pop(key)
+        return dataset
+
+    def remove(self, key):
+        '''
+        Remove the dataset stored under `key`, from memory and from the cache directory.
+        '''
+        self.pinned.pop(key, None)
+        self.memory.pop(key)
+        if self.cache_dir is None or not KEY_PATTERN.fullmatch(str(key)):
+            return
+        try:
+            entries = list(os.scandir(self.cache_dir))
+        except OSError: # nothing persisted yet
+            return
+        for entry in entries:
+            if entry.name.startswith(key + '.'):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def prune(self):
+        '''
+        Remove persisted datasets older than the TTL from the cache directory.
+        '''
+        if self.cache_dir is None or self.ttl is None:
+            return
+        now = time.time()
+        for entry in os.scandir(self.cache_dir):
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+dataset_store = DatasetStore()
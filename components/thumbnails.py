@@ -0,0 +1,221 @@
+import os
+import io
+import hmac
+import hashlib
+import tempfile
+import urllib.request
+from urllib.parse import urlencode, urlparse
+from flask import Blueprint, request, send_file, redirect, abort
+from components.metrics import timed
+
+# Thumbnail proxy for the sample images.
+# Each image is fetched once from its URL and resized to the fixed THUMBNAIL_SIZES, which are stored
+# in a disk cache shared by the workers (file names are the hash of the image content, so the same image
+# at several URLs is stored once) and served with long-lived cache headers.
+# The least recently served thumbnails are removed once the cache exceeds THUMBNAIL_CACHE_MB.
+# URLs are signed, so the proxy only fetches the images the dashboard links to.
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+THUMBNAIL_DIR = os.environ.get('DASHBOARD_THUMBNAIL_DIR', os.path.join(tempfile.gettempdir(), 'dashboard-thumbnails'))
+THUMBNAIL_CACHE_MB = int(os.environ.get('DASHBOARD_THUMBNAIL_CACHE_MB', 512))
+# Thumbnails are enabled if Pillow is installed, unless DASHBOARD_THUMBNAILS=0
+THUMBNAILS = Image is not None and os.environ.get('DASHBOARD_THUMBNAILS', '1') != '0'
+THUMBNAIL_SIZES = (128, 256, 512) # maximum width and height in pixels
+GALLERY_SIZE = 256
+MAX_IMAGE_BYTES = 64 * 2**20
+FETCH_TIMEOUT = 15 # seconds
+CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+thumbnail_bp = Blueprint('thumbnail', __name__, url_prefix = '/thumbnail')
+_secrets = {} # thumbnail directory -> signing key
+
+def get_secret(thumbnail_dir = None):
+    '''
+    Function to get the key signing thumbnail URLs, shared by the workers through the thumbnail directory.
+    '''
+    thumbnail_dir = thumbnail_dir or THUMBNAIL_DIR
+    if thumbnail_dir in _secrets:
+        return _secrets[thumbnail_dir]
+    # imported here, components.store imports this module (through components.profile and components.query)
+    from components.store import make_private_dir
+    path = os.path.join(thumbnail_dir, 'secret')
+    # the key and the cached thumbnails are only trusted in a directory no other user can write to
+    make_private_dir(thumbnail_dir)
+    try:
+        # the first worker creates the key, the others read it
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as file:
+            file.write(os.urandom(32))
+    except FileExistsError:
+        pass
+    with open(path, 'rb') as file:
+        info = os.fstat(file.fileno())
+        if info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise PermissionError(f'{path} belongs to another user or is readable by others, remove it')
+        _secrets[thumbnail_dir] = file.read()
+    return _secrets[thumbnail_dir]
+
+def get_signature(url, thumbnail_dir = None):
+    return hmac.new(get_secret(thumbnail_dir), url.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+def get_thumbnail_url(url, size = GALLERY_SIZE):
+    '''
+    Function to get the proxy URL of the thumbnail of an image.
+
+    Parameters:
+    -----------
+    url - String. URL of the original image.
+    size - Integer. One of `THUMBNAIL_SIZES`, maximum width and height of the thumbnail.
+
+    Returns:
+    --------
+    thumbnail_url - String. Path of the thumbnail on the dashboard server, or `url` if thumbnails are disabled.
+    '''
+    if not THUMBNAILS or urlparse(url).scheme not in ('http', 'https'):
+        return url
+    return f'/thumbnail/{size}?' + urlencode({'url': url, 'sig': get_signature(url)})
+
+def get_paths(url, thumbnail_dir = None):
+    # Paths of the file recording the content hash of `url`, and of the thumbnails of that content
+    thumbnail_dir = thumbnail_dir or THUMBNAIL_DIR
+    url_path = os.path.join(thumbnail_dir, 'urls', hashlib.sha256(url.encode('utf-8')).hexdigest())
+    try:
+        with open(url_path) as file:
+            digest = file.read().strip()
+    except OSError:
+        digest = None
+    return url_path, digest
+
+def get_thumbnail_path(digest, size, thumbnail_dir = None):
+    return os.path.join(thumbnail_dir or THUMBNAIL_DIR, 'images', f'{digest}-{size}')
+
+def write_file(path, data):
+    # write to a temporary file first so other workers never read a partial file
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    fd, tmp_path = tempfile.mkstemp(dir = os.path.dirname(path), suffix = '.tmp')
+    with os.fdopen(fd, 'wb') as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+def fetch_image(url):
+    '''
+    Function to download an image, raising ValueError if it is larger than `MAX_IMAGE_BYTES`.
+    '''
+    with urllib.request.urlopen(url, timeout = FETCH_TIMEOUT) as response:
+        data = response.read(MAX_IMAGE_BYTES + 1)
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError('image too large')
+    return data
+
+def make_thumbnails(data):
+    '''
+    Function to resize an image to each of `THUMBNAIL_SIZES` (never enlarging it).
+    Images with transparency are saved as PNG, others as JPEG.
+
+    Parameters:
+    -----------
+    data - Bytes of the original image.
+
+    Returns:
+    --------
+    thumbnails - Dictionary of size to bytes of the thumbnail.
+    '''
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image, format = image.convert('RGBA'), 'PNG'
+    else:
+        image, format = image.convert('RGB'), 'JPEG'
+    thumbnails = {}
+    for size in THUMBNAIL_SIZES:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size))
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, format = format, quality = 85, optimize = True)
+        thumbnails[size] = buffer.getvalue()
+    return thumbnails
+
+@timed
+def get_thumbnail(url, size, thumbnail_dir = None):
+    '''
+    Function to get the cached thumbnail of an image, fetching the image and making its thumbnails on first use.
+
+    Parameters:
+    -----------
+    url - String. URL of the original image.
+    size - Integer. One of `THUMBNAIL_SIZES`.
+    thumbnail_dir - Directory of the thumbnail cache, defaults to `THUMBNAIL_DIR`.
+
+    Returns:
+    --------
+    path - Path to the thumbnail file.
+    digest - String. Hash of the original image content.
+    Raises OSError if the image can't be fetched, ValueError if it can't be read as an image.
+    '''
+    url_path, digest = get_paths(url, thumbnail_dir)
+    if digest is not None:
+        path = get_thumbnail_path(digest, size, thumbnail_dir)
+        try:
+            os.utime(path) # mark as recently used
+            return path, digest
+        except OSError:
+            pass # evicted, make it again
+    data = fetch_image(url)
+    digest = hashlib.sha256(data).hexdigest()
+    try:
+        thumbnails = make_thumbnails(data)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f'not a readable image: {e}')
+    for thumbnail_size, thumbnail in thumbnails.items():
+        write_file(get_thumbnail_path(digest, thumbnail_size, thumbnail_dir), thumbnail)
+    write_file(url_path, digest.encode('ascii'))
+    prune_thumbnails(thumbnail_dir)
+    return get_thumbnail_path(digest, size, thumbnail_dir), digest
+
+def prune_thumbnails(thumbnail_dir = None, max_bytes = None):
+    '''
+    Function to remove the least recently used thumbnails until the cache is within `max_bytes` (THUMBNAIL_CACHE_MB).
+    '''
+    images_dir = os.path.join(thumbnail_dir or THUMBNAIL_DIR, 'images')
+    max_bytes = THUMBNAIL_CACHE_MB * 2**20 if max_bytes is None else max_bytes
+    entries = []
+    for entry in os.scandir(images_dir):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+@thumbnail_bp.route('/<int:size>')
+def thumbnail(size):
+    url = request.args.get('url', '')
+    if size not in THUMBNAIL_SIZES or not THUMBNAILS:
+        abort(404)
+    if not hmac.compare_digest(request.args.get('sig', ''), get_signature(url)):
+        abort(403)
+    try:
+        path, digest = get_thumbnail(url, size)
+    except (OSError, ValueError) as e:
+        # let the browser load the original image
+        print(f'thumbnail of {url}: {e}')
+        return redirect(url)
+    with open(path, 'rb') as file:
+        mimetype = 'image/png' if file.read(4) == b'\x89PNG' else 'image/jpeg'
+    response = send_file(path, mimetype = mimetype, etag = f'{digest}-{size}', max_age = CACHE_MAX_AGE,
+                         conditional = True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
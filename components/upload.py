@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+from flask import Blueprint, request, jsonify
+from components.store import make_private_dir
+
+# Chunked, resumable upload of large data files.
+# The browser sends the file in chunks (see assets/chunked_upload.js), which are written to local disk.
+# An interrupted upload is resumed from the number of bytes already received.
+# Once complete, the dashboard reads the assembled file from its path.
+# Uploads are kept in a directory only the server's user can access (see store.make_private_dir), as their IDs
+# are predictable: a file planted by another user must not be taken for a finished upload.
+
+UPLOAD_DIR = os.environ.get('DASHBOARD_UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'dashboard-uploads'))
+MAX_CHUNK_BYTES = 16 * 2**20
+UPLOAD_TTL = 24 * 60 * 60 # remove unfinished and processed uploads after a day
+UPLOAD_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+upload_bp = Blueprint('upload', __name__, url_prefix = '/upload')
+
+def get_upload_paths(upload_id, upload_dir = None):
+    '''
+    Function to get the paths of the files for an upload: metadata, partial file, and assembled file.
+    Returns None if `upload_id` is not a valid upload ID.
+    '''
+    if not UPLOAD_ID_PATTERN.fullmatch(str(upload_id)):
+        return None
+    upload_dir = upload_dir or UPLOAD_DIR
+    make_private_dir(upload_dir)
+    base = os.path.join(upload_dir, upload_id)
+    return base + '.json', base + '.part', base + '.data'
+
+def get_upload(upload_id, upload_dir = None):
+    '''
+    Function to find a completed upload.
+
+    Parameters:
+    -----------
+    upload_id - String. ID of the upload (returned by '/upload/init').
+    upload_dir - Directory where uploads are assembled, defaults to `UPLOAD_DIR`.
+
+    Returns:
+    --------
+    filepath - Path to the assembled file.
+    filename - String. Original name of the uploaded file.
+    Returns None if there is no completed upload with this ID.
+    '''
+    paths = get_upload_paths(upload_id, upload_dir)
+    if paths is None or not os.path.exists(paths[2]):
+        return None
+    try:
+        with open(paths[0]) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return paths[2], meta['filename']
+
+def open_private(path, mode):
+    # Open an upload file, created readable and writable by the server's user only
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    return os.fdopen(fd, mode)
+
+def get_offset(part_path):
+    # Number of bytes received so far for an upload
+    try:
+        return os.path.getsize(part_path)
+    except OSError:
+        return 0
+
+def prune_uploads(upload_dir):
+    # Remove uploads that were not touched within UPLOAD_TTL
+    now = time.time()
+    for entry in os.scandir(upload_dir):
+        try:
+            if now - entry.stat().st_mtime > UPLOAD_TTL:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+@upload_bp.route('/init', methods = ['POST'])
+def init_upload():
+    '''
+    Start or resume an upload. Expects JSON with 'filename', 'size' (bytes), and 'fingerprint'
+    (client-side identifier of the file, eg., name, size, and modification time).
+    Responds with the upload ID and the offset from which to send the file.
+    '''
+    upload_dir = UPLOAD_DIR
+    info = request.get_json(silent = True) or {}
+    filename = info.get('filename')
+    size = info.get('size')
+    if not isinstance(filename, str) or not isinstance(size, int) or size < 0:
+        return jsonify(error = 'filename and size required'), 400
+    identity = '|'.join([filename, str(size), str(info.get('fingerprint', ''))])
+    upload_id = hashlib.sha256(identity.encode('utf-8')).hexdigest()[:32]
+    meta_path, part_path, data_path = get_upload_paths(upload_id, upload_dir)
+
+    prune_uploads(upload_dir)
+    if os.path.exists(data_path):
+        # already uploaded, nothing left to send
+        return jsonify(upload_id = upload_id, offset = size, complete = True)
+    if not os.path.exists(meta_path):
+        with open_private(meta_path, 'w') as file:
+            json.dump({'filename': filename, 'size': size}, file)
+    return jsonify(upload_id = upload_id, offset = get_offset(part_path), complete = False)
+
+@upload_bp.route('/<upload_id>', methods = ['PUT'])
+def put_chunk(upload_id):
+    '''
+    Write a chunk (request body) at the byte offset given by the 'offset' query parameter.
+    Chunks may be re-sent (offset before the current end), but not leave a gap.
+    Responds with the number of bytes received so far; 409 with that offset if the chunk would leave a gap.
+    '''
+    paths = get_upload_paths(upload_id)
+    if paths is None or not os.path.exists(paths[0]):
+        return jsonify(error = 'unknown upload'), 404
+    meta_path, part_path, data_path = paths
+    with open(meta_path) as file:
+        size = json.load(file)['size']
+    offset = request.args.get('offset', type = int)
+    current = get_offset(part_path)
+    if offset is None or offset < 0 or offset > current:
+        return jsonify(error = 'offset mismatch', offset = current), 409
+    if request.content_length is None or request.content_length > MAX_CHUNK_BYTES:
+        return jsonify(error = 'chunk too large', max_chunk_bytes = MAX_CHUNK_BYTES), 413
+    chunk = request.get_data(cache = False)
+    if offset + len(chunk) > size:
+        return jsonify(error = 'chunk exceeds file size'), 400
+
+    # write at the given offset, so a re-sent chunk overwrites the same bytes
+    with open_private(part_path, 'r+b') as file:
+        file.seek(offset)
+        file.write(chunk)
+    return jsonify(offset = max(current, offset + len(chunk)))
+
+@upload_bp.route('/<upload_id>/complete', methods = ['POST'])
+def complete_upload(upload_id):
+    '''
+    Finish an upload once all bytes have been received, making the assembled file available to the dashboard.
+    Responds 409 with the current offset if the file is incomplete.
+    '''
+    paths = get_upload_paths(upload_id)
+    if paths is None or not os.path.exists(paths[0]):
+        return jsonify(error = 'unknown upload'), 404
+    meta_path, part_path, data_path = paths
+    if os.path.exists(data_path):
+        return jsonify(upload_id = upload_id)
+    with open(meta_path) as file:
+        size = json.load(file)['size']
+    current = get_offset(part_path)
+    if current != size:
+        return jsonify(error = 'upload incomplete', offset = current), 409
+    if not os.path.exists(part_path):
+        # empty file, no chunks were sent
+        open_private(part_path, 'wb').close()
+    os.replace(part_path, data_path)
+    return jsonify(upload_id = upload_id)
@@ -0,0 +1,184 @@
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+import urllib.request
+import urllib.error
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from components.metrics import timed
+from components.store import make_private_dir
+
+# Background checks of the image URLs of uploaded datasets.
+# After upload, the URLs are requested (HEAD) by a pool of threads; the results are kept in an SQLite database
+# shared by the workers, so image sampling can skip the URLs known to be broken and the dashboard can report them.
+# Enabled by DASHBOARD_URL_CHECKS=1.
+
+URL_CHECKS = os.environ.get('DASHBOARD_URL_CHECKS', '0') == '1'
+# the database is kept in a directory only the server's user can access, so other users can't mark URLs as broken
+URL_CHECK_DB = os.environ.get('DASHBOARD_URL_CHECK_DB', os.path.join(tempfile.gettempdir(), 'dashboard-url-checks', 'urls.sqlite'))
+URL_CHECK_WORKERS = int(os.environ.get('DASHBOARD_URL_CHECK_WORKERS', 16)) # concurrent requests per upload
+URL_CHECK_TTL = 24 * 60 * 60 # seconds before a URL is checked again
+URL_CHECK_TIMEOUT = 10 # seconds, slower URLs count as broken
+BATCH_SIZE = 200 # results saved at a time
+
+@contextmanager
+def connect(db_path = None):
+    # Connection to the results database, committed and closed on exit
+    db_path = db_path or URL_CHECK_DB
+    make_private_dir(os.path.dirname(os.path.abspath(db_path)))
+    connection = sqlite3.connect(db_path, timeout = 30)
+    try:
+        with connection:
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, ok INTEGER, status INTEGER, checked_at REAL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS runs (dataset TEXT PRIMARY KEY, total INTEGER, checked INTEGER, '
+                               'broken INTEGER, started_at REAL, finished_at REAL)')
+            yield connection
+    finally:
+        connection.close()
+
+def check_url(url, timeout = None):
+    '''
+    Function to check that an image URL can be loaded.
+    Servers not answering HEAD requests are asked for the first byte instead.
+
+    Parameters:
+    -----------
+    url - String. URL to check.
+    timeout - Number of seconds to wait for an answer, defaults to `URL_CHECK_TIMEOUT`.
+
+    Returns:
+    --------
+    ok - Boolean. True if the URL answered with a success status.
+    status - Integer. HTTP status of the answer, None if there was none (eg., timeout or invalid URL).
+    '''
+    timeout = timeout or URL_CHECK_TIMEOUT
+    requests = [urllib.request.Request(url, method = 'HEAD'),
+                urllib.request.Request(url, headers = {'Range': 'bytes=0-0'})]
+    status = None
+    for request in requests:
+        try:
+            with urllib.request.urlopen(request, timeout = timeout) as response:
+                return True, response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+            if status not in (405, 501): # HEAD not allowed
+                break
+        except (OSError, ValueError):
+            break
+    return False, status
+
+def get_checked_urls(urls, db_path = None, ttl = None):
+    '''
+    Function to get the URLs among `urls` with a result more recent than `ttl` seconds (URL_CHECK_TTL).
+    '''
+    ttl = URL_CHECK_TTL if ttl is None else ttl
+    checked = set()
+    urls = list(urls)
+    with connect(db_path) as connection:
+        for start in range(0, len(urls), 500):
+            batch = urls[start:start + 500]
+            rows = connection.execute(f"SELECT url FROM urls WHERE checked_at > ? AND url IN ({','.join('?' * len(batch))})",
+                                      [time.time() - ttl] + batch)
+            checked.update(url for url, in rows)
+    return checked
+
+@timed
+def check_urls(urls, dataset_key = None, db_path = None, max_workers = None, timeout = None):
+    '''
+    Function to check image URLs concurrently, saving the results. URLs checked recently are skipped.
+
+    Parameters:
+    -----------
+    urls - Iterable of URLs to check.
+    dataset_key - String. Key of the dataset the URLs are from, to record the progress of its check.
+    db_path - Path of the results database, defaults to `URL_CHECK_DB`.
+    max_workers - Integer. Number of concurrent requests, defaults to `URL_CHECK_WORKERS`.
+    timeout - Number of seconds to wait for each URL, defaults to `URL_CHECK_TIMEOUT`.
+
+    Returns:
+    --------
+    results - Dictionary of checked URL to Boolean (True if the URL can be loaded).
+    '''
+    urls = list(dict.fromkeys(urls))
+    unchecked = [url for url in urls if url not in get_checked_urls(urls, db_path)]
+    results = {}
+    if dataset_key is not None:
+        with connect(db_path) as connection:
+            connection.execute('INSERT OR REPLACE INTO runs VALUES (?, ?, ?, 0, ?, NULL)',
+                               (dataset_key, len(urls), len(urls) - len(unchecked), time.time()))
+    with ThreadPoolExecutor(max_workers = max_workers or URL_CHECK_WORKERS) as executor:
+        for start in range(0, len(unchecked), BATCH_SIZE):
+            batch = unchecked[start:start + BATCH_SIZE]
+            checks = list(executor.map(lambda url: check_url(url, timeout), batch))
+            now = time.time()
+            with connect(db_path) as connection:
+                connection.executemany('INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?)',
+                                       [(url, ok, status, now) for url, (ok, status) in zip(batch, checks)])
+                if dataset_key is not None:
+                    connection.execute('UPDATE runs SET checked = checked + ? WHERE dataset = ?', (len(batch), dataset_key))
+            results.update((url, ok) for url, (ok, status) in zip(batch, checks))
+    if dataset_key is not None:
+        broken = len(get_broken_urls(urls, db_path))
+        with connect(db_path) as connection:
+            connection.execute('UPDATE runs SET broken = ?, finished_at = ? WHERE dataset = ?',
+                               (broken, time.time(), dataset_key))
+    return results
+
+def start_url_checks(get_urls, dataset_key, db_path = None):
+    '''
+    Function to check the image URLs of a dataset in a background thread (see `check_urls`),
+    unless they were checked or are being checked.
+
+    Parameters:
+    -----------
+    get_urls - Function returning the URLs to check (called in the background thread).
+    dataset_key - String. Key of the dataset the URLs are from.
+    db_path - Path of the results database, defaults to `URL_CHECK_DB`.
+
+    Returns:
+    --------
+    thread - Thread running the check, None if it was not started.
+    '''
+    progress = get_check_progress(dataset_key, db_path)
+    if progress is not None and time.time() - progress['started_at'] < URL_CHECK_TTL:
+        return None
+    thread = threading.Thread(target = lambda: check_urls(get_urls(), dataset_key, db_path), daemon = True)
+    thread.start()
+    return thread
+
+def get_check_progress(dataset_key, db_path = None):
+    '''
+    Function to get the progress of the URL check of a dataset.
+
+    Returns:
+    --------
+    progress - Dictionary with number of URLs ('total'), URLs checked so far ('checked'), broken URLs found
+               once the check is finished ('broken'), time the check started ('started_at') and whether it is 'finished'.
+               None if the dataset's URLs were not checked.
+    '''
+    with connect(db_path) as connection:
+        row = connection.execute('SELECT total, checked, broken, started_at, finished_at FROM runs WHERE dataset = ?',
+                                 (dataset_key,)).fetchone()
+    if row is None:
+        return None
+    total, checked, broken, started_at, finished_at = row
+    return {'total': total, 'checked': checked, 'broken': broken, 'started_at': started_at,
+            'finished': finished_at is not None}
+
+def get_broken_urls(urls = None, db_path = None):
+    '''
+    Function to get the URLs found broken (among `urls` if given, looking up only those).
+    '''
+    with connect(db_path) as connection:
+        if urls is None:
+            return {url for url, in connection.execute('SELECT url FROM urls WHERE ok = 0')}
+        broken = set()
+        urls = list(urls)
+        for start in range(0, len(urls), 500):
+            batch = urls[start:start + 500]
+            rows = connection.execute(f"SELECT url FROM urls WHERE ok = 0 AND url IN ({','.join('?' * len(batch))})", batch)
+            broken.update(url for url, in rows)
+    return broken
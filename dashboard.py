@@ -1,13 +1,27 @@
-import pandas as pd
+import os
+import gc
+import argparse
 import base64
 import io
 import json
+from urllib.parse import parse_qs
 import dash
-from dash import Dash, html, dcc, Input, Output, State
+from dash import Dash, html, dcc, Input, Output, State, ClientsideFunction
 from dash.exceptions import PreventUpdate
-from components.query import get_data, get_species_options, get_images
-from components.graphs import make_hist_plot, make_map, make_pie_plot
-from components.divs import get_main_div, get_error_div, get_hist_div, get_map_div, get_img_div
+from components.query import get_data, append_data, get_images, get_image_paths
+from components.graphs import make_hist_plot, get_hist_counts, make_map, make_pie_plot, get_figure
+from components.divs import get_main_div, get_error_div, get_hist_div, get_img_div
+from components.store import dataset_store, get_dataset_key, get_file_key, get_sheet_key, get_append_key
+from components.index import build_index, extend_index
+from components.profile import FEATURES, check_features, get_profile, update_profile
+from components.ingest import is_supported_file, is_workbook, get_sheet_names, read_header, read_data, DATA_COLUMNS
+from components.upload import upload_bp, get_upload
+from components.thumbnails import thumbnail_bp
+from components.url_checks import URL_CHECKS, start_url_checks, get_check_progress, get_broken_urls
+from components.metrics import metrics_bp, timed, stage_timer, set_callback_names
+from components.jobs import submit_job, get_job, cancel_job, report_progress, in_job
+from components.catalog import catalog_store, set_catalog_dir, list_catalog, get_catalog_path, get_catalog_key
+from components.spatial import clean_viewport
 
 # Fixed style
 PRINT_STYLE = {'textAlign': 'center', 'color': 'MidnightBlue', 'margin-bottom' : 10}
@@ -15,6 +29,17 @@ PRINT_STYLE = {'textAlign': 'center', 'color': 'MidnightBlue', 'margin-bottom' :
 # Initialize app/dashboard and set layout
 app = Dash(__name__, suppress_callback_exceptions=True)
 server = app.server
+server.register_blueprint(upload_bp)
+server.register_blueprint(metrics_bp)
+server.register_blueprint(thumbnail_bp)
+
+# Uploads are processed as background jobs in a pool of processes (see components/jobs.py), unless DASHBOARD_BACKGROUND_JOBS=0
+BACKGROUND_JOBS = os.environ.get('DASHBOARD_BACKGROUND_JOBS', '1') != '0'
+# Catalog datasets processed when the app is loaded, before gunicorn (--preload) forks its workers (see preload_datasets):
+# comma-separated file names, or '*' for the whole catalog
+PRELOAD = os.environ.get('DASHBOARD_PRELOAD')
+JOB_STAGE_LABELS = {'decode': 'Decoding upload', 'validate': 'Checking columns', 'parse': 'Reading file',
+                    'locality': 'Aggregating localities', 'index': 'Building image index', 'save': 'Saving dataset'}
 
 app.layout = html.Div([
                 dcc.Upload(html.Button('Upload Data',
@@ -25,14 +50,45 @@ app.layout = html.Div([
                             id = 'upload-data',
                             multiple = False
                             ),
+                # Large files are sent in chunks by assets/chunked_upload.js, which reports the finished upload in the URL
+                html.Button('Upload Large File',
+                            style = {'color': 'MidnightBlue', 
+                                    'background-color': 'BlanchedAlmond', 
+                                    'border-color': 'MidnightBlue',
+                                    'font-size': '16px',
+                                    'margin-top': 5},
+                            id = 'upload-large'),
+                dcc.Location(id = 'upload-location', refresh = False),
+                # Append mode: uploaded rows are added to the dataset shown instead of replacing it
+                dcc.Checklist(id = 'append-upload',
+                            options = [{'label': ' Append uploads to the current dataset', 'value': 'append'}],
+                            value = [],
+                            style = {'color': 'MidnightBlue', 'margin-top': 5}),
+                # Dataset picker, shown if the server has a catalog directory (see components/catalog.py)
+                html.Div(dcc.Dropdown(id = 'catalog-picker',
+                                    placeholder = 'Or select a dataset from the server'),
+                        id = 'catalog-picker-div',
+                        style = {'display': 'none'}),
+                # Sheet picker, shown for Excel workbooks with several sheets
+                html.Div(dcc.Dropdown(id = 'sheet-picker',
+                                    placeholder = 'Select sheet',
+                                    clearable = False),
+                        id = 'sheet-picker-div',
+                        style = {'display': 'none'}),
                 # Set up memory store with loading indicator, will revert on page refresh
                 dcc.Loading(id = 'memory-loading',
                             type = "circle",
                             color = 'DarkMagenta',
                             children = dcc.Store(id = 'memory')),
+                # Progress of the upload processing job, polled while it runs
+                html.Div([html.Span(id = 'job-stage', style = PRINT_STYLE),
+                        html.Button('Cancel', id = 'cancel-job', style = {'margin-left': 10})],
+                        id = 'job-progress',
+                        style = {'display': 'none'}),
+                dcc.Interval(id = 'job-interval', interval = 1000, disabled = True),
                 html.Hr(),
                 
-                html.Div(children = [html.H3('Upload data (CSV or XLS) to see distribution statistics.', 
+                html.Div(children = [html.H3('Upload data (CSV, Excel, Parquet, or Feather) to see distribution statistics.', 
                                               style = PRINT_STYLE),
                                     html.Br(),
                                     html.P(["For further file requirements, please see the ",
@@ -49,80 +105,411 @@ app.layout = html.Div([
         Output('memory', 'data', allow_duplicate=True),
         Input('upload-data', 'contents'),
         State('upload-data', 'filename'),
+        State('append-upload', 'value'),
+        State('memory', 'data'),
         prevent_initial_call = True
 )
 
-def parse_contents(contents, filename):
+@timed
+def parse_contents(contents, filename, append = None, jsonified_data = None, sheet_name = None):
     '''
-    Function to read uploaded data.
+    Function to read uploaded data (from sheet `sheet_name` for Excel workbooks),
+    appending it to the current dataset (key saved in `jsonified_data`) in append mode.
     '''
     if contents is None:
         raise PreventUpdate
+    return start_job(load_contents, contents, filename, sheet_name, get_base_key(append, jsonified_data),
+                     background = is_workbook(filename))
+
+# Data uploaded in chunks read in and save to memory
+@app.callback(
+        Output('memory', 'data', allow_duplicate=True),
+        Input('upload-location', 'search'),
+        State('append-upload', 'value'),
+        State('memory', 'data'),
+        prevent_initial_call = True
+)
+
+@timed
+def parse_upload(search, append = None, jsonified_data = None, sheet_name = None):
+    '''
+    Function to read data uploaded in chunks, once the upload ID is reported in the URL ('?upload=<id>&n=<nonce>', the nonce only changing the URL).
+    In append mode, the data is appended to the current dataset.
+    '''
+    upload_id = parse_qs((search or '').lstrip('?')).get('upload', [None])[0]
+    upload = get_upload(upload_id)
+    if upload is None:
+        raise PreventUpdate
+    filepath, filename = upload
+    return start_job(load_upload, filepath, filename, sheet_name, upload_id, get_base_key(append, jsonified_data),
+                     background = is_workbook(filename))
+
+def get_base_key(append, jsonified_data):
+    '''
+    Function to get the key of the dataset to append uploads to: the current dataset in append mode, else None.
+    '''
+    if not append or jsonified_data is None:
+        return None
+    return json.loads(jsonified_data).get('dataset')
+
+# Data read in again from another sheet of an uploaded Excel workbook
+@app.callback(
+        Output('memory', 'data', allow_duplicate=True),
+        Input('sheet-picker', 'value'),
+        State('memory', 'data'),
+        State('upload-data', 'contents'),
+        State('upload-data', 'filename'),
+        prevent_initial_call = True
+)
+
+@timed
+def select_sheet(sheet_name, jsonified_data, contents, filename):
+    '''
+    Function to read the sheet selected by the user from the uploaded workbook (with `dcc.Upload` or in chunks).
+    '''
+    data = json.loads(jsonified_data or '{}')
+    if sheet_name is None or 'sheets' not in data or sheet_name == data['sheet']:
+        raise PreventUpdate
+    if data.get('upload') is not None:
+        return parse_upload('?upload=' + data['upload'], sheet_name = sheet_name)
+    return parse_contents(contents, filename, sheet_name = sheet_name)
+
+# Callback to list the datasets of the server catalog, on page load
+@app.callback(
+        Output('catalog-picker', 'options'),
+        Output('catalog-picker-div', 'style'),
+        Input('upload-location', 'pathname')
+)
+
+@timed
+def list_catalog_options(pathname):
+    '''
+    Function to get the options of the catalog picker, hidden if the catalog is empty or not set.
+    '''
+    names = list_catalog()
+    if not names:
+        return [], {'display': 'none'}
+    return names, {'width': '30%', 'margin-top': 5}
+
+# Dataset of the server catalog read in and save to memory
+@app.callback(
+        Output('memory', 'data', allow_duplicate=True),
+        Input('catalog-picker', 'value'),
+        prevent_initial_call = True
+)
+
+@timed
+def select_catalog_dataset(name):
+    '''
+    Function to load the catalog dataset selected by the user. It is processed once, then shared by all sessions.
+    '''
+    if get_catalog_path(name) is None:
+        raise PreventUpdate
+    dataset_key = get_catalog_key(name)
+    dataset = catalog_store.get(dataset_key)
+    if dataset is not None:
+        # URL checks of preloaded datasets start on their first use (unless done already)
+        check_image_urls(dataset, dataset_key)
+        return json.dumps({'dataset': dataset_key})
+    return start_job(load_catalog_file, name, dataset_key)
+
+def check_image_urls(dataset, dataset_key):
+    '''
+    Function to start checking the image URLs of a processed dataset (if DASHBOARD_URL_CHECKS is set), see `start_url_checks`.
+    '''
+    if URL_CHECKS and dataset is not None and dataset['profile'].images:
+        start_url_checks(lambda: get_image_paths(dataset['processed_df'], dataset['index']['images']), dataset_key)
+
+def start_job(func, *args, background = False):
+    '''
+    Function to process an upload with `func(*args)` as a background job (if BACKGROUND_JOBS is set), else right away.
+    Uploads given `background` (workbooks, whose parsing takes long) are always processed as background jobs,
+    so they never hold the request.
+
+    Returns:
+    --------
+    JSON string of dictionary with the ID of the job ('job'), which `poll_job` replaces with its result once done.
+    Or the result of `func` if it was run right away.
+    '''
+    if not (BACKGROUND_JOBS or background):
+        return func(*args)
+    return json.dumps({'job': submit_job(func, *args)})
+
+def load_contents(contents, filename, sheet_name = None, base_key = None):
+    '''
+    Function to process data uploaded with `dcc.Upload` (base64-encoded contents), see `load_data`.
+    '''
     content_type, content_string = contents.split(',')
+    with stage_timer('base64_decode'):
+        decoded = base64.b64decode(content_string)
+    return load_data(io.BytesIO(decoded), filename, get_dataset_key(decoded, filename), sheet_name, base_key = base_key)
+
+def load_upload(filepath, filename, sheet_name = None, upload_id = None, base_key = None):
+    '''
+    Function to process data uploaded in chunks, see `load_data`.
+    '''
+    return load_data(filepath, filename, get_file_key(filepath, filename), sheet_name, upload_id, base_key = base_key)
+
+def load_catalog_file(name, dataset_key, url_checks = True):
+    '''
+    Function to process a file of the server catalog into the catalog store, see `load_data`.
+    '''
+    return load_data(get_catalog_path(name), name, dataset_key, store = catalog_store, url_checks = url_checks)
+
+@timed
+def preload_datasets(names = None):
+    '''
+    Function to process catalog datasets (unless already in the catalog store) and pin them in memory (see `DatasetStore.pin`).
+    Run when the app is loaded: with gunicorn --preload, the workers forked afterwards share the memory pages
+    of the datasets and their indexes (copy-on-write), instead of each loading its own copy.
 
-    decoded = base64.b64decode(content_string)
+    Parameters:
+    -----------
+    names - String. Comma-separated names of catalog files, or '*' for the whole catalog. Defaults to `PRELOAD`.
+
+    Returns:
+    --------
+    keys - List of the keys of the preloaded datasets.
+    '''
+    names = names or PRELOAD
+    if not names:
+        return []
+    if names.strip() == '*':
+        names = list_catalog()
+    else:
+        names = [name.strip() for name in names.split(',') if name.strip()]
+    keys = []
+    for name in names:
+        dataset_key = get_catalog_key(name)
+        if dataset_key is None:
+            print(f'{name} is not in the catalog, not preloaded')
+            continue
+        if catalog_store.get(dataset_key) is None:
+            # URL checks run in a thread, which would not survive the fork
+            result = json.loads(load_catalog_file(name, dataset_key, url_checks = False))
+            if 'error' in result:
+                print(f'{name} not preloaded: {result["error"]}')
+                continue
+        catalog_store.pin(dataset_key)
+        keys.append(dataset_key)
+    # objects loaded so far are left out of garbage collection, whose passes would write to (so copy) their pages in each worker
+    gc.freeze()
+    return keys
+
+@timed
+def load_data(source, filename, dataset_key, sheet_name = None, upload_id = None, store = None, base_key = None, url_checks = True):
+    '''
+    Function to read and process uploaded data, saving the processed dataset server-side.
+    Reports its stages with `report_progress` when run as a background job.
+
+    Parameters:
+    -----------
+    source - Path to the uploaded file or binary file-like object with its contents.
+    filename - String. Original name of the uploaded file.
+    dataset_key - String. Key of the upload (content hash), under which the processed dataset is saved.
+    sheet_name - String. Sheet to read from an Excel workbook, defaults to the first sheet.
+    upload_id - String. ID of the chunked upload holding the file, None if it was uploaded with `dcc.Upload`.
+    store - DatasetStore to save the processed dataset to, defaults to `dataset_store` (uploads).
+    base_key - String. Key of a processed dataset to append the uploaded rows to (read from the first sheet of workbooks),
+               None to process them as a dataset of their own.
+    url_checks - Boolean. If False, the image URLs are not checked (if DASHBOARD_URL_CHECKS is set) until the dataset is used.
+
+    Returns:
+    --------
+    JSON string of dictionary with the key of the processed dataset, or with information on the error that occurred.
+    For Excel workbooks, it also holds the names of the sheets ('sheets'), the sheet read ('sheet'), and `upload_id` ('upload').
+    '''
+    if not is_supported_file(filename):
+        return json.dumps({'error': {'type': 'wrong file type'}})
+    saved = {}
+    if is_workbook(filename):
+        try:
+            sheets = get_sheet_names(source)
+        except Exception as e:
+            print(e)
+            return json.dumps({'error': {'other': str(e)}})
+        if sheet_name == sheets[0]:
+            sheet_name = None
+        saved = {'sheets': sheets, 'sheet': sheet_name or sheets[0], 'upload': upload_id}
+    store = store or dataset_store
+    dataset_key = get_sheet_key(dataset_key, sheet_name)
+    base = None
+    if base_key is not None:
+        base = dataset_store.get(base_key) or catalog_store.get(base_key)
+        if base is None:
+            return json.dumps({'error': {'expired': base_key}})
+        saved = {}
+        dataset_key = get_append_key(base_key, dataset_key)
+    # Same upload already processed (by this or another worker): reuse it
+    dataset = store.get(dataset_key)
+    if dataset is not None:
+        if url_checks and not in_job():
+            check_image_urls(dataset, dataset_key)
+        return json.dumps(dict(saved, dataset = dataset_key))
+    report_progress('validate')
     try:
-        if 'csv' in filename:
-            df = pd.read_csv(io.StringIO(decoded.decode('utf-8')))
-        elif 'xls' in filename:
-            df = pd.read_excel(io.BytesIO(decoded))
-        else:
-            return json.dumps({'error': {'type': 'wrong file type'}})
+        # Check for required columns in the header, before parsing the file
+        # If no lat/lon, disable Map View button
+        # If no image urls, disable sample image options
+        columns = read_header(source, filename, sheet_name)
+        included_features, mapping, img_urls, missing = check_features(columns)
+        if base is not None:
+            # appended rows need the features of the dataset they are added to
+            profile = base['profile']
+            included_features = [feature for feature in FEATURES if feature in profile.columns]
+            mapping, img_urls = profile.mapping, profile.images
+            missing = next((feature for feature in included_features if feature not in columns), None)
+        if missing is not None:
+            return json.dumps(dict(saved, error = {'feature': missing}))
+        # Parse only the columns used
+        report_progress('parse')
+        df = read_data(source, filename, sheet_name, [column for column in DATA_COLUMNS if column in columns])
     except UnicodeDecodeError as e:
         print(e)
-        return json.dumps({'error': {'unicode': str(e)}})
+        return json.dumps(dict(saved, error = {'unicode': str(e)}))
     
     except Exception as e:
         print(e)
-        return json.dumps({'error': {'other': str(e)}})
-    # Check for required columns
-    # If no lat/lon, disable Map View button
-    # If no image urls, disable sample image options
-    mapping = True
-    img_urls = True
-    features = ['Species', 'Subspecies', 'View', 'Sex', 'hybrid_stat', 'lat', 'lon', 'file_url', 'Image_filename']
-    included_features = []
-    for feature in features:
-        if feature not in list(df.columns):
-            if feature == 'lat' or feature == 'lon':
-                mapping = False
-            elif feature == 'file_url':
-                img_urls = False
-            elif feature == 'Image_filename':
-                # If 'Image_filename' missing, return missing column if 'file_url' is included.
-                if img_urls:
-                    return json.dumps({'error': {'feature': feature}})
-            else:
-                return json.dumps({'error': {'feature': feature}})
-        else:
-            included_features.append(feature)
+        return json.dumps(dict(saved, error = {'other': str(e)}))
+    null_counts = df[included_features].isna().sum().to_dict()
     
     # get dataset-determined static data:
         # the dataframe and categorical features - processed for map view if mapping is True
-        # all possible species, subspecies
-        # will likely include categorical options in later instance (sooner)
+        # profile: all possible species, subspecies, and filter values
+        # index for image filters
+    report_progress('locality')
     processed_df, cat_list = get_data(df, mapping, included_features)
-    all_species = get_species_options(processed_df)
-    # save data to dictionary to save as json 
-    data = {
-            'processed_df': processed_df.to_json(date_format = 'iso', orient = 'split'),
-            'all_species': all_species,
-            'mapping': mapping,
-            'images': img_urls
-        }   
-    return json.dumps(data)
-
-# Callback to update processed data if new data uploaded
+    if base is None:
+        report_progress('index')
+        dataset = {
+                'processed_df': processed_df,
+                'profile': get_profile(processed_df, mapping, img_urls, null_counts),
+                'index': build_index(processed_df)
+            }
+    else:
+        # aggregates, profile, and index updated from the new rows
+        new_df = processed_df
+        processed_df = append_data(base['processed_df'], new_df)
+        report_progress('index')
+        dataset = {
+                'processed_df': processed_df,
+                'profile': update_profile(base['profile'], processed_df, new_df, null_counts),
+                'index': extend_index(base['index'], new_df)
+            }
+    # save data server-side, browser memory only keeps the key to it
+    report_progress('save')
+    store.put(dataset_key, dataset)
+    # in a background job, the checks are started by the web worker once it is done (see `poll_job`):
+    # the thread would be killed with the pool process
+    if url_checks and not in_job():
+        check_image_urls(dataset, dataset_key)
+    return json.dumps(dict(saved, dataset = dataset_key))
+
+def load_dataset(jsonified_data):
+    '''
+    Function to resolve the saved data (key to the processed dataset) to the dataset held server-side,
+    from the uploads or the catalog.
+
+    Parameters:
+    -----------
+    jsonified_data - Saved dictionary with the key of the processed dataset.
+
+    Returns:
+    --------
+    dataset - Dictionary of DataFrame ('processed_df'), its DatasetProfile ('profile'), and image filter index ('index').
+              None if the dataset is no longer available on the server.
+    '''
+    data = json.loads(jsonified_data)
+    return dataset_store.get(data.get('dataset')) or catalog_store.get(data.get('dataset'))
+
+# Callback to start polling the upload processing job saved in memory
+# Runs in the browser (assets/dashboard_clientside.js)
+app.clientside_callback(
+        ClientsideFunction(namespace = 'dashboard', function_name = 'start_job_polling'),
+        Output('job-interval', 'disabled', allow_duplicate=True),
+        Input('memory', 'data'),
+        prevent_initial_call = True
+)
+
+# Callback following the upload processing job, saving its result to memory once it is finished
 @app.callback(
-        Output('memory', 'data'),
-        Input('upload-data', 'contents'),
-        State('upload-data', 'filename'),
+        Output('memory', 'data', allow_duplicate=True),
+        Output('job-stage', 'children'),
+        Output('job-progress', 'style'),
+        Output('job-interval', 'disabled'),
+        Input('job-interval', 'n_intervals'),
+        State('memory', 'data'),
         prevent_initial_call = True
 )
-    
-def update_output(contents, filename):
-    if contents is not None:
-        return parse_contents(contents, filename)
+
+@timed
+def poll_job(n_intervals, jsonified_data):
+    '''
+    Function to report the stage reached by the upload processing job, stopping the interval once it is finished.
+
+    Parameters:
+    -----------
+    n_intervals - Number of times the interval has fired.
+    jsonified_data - Saved dictionary with the ID of the job ('job').
+
+    Returns:
+    --------
+    data - JSON string of the job result once it is finished (or of the error if it failed or was cancelled), else no update.
+           The image URLs of the processed dataset are then checked (if DASHBOARD_URL_CHECKS is set).
+    stage - String. Description of the current stage.
+    style - Style of the progress div, hidden once the job is finished.
+    disabled - Boolean. True once the job is finished.
+    '''
+    job_id = json.loads(jsonified_data or '{}').get('job')
+    job = get_job(job_id)
+    hidden = {'display': 'none'}
+    if job is None:
+        if job_id is None:
+            return dash.no_update, '', hidden, True
+        return json.dumps({'error': {'other': 'upload processing job not found'}}), '', hidden, True
+    if job['status'] == 'done':
+        dataset_key = json.loads(job['result']).get('dataset')
+        if URL_CHECKS and dataset_key is not None:
+            check_image_urls(load_dataset(job['result']), dataset_key)
+        return job['result'], '', hidden, True
+    if job['status'] == 'failed':
+        return json.dumps({'error': {'other': job['error']}}), '', hidden, True
+    if job['status'] == 'cancelled':
+        return json.dumps({'error': {'cancelled': job_id}}), '', hidden, True
+    if job['status'] == 'queued':
+        stage = 'Waiting to process upload...'
+    else:
+        stage = f"{JOB_STAGE_LABELS[job['stage']]} ({job['progress']:.0%})..."
+    return dash.no_update, stage, {'margin-top': 5}, False
+
+# Callback to cancel the upload processing job
+@app.callback(
+        Output('job-stage', 'children', allow_duplicate=True),
+        Input('cancel-job', 'n_clicks'),
+        State('memory', 'data'),
+        prevent_initial_call = True
+)
+
+@timed
+def cancel_upload(n_clicks, jsonified_data):
+    '''
+    Function to request the upload processing job to stop, which `poll_job` reports once it has.
+    '''
+    job_id = json.loads(jsonified_data or '{}').get('job')
+    if not n_clicks or job_id is None:
+        raise PreventUpdate
+    cancel_job(job_id)
+    return 'Cancelling...'
+
+# Callback to show the sheets of an uploaded workbook
+# Runs in the browser (assets/dashboard_clientside.js): options from the saved data
+app.clientside_callback(
+        ClientsideFunction(namespace = 'dashboard', function_name = 'set_sheet_picker'),
+        Output('sheet-picker', 'options'),
+        Output('sheet-picker', 'value'),
+        Output('sheet-picker-div', 'style'),
+        Input('memory', 'data')
+)
 
 # Callback to get main div (histogram, pie chart, and image example options)
 @app.callback(
@@ -131,6 +518,7 @@ def update_output(contents, filename):
         prevent_initial_call = True
 )
 
+@timed
 def get_visuals(jsonified_data):
     '''
     Function that usese the processed and saved data to get the main div (histogram, pie chart, and image example options).
@@ -138,50 +526,35 @@ def get_visuals(jsonified_data):
     '''
     # load saved data
     data = json.loads(jsonified_data)
+    if 'job' in data:
+        # still processing, see poll_job
+        raise PreventUpdate
     if 'error' in data:
         return get_error_div(data['error'])
-    dff = pd.read_json(data['processed_df'], orient = 'split')
+    dataset = load_dataset(jsonified_data)
+    if dataset is None:
+        return get_error_div({'expired': data.get('dataset')})
+    profile = dataset['profile']
 
-    # get divs
-    hist_div = get_hist_div(data['mapping'])
-    img_div = get_img_div(dff, data['all_species'], data['images'])
-    children = get_main_div(hist_div, img_div)
+    # get divs, with the lookup data used by the browser-side callbacks
+    hist_div = get_hist_div(profile.mapping)
+    img_div = get_img_div(profile, URL_CHECKS)
+    dataset_info = {'all_species': profile.all_species, 'mapping': profile.mapping}
+    children = get_main_div(hist_div, img_div, dataset_info)
 
     return children
 
 # Distribution Section
 # Callback to update which options are visible (histogram vs map)
-@app.callback(
+# Runs in the browser (assets/dashboard_clientside.js): picks the hist_div or map_div rendered with the main div
+app.clientside_callback(
+        ClientsideFunction(namespace = 'dashboard', function_name = 'update_dist_view'),
         Output('dist-options', 'children'),
         Input('dist-view-btn', 'n_clicks'),
         Input('dist-view-btn', 'children'),
-        Input('memory', 'data')
+        State('dist-layouts', 'data')
 )
 
-def update_dist_view(n_clicks, children, jsonified_data):
-    '''
-    Function to update the upper left distribution options based on selected distribution chart (histogram or map).
-    Activates on click to change, defaults to histogram view.
-
-    Parameters:
-    -----------
-    n_clicks - Number of clicks. 
-    children - Label on button, determins which distribution options to show.
-    jsonified_data - Saved dictionary of DataFrame, species options, and mapping (boolean on lat/lon availability).
-
-    Returns:
-    --------
-    hist_div or map_div - The HTML Div corresponding to the selected distribution figure.
-    '''
-    data = json.loads(jsonified_data)
-    if n_clicks == 0 or n_clicks == None:
-        return get_hist_div(data['mapping'])
-    if n_clicks > 0:
-        if children == "Show Histogram":
-            return get_hist_div(data['mapping'])
-        else:
-            return get_map_div()
-
 # Callback to update the distribution figure (histogram or map)
 @app.callback(
     #dist output
@@ -190,15 +563,20 @@ def update_dist_view(n_clicks, children, jsonified_data):
     Input(component_id='x-variable', component_property='value'),
     #input color_by
     Input(component_id='color-by', component_property='value'),
-    #input sort_by
-    Input(component_id='sort-by', component_property='value'),
+    #sort_by, its changes alone are handled by update_dist_sort
+    State(component_id='sort-by', component_property='value'),
     #button information
     Input(component_id='dist-view-btn', component_property='children'),
     # Saved Data
-    Input('memory', 'data')
+    Input('memory', 'data'),
+    # map view (only reported for binned maps)
+    Input('map-viewport', 'data'),
+    # page of histogram categories
+    Input('hist-page', 'data')
 )
 
-def update_dist_plot(x_var, color_by, sort_by, btn, jsonified_data):
+@timed
+def update_dist_plot(x_var, color_by, sort_by, btn, jsonified_data, viewport = None, page = 0):
     '''
     Function to update distribution figure with either map or histogram based on selections.
     Selection is based on current label of the button ('Map View' or 'Show Histogram'), which updates prior to graph.
@@ -209,20 +587,105 @@ def update_dist_plot(x_var, color_by, sort_by, btn, jsonified_data):
     color_by - User-selected property to color the plot by.
     sort_by - User-selected ordering of bar charts (Alphabetical, Ascending, or Descending).
     btn - Current label of the button ('Map View' or 'Show Histogram').
-    jsonified_data - Saved dictionary of DataFrame, species options, and mapping (boolean on lat/lon availability).
+    jsonified_data - Saved dictionary with the key of the processed dataset (DataFrame, profile, and index).
+    viewport - Dictionary with center 'lat', 'lon', and projection 'scale' of the map view, reported by the browser
+               for maps with too many markers (see components/spatial.py).
+    page - Integer. Page of histogram categories, for variables with more than `HIST_TOP_K` (see make_hist_plot).
 
     Returns: 
     --------
     fig -  Figure returned from appropriate function call: histogram or map of the distribution of the requested variable.
     '''
-    # open dataframe from saved data
-    data = json.loads(jsonified_data)
-    dff = pd.read_json(data['processed_df'], orient = 'split')
+    # get dataframe from saved data
+    dataset = load_dataset(jsonified_data)
+    if dataset is None:
+        raise PreventUpdate
+    dff = dataset['processed_df']
     # get distribution graph based on button value
     if btn == "Show Histogram":
-        return make_map(dff, color_by)
+        return get_figure(dataset.get('key'), make_map, dff, color_by, clean_viewport(viewport))
     else:
-        return make_hist_plot(dff, x_var, color_by, sort_by)
+        return get_figure(dataset.get('key'), make_hist_plot, dff, x_var, color_by, sort_by, page or 0)
+
+# Callback to reorder the histogram when only the sort order changes
+@app.callback(
+    Output('dist-plot', 'figure', allow_duplicate=True),
+    Output('hist-page', 'data', allow_duplicate=True),
+    Input('sort-by', 'value'),
+    State('x-variable', 'value'),
+    State('color-by', 'value'),
+    State('dist-view-btn', 'children'),
+    State('memory', 'data'),
+    State('hist-page', 'data'),
+    prevent_initial_call = True
+)
+
+@timed
+def update_dist_sort(sort_by, x_var, color_by, btn, jsonified_data, page = 0):
+    '''
+    Function to update the histogram for a new sort order. When all categories fit on one page, only their order changes,
+    which is sent as a partial update of the figure instead of a new figure.
+    Otherwise the categories shown change, so the figure is rebuilt from the first page.
+
+    Parameters:
+    -----------
+    sort_by - User-selected ordering of bar charts (Alphabetical, Ascending, or Descending).
+    x_var - User-selected variable to plot distribution.
+    color_by - User-selected property to color the plot by.
+    btn - Current label of the button ('Map View' or 'Show Histogram').
+    jsonified_data - Saved dictionary with the key of the processed dataset (DataFrame, profile, and index).
+    page - Integer. Page of histogram categories shown.
+
+    Returns:
+    --------
+    fig - Patch of the category order, new histogram (first page shown), or no update (page reset, redrawn by update_dist_plot).
+    page - Integer. 0 if the page shown was another one, else no update.
+    '''
+    if btn == "Show Histogram":
+        raise PreventUpdate
+    dataset = load_dataset(jsonified_data)
+    if dataset is None:
+        raise PreventUpdate
+    dff = dataset['processed_df']
+    _, categories, _, n_pages = get_hist_counts(dff, x_var, color_by, sort_by)
+    if n_pages == 1:
+        fig = dash.Patch()
+        fig['layout']['xaxis']['categoryarray'] = categories
+        return fig, dash.no_update
+    if page:
+        return dash.no_update, 0
+    return get_figure(dataset.get('key'), make_hist_plot, dff, x_var, color_by, sort_by, 0), dash.no_update
+
+# Callback saving the map view when it is panned or zoomed, for maps showing markers in view (see make_map)
+# Runs in the browser (assets/dashboard_clientside.js)
+app.clientside_callback(
+        ClientsideFunction(namespace = 'dashboard', function_name = 'set_map_viewport'),
+        Output('map-viewport', 'data'),
+        Input('dist-plot', 'relayoutData'),
+        State('dist-plot', 'figure'),
+        State('map-viewport', 'data'),
+        prevent_initial_call = True
+)
+
+# Callbacks paging through the histogram categories (see make_hist_plot)
+# Run in the browser (assets/dashboard_clientside.js)
+app.clientside_callback(
+        ClientsideFunction(namespace = 'dashboard', function_name = 'set_hist_page'),
+        Output('hist-page', 'data'),
+        Input('hist-prev-btn', 'n_clicks'),
+        Input('hist-next-btn', 'n_clicks'),
+        Input('x-variable', 'value'),
+        State('dist-plot', 'figure'),
+        State('hist-page', 'data'),
+        prevent_initial_call = True
+)
+
+app.clientside_callback(
+        ClientsideFunction(namespace = 'dashboard', function_name = 'set_hist_pager'),
+        Output('hist-pager', 'style'),
+        Output('hist-page-label', 'children'),
+        Input('dist-plot', 'figure')
+)
 
 # Pie Section
 
@@ -235,6 +698,7 @@ def update_dist_plot(x_var, color_by, sort_by, btn, jsonified_data):
     Input('memory', 'data')
 )
 
+@timed
 def update_pie_plot(var, jsonified_data):
     '''
     Updates the pie chart of dataset specimens based on user selection of variable to color by.
@@ -242,52 +706,38 @@ def update_pie_plot(var, jsonified_data):
     Parameters:
     -----------
     var - User-selected categorical variable by which to color.
-    jsonified_data - Saved dictionary of DataFrame, species options, and mapping (boolean on lat/lon availability).
+    jsonified_data - Saved dictionary with the key of the processed dataset (DataFrame, profile, and index).
 
     Returns: 
     --------
     fig - Pie chart figure returned from function call: percentage breakdown of `var` samples in the dataset.
     '''
-    # open dataframe from saved data
-    data = json.loads(jsonified_data)
-    dff = pd.read_json(data['processed_df'], orient = 'split')
-    return make_pie_plot(dff, var)
+    # get dataframe from saved data
+    dataset = load_dataset(jsonified_data)
+    if dataset is None:
+        raise PreventUpdate
+    dff = dataset['processed_df']
+    return get_figure(dataset.get('key'), make_pie_plot, dff, var)
 
 # Image Section
 
 # Callback for Image Species Selection
-@app.callback(
+# Runs in the browser (assets/dashboard_clientside.js): options from the species to subspecies lookup in 'dataset-info'
+app.clientside_callback(
+    ClientsideFunction(namespace = 'dashboard', function_name = 'set_subspecies_options'),
     Output(component_id = 'subspecies-show', component_property= 'options'),
     Input(component_id = 'species-show', component_property = 'value'),
-    Input('memory', 'data')
+    State('dataset-info', 'data')
 )
 
-def set_subspecies_options(selected_species, jsonified_data):
-    ''' 
-    Function to set subspecies options in dropdown based on user-selected species.
-
-    Parameters:
-    -----------
-    jsonified_data - Saved dictionary of DataFrame, species options, and mapping (boolean on lat/lon availability).
-
-    Returns: 
-    --------
-    list of subspecies options based on user-selected species. 
-    '''
-    data = json.loads(jsonified_data)
-    all_species = data['all_species']
-    return [{'label': i, 'value': i} for i in all_species[selected_species]]
-
 # Callback for Image Subspecies Selection
-@app.callback(
+# Runs in the browser (assets/dashboard_clientside.js): selects the first subspecies option
+app.clientside_callback(
+    ClientsideFunction(namespace = 'dashboard', function_name = 'set_subspecies_value'),
     Output(component_id = 'subspecies-show', component_property= 'value'),
     Input(component_id = 'subspecies-show', component_property = 'options')
 )
 
-def set_subspecies_value(available_options):
-    # Collect selected subspecies to display in multi-select dropdown.
-    return available_options[0]['value']
-
 # Image & Display Images Button Callback
 @app.callback(
     Output('image-1', 'children'),
@@ -298,23 +748,28 @@ def set_subspecies_value(available_options):
     State('which-sex', 'value'),
     State('hybrid?', 'value'),
     State('num-images', 'value'),
+    State('img-seed', 'value'),
+    State('img-stratify', 'value'),
     prevent_initial_call = True
 )
 
 # Retrieve selected number of images
-def update_display(n_clicks, jsonified_data, subspecies, view, sex, hybrid, num_images):
+@timed
+def update_display(n_clicks, jsonified_data, subspecies, view, sex, hybrid, num_images, seed = None, stratify = None):
     '''
     Function to retrieve the user-selected number of images adhering to their chosen parameters when the 'Display Images' button is pressed.
     
     Parameters:
     -----------
     n_clicks - Number of times the 'Display Images' button has been pressed.
-    jsonified_data - Saved dictionary of DataFrame, species options, and mapping (boolean on lat/lon availability).
+    jsonified_data - Saved dictionary with the key of the processed dataset (DataFrame, profile, and index).
     subspecies - String. Subspecies of specimen selected by the user.
     view - String. View of specimen selected by the user.
     sex - String. Sex of specimen selected by the user.
     hybrid - String. Hybrid status of specimen selected by the user.
     num_images - Integer. Number of images requested by the user. Default value is 1 (in get_filename).
+    seed - Integer. Seed of the selection entered by the user, None for a new selection.
+    stratify - List, with 'stratify' to spread the images evenly across the selected subspecies, views, and sexes.
     
     Returns:
     --------
@@ -323,15 +778,66 @@ def update_display(n_clicks, jsonified_data, subspecies, view, sex, hybrid, num_
            Returns html header4 "Please make a selection." If number of images isn't specified.
     '''
     if n_clicks > 0 and (view != [] and sex != [] and hybrid != []):
-        # Unpack json for saved dataframe
-        data = json.loads(jsonified_data)
-        dff = pd.read_json(data['processed_df'], orient = 'split')
-        return get_images(dff, subspecies, view, sex, hybrid, num_images)
+        # Get saved dataframe
+        dataset = load_dataset(jsonified_data)
+        if dataset is None:
+            raise PreventUpdate
+        dff = dataset['processed_df']
+        seed = None if seed is None else int(seed)
+        return get_images(dff, subspecies, view, sex, hybrid, num_images, dataset.get('index'),
+                          get_broken_urls if URL_CHECKS else None,
+                          seed, 'stratify' in (stratify or []))
     elif n_clicks == 0:
         return dash.no_update
     else:
         return html.H4("Please make a selection.", 
                     style = {'color': 'MidnightBlue'})
 
+# Callback reporting the background check of image URLs (if DASHBOARD_URL_CHECKS is set)
+@app.callback(
+    Output('url-check-status', 'children'),
+    Output('url-check-interval', 'disabled'),
+    Input('url-check-interval', 'n_intervals'),
+    State('memory', 'data')
+)
+
+@timed
+def update_url_check_status(n_intervals, jsonified_data):
+    '''
+    Function to report the progress of the image URL check, stopping the interval once it is finished.
+
+    Parameters:
+    -----------
+    n_intervals - Number of times the interval has fired.
+    jsonified_data - Saved dictionary with the key of the processed dataset.
+
+    Returns:
+    --------
+    status - String. Progress of the check, or the number of broken links found once it is finished.
+    disabled - Boolean. True once the check is finished (or was not started).
+    '''
+    progress = get_check_progress(json.loads(jsonified_data).get('dataset'))
+    if progress is None:
+        return '', True
+    if not progress['finished']:
+        return f"Checking image links: {progress['checked']} of {progress['total']} checked.", False
+    if progress['broken'] == 0:
+        return f"All {progress['total']} image links are working.", True
+    return f"{progress['broken']} of {progress['total']} image links are broken, they are left out of the samples.", True
+
+# Name callback requests in metrics after their callback function
+set_callback_names(app.callback_map)
+
+# Catalog datasets shared by the workers are loaded with the app (in __main__, once the catalog is set)
+if PRELOAD and __name__ != '__main__':
+    preload_datasets()
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Run the dashboard with the Dash development server.')
+    parser.add_argument('--catalog', help = 'Directory of datasets (CSV, Parquet, or Feather) to pick from, instead of uploading them.')
+    parser.add_argument('--preload', help = 'Catalog datasets to load at start: comma-separated file names, or * for all of them.')
+    args = parser.parse_args()
+    if args.catalog is not None:
+        set_catalog_dir(args.catalog)
+    preload_datasets(args.preload)
     app.run()
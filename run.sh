@@ -1,2 +1,3 @@
 #!/bin/bash
-gunicorn -w ${BACKEND_WORKERS:=4} -b :5000 -t 360 dashboard:server
+# With DASHBOARD_PRELOAD set, the app (and its preloaded datasets) is loaded once, before the workers are forked
+gunicorn ${DASHBOARD_PRELOAD:+--preload} -w ${BACKEND_WORKERS:=4} -b :5000 -t ${BACKEND_TIMEOUT:=120} dashboard:server
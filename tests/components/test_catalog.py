@@ -0,0 +1,47 @@
+import os
+import pandas as pd
+import components.catalog
+from components.catalog import list_catalog, get_catalog_path, get_catalog_key
+from components.store import DatasetStore, get_file_key
+
+
+def make_catalog(tmp_path):
+    catalog_dir = tmp_path / 'catalog'
+    catalog_dir.mkdir()
+    df = pd.DataFrame({'Species': ['melpomene', 'erato'], 'Subspecies': ['rosina_N', 'guarica']})
+    df.to_csv(catalog_dir / 'b.csv', index = False)
+    df.to_parquet(catalog_dir / 'a.parquet')
+    (catalog_dir / 'notes.txt').write_text('not a dataset')
+    (catalog_dir / 'sub.csv').mkdir()
+    return str(catalog_dir)
+
+
+def test_list_catalog(tmp_path):
+    catalog_dir = make_catalog(tmp_path)
+    assert list_catalog(catalog_dir) == ['a.parquet', 'b.csv']
+    assert list_catalog(str(tmp_path / 'missing')) == []
+    assert get_catalog_path('b.csv', catalog_dir) == os.path.join(catalog_dir, 'b.csv')
+    # only listed files are accepted
+    for name in ['notes.txt', '../catalog/b.csv', 'sub.csv', None]:
+        assert get_catalog_path(name, catalog_dir) is None
+
+def test_catalog_key(tmp_path, monkeypatch):
+    catalog_dir = make_catalog(tmp_path)
+    store = DatasetStore(cache_dir = str(tmp_path / 'cache'), ttl = None)
+    path = os.path.join(catalog_dir, 'b.csv')
+    key = get_catalog_key('b.csv', catalog_dir, store)
+    assert key == get_file_key(path, 'b.csv')
+    store.put(key, {'processed_df': pd.read_csv(path)})
+
+    # unchanged file: the recorded key is used without hashing it again
+    monkeypatch.setattr(components.catalog, 'get_file_key', None)
+    assert get_catalog_key('b.csv', catalog_dir, store) == key
+    monkeypatch.undo()
+
+    # modified file gets a new key, the dataset processed from the previous content is removed
+    with open(path, 'a') as file:
+        file.write('erato,notabilis\n')
+    new_key = get_catalog_key('b.csv', catalog_dir, store)
+    assert new_key not in (None, key)
+    assert key not in store
+    assert get_catalog_key('notes.txt', catalog_dir, store) is None
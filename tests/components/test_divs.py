@@ -2,6 +2,7 @@ import json
 import plotly
 import pandas as pd
 from components.divs import get_hist_div, get_map_div, get_img_div
+from components.profile import DatasetProfile, get_profile
 
 def test_get_hist_div():
     # Test for "Show Map View" button
@@ -34,14 +35,14 @@ def test_get_img_div():
     df = pd.DataFrame(data = data)
 
     # Check for format/contents
-    output = get_img_div(df, {'species1': ['subspecies1'], 'species2': ['subspecies2', 'subspecies4']}, True)
+    output = get_img_div(get_profile(df, False, True))
     j_img_div = json.dumps(output, cls = plotly.utils.PlotlyJSONEncoder)
     assert "Display Images" in j_img_div
-    assert '["species1", "species2"]' in j_img_div
+    assert '["Species1", "Species2", "Any"]' in j_img_div
     assert '["ventral", "dorsal"]' in j_img_div
     assert '["male", "female"]' in j_img_div
     assert '["subspecies synonym", "valid subspecies"]' in j_img_div
 
     # Test for no img_urls (img_url = False)
-    output2 = get_img_div(df, None, False)
+    output2 = get_img_div(DatasetProfile(n_rows = 3, columns = list(df.columns), mapping = False, images = False))
     assert output2 == []
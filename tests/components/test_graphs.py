@@ -1,6 +1,7 @@
+import pytest
 import pandas as pd
 from components.query import get_data
-from components.graphs import make_hist_plot, make_map, make_pie_plot
+from components.graphs import get_figure_size, make_hist_plot, get_hist_counts, make_map, make_pie_plot, get_map_markers, get_figure, figure_cache
 
 # Define test data
 df = pd.read_csv("test_data/HCGSD_full_testNA.csv")
@@ -11,15 +12,48 @@ def test_make_hist_plot():
     # Histplot output
     output = make_hist_plot(processed_df, 'Species', 'View', 'alpha')
     assert output['data', 0].type == "histogram"
-    # Check sort by `alpha`
+    # Check sort by `alpha`, on the counts
     output_layout = output['layout', 'xaxis']
-    assert output_layout['categoryorder'] == None
+    assert output_layout['categoryorder'] == 'array'
+    assert list(output_layout['categoryarray']) == sorted(processed_df.Species.unique())
 
     # Check not sort by 'alpha' ('sum ascending')
     output2 = make_hist_plot(processed_df, 'Species', 'View', 'sum ascending')
     assert output2['data', 0].type == "histogram"
     output2_layout = output2['layout', 'xaxis']
-    assert output2_layout['categoryorder'] == 'sum ascending'
+    totals = processed_df.Species.value_counts()
+    assert list(output2_layout['categoryarray']) == sorted(sorted(totals.index), key = totals.get)
+    # Bars add up to the specimens
+    assert sum(sum(trace.y) for trace in output2.data) == len(processed_df)
+
+def test_get_hist_counts():
+    # Top categories by count, the others in an "Other" bucket
+    totals = processed_df.Subspecies.value_counts()
+    # ties in alphabetical order
+    totals = totals[sorted(sorted(totals.index), key = totals.get, reverse = True)]
+    counts, categories, page, n_pages = get_hist_counts(processed_df, 'Subspecies', 'View', 'sum descending', top_k = 3)
+    assert (page, n_pages) == (0, -(-len(totals) // 3))
+    assert categories[:3] == totals.index[:3].tolist()
+    assert categories[3] == f'Other ({len(totals) - 3})'
+    assert counts.groupby('Subspecies')['count'].sum()[categories[3]] == totals[3:].sum()
+    assert counts['count'].sum() == len(processed_df)
+    # Next page, other categories
+    counts, categories, page, n_pages = get_hist_counts(processed_df, 'Subspecies', 'View', 'sum descending', page = 1, top_k = 3)
+    assert page == 1 and categories[:3] == totals.index[3:6].tolist()
+    # Pages past the last are clamped, all categories fit without "Other"
+    counts, categories, page, n_pages = get_hist_counts(processed_df, 'Subspecies', 'View', 'alpha', page = 5, top_k = 100)
+    assert (page, n_pages) == (0, 1)
+    assert categories == sorted(totals.index)
+    # Colored by the plotted variable, counted once per category
+    counts, categories, page, n_pages = get_hist_counts(processed_df, 'Subspecies', 'Subspecies', 'sum descending', top_k = 3)
+    assert list(counts.columns) == ['Subspecies', 'count']
+    assert categories[:3] == totals.index[:3].tolist()
+    assert counts.set_index('Subspecies')['count'][categories[3]] == totals[3:].sum()
+    output = make_hist_plot(processed_df, 'Species', 'Species', 'alpha')
+    assert sum(sum(trace.y) for trace in output.data) == len(processed_df)
+    # Unknown orderings are refused rather than sorted ascending
+    with pytest.raises(ValueError):
+        get_hist_counts(processed_df, 'Subspecies', 'View', 'total descending')
 
 def test_make_map():
     # Map plot output
@@ -29,6 +63,20 @@ def test_make_map():
     #test for uknowns in data and check it's proper type
     assert 'unknown' not in output_data['customdata']
 
+def test_get_map_markers():
+    # One marker per locality and color, counts add up to the mapped specimens
+    mapped_df = processed_df.loc[processed_df['lat-lon'].str.contains('unknown') == False]
+    markers = get_map_markers(mapped_df, "Sex")
+    assert len(markers) == len(mapped_df[['lat-lon', 'Sex']].drop_duplicates())
+    assert markers.Samples.sum() == len(mapped_df)
+    # All markers of a locality share its total
+    totals = markers.groupby('lat-lon').Samples.sum()
+    assert (markers['lat-lon'].map(totals) == markers.Samples_at_locality).all()
+
+    # Map has one point per marker
+    output = make_map(processed_df, "Sex")
+    assert sum(len(trace.lat) for trace in output.data) == len(markers)
+
 def test_make_pie():
     # Pie plot output 
     output = make_pie_plot(processed_df, "Species")
@@ -43,3 +91,39 @@ def test_make_pie():
     assert output2_data.type == "pie"
     # Color by 'Subspecies' has 'Species' added to 'hovertemplate'
     assert output2_data['hovertemplate'] == 'Subspecies=%{label}<br>Species=%{customdata[0]}<extra></extra>'
+
+def test_get_figure():
+    figure_cache.clear()
+    hits, misses = figure_cache.hits, figure_cache.misses
+    output = get_figure('dataset-1', make_pie_plot, processed_df, "Species")
+    assert output['data', 0].type == "pie"
+    # Same dataset and arguments are served from the cache
+    assert get_figure('dataset-1', make_pie_plot, processed_df, "Species") is output
+    assert (figure_cache.hits - hits, figure_cache.misses - misses) == (1, 1)
+    # Different arguments or dataset make a new figure
+    assert get_figure('dataset-1', make_pie_plot, processed_df, "View") is not output
+    assert get_figure('dataset-2', make_pie_plot, processed_df, "Species") is not output
+    assert len(figure_cache) == 3
+    # No dataset key, no caching
+    assert get_figure(None, make_pie_plot, processed_df, "Species") is not output
+    assert len(figure_cache) == 3
+
+def test_make_map_lod(monkeypatch):
+    # Past the marker limit, the map shows grid cells in the reported view
+    monkeypatch.setattr('components.graphs.MAP_MARKER_LIMIT', 2)
+    output = make_map(processed_df, "Species")
+    assert output.layout.meta == {'lod': True}
+    assert 'Samples in cell' in output.data[0].hovertemplate
+    mapped_df = processed_df.loc[processed_df['lat-lon'].str.contains('unknown') == False]
+    assert sum(sum(trace.customdata[:, 0]) for trace in output.data) == len(mapped_df)
+    # A view away from the data shows no markers
+    output = make_map(processed_df, "Species", (-80, 0, 50))
+    assert output.layout.geo.projection.scale == 50
+    assert sum(len(trace.lat) for trace in output.data) == 0
+
+def test_get_figure_size():
+    # Estimated from the data arrays, growing with the points drawn
+    small = make_map(processed_df.iloc[:3], "Species")
+    large = make_map(processed_df, "Species")
+    assert 4096 < get_figure_size(small) < get_figure_size(large)
+    assert get_figure_size(make_pie_plot(processed_df, "Species")) > 4096
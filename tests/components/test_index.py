@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+from components.index import build_index, extend_index
+
+# Random dataset to compare index results against DataFrame filters
+rng = np.random.default_rng(0)
+n_rows = 500
+df = pd.DataFrame({
+    'Species': rng.choice(['melpomene', 'erato', 'unknown'], n_rows),
+    'Subspecies': rng.choice(['nanna', 'guarica', 'rosina_N', 'unknown'], n_rows),
+    'View': rng.choice(['dorsal', 'ventral'], n_rows),
+    'Sex': rng.choice(['male', 'female', 'unknown'], n_rows),
+    'hybrid_stat': rng.choice(['valid subspecies', 'subspecies synonym'], n_rows),
+    'Image_filename': rng.choice(['image.png', 'unknown'], n_rows, p = [0.9, 0.1]),
+    'file_url': rng.choice(['https://example.com/', 'unknown'], n_rows, p = [0.9, 0.1])
+}).astype({'Species': 'category', 'View': 'category'})
+index = build_index(df)
+
+
+def test_build_index():
+    assert index['n_rows'] == n_rows
+    # Groups of rows with images, and count of rows without, by combination of filter values
+    key = ('erato', 'nanna', 'dorsal', 'male', 'valid subspecies')
+    rows = (df.Species == 'erato') & (df.Subspecies == 'nanna') & (df.View == 'dorsal') & (df.Sex == 'male') & (df.hybrid_stat == 'valid subspecies')
+    has_image = (df.Image_filename != 'unknown') & (df.file_url != 'unknown')
+    assert np.array_equal(index['groups'][key], np.flatnonzero(rows & has_image))
+    assert index['missing'][key] == (rows & ~has_image).sum()
+    assert np.array_equal(index['images'], np.flatnonzero((df.Image_filename != 'unknown') & (df.file_url != 'unknown')))
+
+
+def test_extend_index():
+    # Index of appended rows matches the index built from all rows
+    extended = extend_index(build_index(df.iloc[:300]), df.iloc[300:])
+    assert extended['n_rows'] == n_rows
+    assert np.array_equal(extended['images'], index['images'])
+    assert extended['groups'].keys() == index['groups'].keys()
+    for key, ids in index['groups'].items():
+        assert np.array_equal(extended['groups'][key], ids)
+        assert extended['missing'][key] == index['missing'][key]
@@ -0,0 +1,105 @@
+import io
+import gzip
+import zipfile
+import openpyxl
+import pytest
+import zstandard
+import pandas as pd
+import components.ingest
+from components.ingest import get_sheet_names, read_workbook, read_header, read_data, is_supported_file, DATA_COLUMNS
+
+
+def make_workbook():
+    # Workbook with an unused column, an empty cell, and a second sheet
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'Data'
+    sheet.append(['NHM_Specimen', 'Species', 'Subspecies', 'lat'])
+    sheet.append([1, 'melpomene', 'rosina_N', 10.75])
+    sheet.append([2, 'erato', None, -1.58])
+    other = workbook.create_sheet('Notes')
+    other.append(['Species', 'Subspecies'])
+    other.append(['erato', 'guarica'])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture(params = ['calamine', 'openpyxl'])
+def backend(request, monkeypatch):
+    if request.param == 'openpyxl':
+        monkeypatch.setattr(components.ingest, 'CalamineWorkbook', None)
+    elif components.ingest.CalamineWorkbook is None:
+        pytest.skip('python-calamine not installed')
+    return request.param
+
+
+def test_read_workbook(backend):
+    content = make_workbook()
+    assert get_sheet_names(io.BytesIO(content)) == ['Data', 'Notes']
+    df = read_workbook(io.BytesIO(content), columns = DATA_COLUMNS)
+    assert list(df.columns) == ['Species', 'Subspecies', 'lat']
+    assert df['Species'].tolist() == ['melpomene', 'erato']
+    assert df['Subspecies'].isna().tolist() == [False, True]
+    assert df['lat'].tolist() == [10.75, -1.58]
+    assert read_workbook(io.BytesIO(content), 'Notes').to_dict('list') == {'Species': ['erato'], 'Subspecies': ['guarica']}
+
+
+def test_read_data_workbook(tmp_path):
+    # Workbooks are read in a separate process, from a path or the uploaded bytes
+    path = tmp_path / 'data.xlsx'
+    path.write_bytes(make_workbook())
+    assert read_data(str(path), 'data.xlsx', 'Notes')['Subspecies'].tolist() == ['guarica']
+    assert len(read_data(io.BytesIO(make_workbook()), 'data.xlsx')) == 2
+
+def make_zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression = zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+def test_read_data_formats():
+    # Compressed, archived, and columnar files give the same DataFrame as the CSV
+    df = pd.read_csv('test_data/HCGSD_testNA.csv')
+    with open('test_data/HCGSD_testNA.csv', 'rb') as file:
+        content = file.read()
+    parquet, feather = io.BytesIO(), io.BytesIO()
+    df.to_parquet(parquet)
+    df.to_feather(feather)
+    uploads = {
+        'data.csv.gz': gzip.compress(content),
+        'data.CSV.ZST': zstandard.ZstdCompressor().compress(content),
+        'data.zip': make_zip({'__MACOSX/._data.csv': b'', 'folder/data.csv': content}),
+        'data.parquet': parquet.getvalue(),
+        'data.feather': feather.getvalue(),
+        'columnar.zip': make_zip({'data.parquet': parquet.getvalue(), 'notes.txt': b'notes'})
+    }
+    for filename, upload in uploads.items():
+        pd.testing.assert_frame_equal(read_data(io.BytesIO(upload), filename), df)
+        # header only, then the rows of the projected columns from the same (rewound) file
+        source = io.BytesIO(upload)
+        assert read_header(source, filename) == df.columns.tolist()
+        projected = read_data(source, filename, columns = ['Species', 'lat'])
+        assert projected.columns.tolist() == ['Species', 'lat']
+        assert projected['Species'].tolist() == df['Species'].tolist()
+
+def test_read_data_errors():
+    assert not is_supported_file('data.txt') and not is_supported_file('csv_notes.txt')
+    with pytest.raises(ValueError):
+        read_data(io.BytesIO(b''), 'data.txt')
+    # archives hold a single data file
+    with pytest.raises(ValueError):
+        read_data(io.BytesIO(make_zip({'a.csv': b'Species', 'b.csv': b'Species'})), 'data.zip')
+    with pytest.raises(ValueError):
+        read_data(io.BytesIO(make_zip({'notes.txt': b'notes'})), 'data.zip')
+
+def test_read_data_dtypes():
+    # Text columns are kept as strings (no type inference), coordinates are numbers
+    content = b'Species,View,Sex,lat,extra\nerato,1,,10.5,x\nmelpomene,2,male,,y\n'
+    columns = [column for column in DATA_COLUMNS if column in read_header(io.BytesIO(content), 'data.csv')]
+    df = read_data(io.BytesIO(content), 'data.csv', columns = columns)
+    assert df.columns.tolist() == ['Species', 'View', 'Sex', 'lat']
+    assert df['View'].tolist() == ['1', '2']
+    assert df['Sex'].isna().tolist() == [True, False]
+    assert df['lat'].dtype == 'float64'
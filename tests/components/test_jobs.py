@@ -0,0 +1,70 @@
+import os
+import time
+import components.jobs
+from components.jobs import submit_job, get_job, cancel_job, report_progress, run_job, prune_jobs, STAGES
+
+
+def process(path):
+    # Job reporting each stage, waiting at 'validate' until `path` exists
+    report_progress('validate')
+    while not path.exists():
+        time.sleep(0.01)
+    for stage in STAGES[2:]:
+        report_progress(stage)
+    return path.read_text()
+
+def fail():
+    raise ValueError('bad file')
+
+def wait(job_id, job_dir, statuses, timeout = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = get_job(job_id, job_dir)
+        if job['status'] in statuses or job.get('stage') in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job not in {statuses}')
+
+
+def test_job_progress(tmp_path):
+    job_dir = str(tmp_path / 'jobs')
+    job_id = submit_job(process, tmp_path / 'go', job_dir = job_dir)
+    job = wait(job_id, job_dir, {'validate'})
+    assert job['status'] == 'running'
+    assert job['progress'] == STAGES.index('validate') / len(STAGES)
+    (tmp_path / 'go').write_text('result')
+    job = wait(job_id, job_dir, {'done'})
+    assert (job['result'], job['progress']) == ('result', 1)
+    # only the server's user can read the states
+    assert os.stat(job_dir).st_mode & 0o777 == 0o700
+
+def test_cancel_job(tmp_path):
+    # Job stops at the stage following the cancel request
+    job_dir = str(tmp_path / 'jobs')
+    job_id = submit_job(process, tmp_path / 'go', job_dir = job_dir)
+    wait(job_id, job_dir, {'validate'})
+    cancel_job(job_id, job_dir)
+    (tmp_path / 'go').write_text('result')
+    job = wait(job_id, job_dir, {'done', 'cancelled'})
+    assert job['status'] == 'cancelled'
+    assert 'result' not in job
+
+def test_failed_job(tmp_path):
+    # Run in this process, errors are recorded in the job state
+    job_dir = str(tmp_path)
+    run_job('failing', job_dir, fail, ())
+    assert get_job('failing', job_dir)['status'] == 'failed'
+    assert get_job('failing', job_dir)['error'] == 'bad file'
+    # outside of jobs, progress is not reported
+    report_progress('parse')
+    assert get_job('../failing', job_dir) is None
+    assert get_job('missing', job_dir) is None
+
+def test_prune_jobs(tmp_path, monkeypatch):
+    job_dir = str(tmp_path)
+    run_job('old', job_dir, fail, ())
+    prune_jobs(job_dir)
+    assert get_job('old', job_dir) is not None
+    monkeypatch.setattr(components.jobs, 'JOB_TTL', -1)
+    prune_jobs(job_dir)
+    assert get_job('old', job_dir) is None
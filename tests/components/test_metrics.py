@@ -0,0 +1,57 @@
+import json
+import pytest
+from flask import Flask, request
+import components.metrics
+from components.metrics import metrics_bp, registry, timed
+
+
+@timed
+def make_plot(fail):
+    if fail:
+        raise ValueError('bad plot')
+    return {'data': []}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    registry.clear()
+    monkeypatch.setitem(components.metrics.callback_names, 'plot.figure', 'update_plot')
+    app = Flask(__name__)
+    app.register_blueprint(metrics_bp)
+
+    # stand-in for the Dash callback route
+    @app.route('/_dash-update-component', methods = ['POST'])
+    def update_component():
+        return json.dumps(make_plot(request.get_json().get('fail', False)))
+
+    return app.test_client()
+
+
+def test_callback_metrics(client):
+    assert client.post('/_dash-update-component', json = {'output': 'plot.figure'}).status_code == 200
+    assert client.post('/_dash-update-component', json = {'output': 'plot.figure', 'fail': True}).status_code == 500
+    text = client.get('/metrics').get_data(as_text = True)
+    assert 'dashboard_callback_duration_seconds_count{callback="update_plot"} 2' in text
+    assert 'dashboard_callback_response_bytes_bucket{callback="update_plot",le="+Inf"} 2' in text
+    assert 'dashboard_callback_errors_total{callback="update_plot",status="500"} 1' in text
+    assert 'dashboard_stage_duration_seconds_count{stage="make_plot"} 2' in text
+    assert 'dashboard_stage_errors_total{stage="make_plot"} 1' in text
+
+
+def test_timing_log(client, tmp_path, monkeypatch):
+    log_path = tmp_path / 'timing.log'
+    monkeypatch.setattr(components.metrics, 'TIMING_LOG', str(log_path))
+    client.post('/_dash-update-component', json = {'output': 'plot.figure'})
+    record = json.loads(log_path.read_text())
+    assert record['callback'] == 'update_plot'
+    assert record['status'] == 200
+    assert [stage for stage, seconds in record['stages']] == ['make_plot']
+
+
+def test_merge_workers(client, tmp_path, monkeypatch):
+    # metrics saved by another worker are added to this worker's
+    monkeypatch.setattr(components.metrics, 'METRICS_DIR', str(tmp_path))
+    client.post('/_dash-update-component', json = {'output': 'plot.figure'})
+    (tmp_path / 'metrics-1.json').write_text(json.dumps(registry.snapshot()))
+    text = client.get('/metrics').get_data(as_text = True)
+    assert 'dashboard_callback_duration_seconds_count{callback="update_plot"} 2' in text
@@ -0,0 +1,43 @@
+import pandas as pd
+from components.query import get_data, append_data
+from components.profile import check_features, get_profile, update_profile
+
+
+def test_check_features():
+    all_features = ['Species', 'Subspecies', 'View', 'Sex', 'hybrid_stat', 'lat', 'lon', 'file_url', 'Image_filename']
+    assert check_features(all_features + ['locality']) == (all_features, True, True, None)
+    # No lat/lon or image urls: no map or images
+    assert check_features(all_features[:6]) == (all_features[:6], False, False, None)
+    # Image filename required with image urls
+    assert check_features(all_features[:-1])[3] == 'Image_filename'
+    # Missing required column
+    assert check_features(all_features[1:])[3] == 'Species'
+
+
+def test_get_profile():
+    df = pd.read_csv("test_data/HCGSD_full_testNA.csv")
+    features = ['Species', 'Subspecies', 'View', 'Sex', 'hybrid_stat', 'lat', 'lon', 'file_url', 'Image_filename']
+    null_counts = df[features].isna().sum().to_dict()
+    processed_df, _ = get_data(df, True, list(features))
+    profile = get_profile(processed_df, True, True, null_counts)
+
+    assert profile.n_rows == len(df)
+    assert profile.columns == list(processed_df.columns)
+    for feature in ['Species', 'Subspecies', 'View', 'Sex', 'hybrid_stat']:
+        assert profile.facets[feature] == list(processed_df[feature].unique())
+    assert profile.all_species['Any'][1:] == list(processed_df.Subspecies.unique())
+    assert profile.null_counts['Sex'] == df.Sex.isna().sum()
+    # Unknowns include the filled nulls
+    assert profile.unknown_counts['Sex'] == (processed_df.Sex == 'unknown').sum() >= profile.null_counts['Sex']
+
+def test_update_profile():
+    # Profile updated with appended rows matches the profile of all rows
+    df = pd.read_csv("test_data/HCGSD_full_testNA.csv")
+    features = ['Species', 'Subspecies', 'View', 'Sex', 'hybrid_stat', 'lat', 'lon', 'file_url', 'Image_filename']
+    old_rows, new_rows = df.iloc[:6], df.iloc[6:].reset_index(drop = True)
+    old_df, _ = get_data(old_rows, True, list(features))
+    new_df, _ = get_data(new_rows, True, list(features))
+    profile = update_profile(get_profile(old_df, True, True, old_rows[features].isna().sum().to_dict()),
+                             append_data(old_df, new_df), new_df, new_rows[features].isna().sum().to_dict())
+    processed_df, _ = get_data(df, True, list(features))
+    assert profile == get_profile(processed_df, True, True, df[features].isna().sum().to_dict())
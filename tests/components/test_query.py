@@ -1,7 +1,21 @@
+import glob
 import unittest
 from unittest.mock import patch
 import pandas as pd
-from components.query import get_species_options, get_data, get_filenames, get_images
+from components.query import (get_species_options, get_data, get_filenames, get_images, append_data, merge_species_options,
+                              LOCALITY_FEATURES)
+
+FEATURES = ['Species', 'Subspecies', 'View', 'Sex', 'hybrid_stat', 'lat', 'lon', 'file_url', 'Image_filename']
+
+def get_locality_columns_reference(df):
+    # Original per-row implementation of the locality columns, kept to check get_data against
+    df = df.copy()
+    for lat_lon in df['lat-lon']:
+        species_list = ['{}'.format(i) for i in df.loc[df['lat-lon'] == lat_lon]['Species'].unique()]
+        subspecies_list = ['{}'.format(i) for i in df.loc[df['lat-lon'] == lat_lon]['Subspecies'].unique()]
+        df.loc[df['lat-lon'] == lat_lon, "Species_at_locality"] = ", ".join(species_list)
+        df.loc[df['lat-lon'] == lat_lon, "Subspecies_at_locality"] = ", ".join(subspecies_list)
+    return df
 
 
 class TestQuery(unittest.TestCase):
@@ -44,6 +58,9 @@ class TestQuery(unittest.TestCase):
         self.assertEqual(result_df["Species_at_locality"].tolist(), ['melpomene', 'melpomene, erato', 'melpomene, erato', 'melpomene', 'melpomene, erato', 'species3'])
         self.assertEqual(result_df["Subspecies_at_locality"].tolist(), ['schunkei', 'nanna, erato, guarica', 'nanna, erato, guarica', 'rosina_N', 'nanna, erato, guarica', 'unknown'])
         self.assertEqual(result_list, cat_list)
+        # Compact types: categoricals for repeated values, numbers for lat/lon
+        self.assertEqual(result_df['Subspecies_at_locality'].dtype, 'category')
+        self.assertEqual(result_df['lat'].dtype, 'float64')
 
         # Test with mapping = False (no location data)
         df2 = pd.DataFrame(data = {key: data[key] for key in ['Species', 'Subspecies']})
@@ -54,6 +71,44 @@ class TestQuery(unittest.TestCase):
         self.assertEqual(result_df2["Subspecies"].tolist(), ['schunkei', 'nanna', 'erato', 'rosina_N', 'guarica', 'unknown'])
         self.assertEqual(result2_list, cat_list)
 
+    def test_append_data(self):
+        # Appending rows gives the DataFrame processed from all rows, on all test datasets
+        for filepath in sorted(glob.glob("test_data/*.csv")):
+            df = pd.read_csv(filepath)
+            features = [feature for feature in FEATURES if feature in df.columns]
+            mapping = 'lat' in df.columns and 'lon' in df.columns
+            cut = len(df) * 2 // 3
+            old_df, _ = get_data(df.iloc[:cut], mapping, list(features))
+            new_df, _ = get_data(df.iloc[cut:].reset_index(drop = True), mapping, list(features))
+            expected_df, _ = get_data(df, mapping, list(features))
+            result_df = append_data(old_df, new_df)
+            # categories of the old rows come first (locality aggregates of the new rows' localities are replaced)
+            for feature in expected_df.columns:
+                if expected_df[feature].dtype == 'category' and feature not in LOCALITY_FEATURES:
+                    self.assertEqual(result_df[feature].dtype, 'category')
+                    self.assertEqual(list(result_df[feature].cat.categories[:len(old_df[feature].cat.categories)]),
+                                     list(old_df[feature].cat.categories))
+            pd.testing.assert_frame_equal(result_df.astype(object), expected_df.astype(object))
+
+    def test_merge_species_options(self):
+        old = get_species_options(pd.DataFrame({'Species': ['melpomene', 'erato'], 'Subspecies': ['nanna', 'guarica']}))
+        new = get_species_options(pd.DataFrame({'Species': ['erato', 'sara'], 'Subspecies': ['notabilis', 'sara']}))
+        merged = merge_species_options(old, new)
+        self.assertEqual(list(merged.keys()), ['Melpomene', 'Erato', 'Sara', 'Any'])
+        self.assertEqual(merged['Erato'], ['Any-Erato', 'guarica', 'notabilis'])
+        self.assertEqual(merged['Any'], ['Any', 'nanna', 'guarica', 'notabilis', 'sara'])
+
+    def test_get_data_locality_regression(self):
+        # Locality columns match the original implementation on all test datasets with lat/lon
+        for filepath in sorted(glob.glob("test_data/*.csv")):
+            df = pd.read_csv(filepath)
+            if 'lat' not in df.columns or 'lon' not in df.columns:
+                continue
+            features = [feature for feature in FEATURES if feature in df.columns]
+            result_df, _ = get_data(df, True, features)
+            expected_df = get_locality_columns_reference(result_df.drop(columns = ["Species_at_locality", "Subspecies_at_locality"]).astype(object))
+            pd.testing.assert_frame_equal(result_df.astype(object), expected_df[result_df.columns], obj = filepath)
+
     def test_get_filenames(self):
         BASE_URL_V = "https://github.com/Imageomics/dashboard-prototype/raw/main/test_data/images/ventral_images/"
         BASE_URL_D = "https://github.com/Imageomics/dashboard-prototype/raw/main/test_data/images/dorsal_images/"
@@ -126,10 +181,10 @@ class TestQuery(unittest.TestCase):
                       ]]
         # Test for proper filenames and filepaths
         for i in range(0, 4):
-            result, paths = get_filenames(df, test_subspecies[i], test_view[i], test_sex[i], test_hybrid[i], test_nums[i])
+            result, paths, limited = get_filenames(df, test_subspecies[i], test_view[i], test_sex[i], test_hybrid[i], test_nums[i])
             self.assertEqual(result, [test_images[i]])
             self.assertEqual(paths, [test_paths[i]])
-        result, paths = get_filenames(df, test_subspecies[4], test_view[4], test_sex[4], test_hybrid[4], test_nums[4])
+        result, paths, limited = get_filenames(df, test_subspecies[4], test_view[4], test_sex[4], test_hybrid[4], test_nums[4])
         #check lists have same elements
         self.assertCountEqual(result, test_images[4])
         self.assertCountEqual(paths, test_paths[4])
@@ -138,7 +193,7 @@ class TestQuery(unittest.TestCase):
     def test_get_images(self, mock_filenames):
         filenames = ['filename' + str(i) for i in range(5)]
         filepaths = ['filepath' + str(i) for i in range(5)]
-        mock_filenames.return_value = filenames, filepaths
+        mock_filenames.return_value = filenames, filepaths, False
         result = get_images(df = None, subspecies = None, view = None, sex = None, hybrid = None, num_images = 5)
         self.assertEqual(len(result), 5)
         self.assertEqual([result[i].src for i in range(5)], [filepaths[i] + '/' + filenames[i] for i in range(5)])
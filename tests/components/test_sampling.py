@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+from components.index import build_index
+from components.sampling import MAX_ROUNDS, MAX_BATCH_FACTOR, select_groups, sample_images, allocate
+
+# Random dataset to compare samples against DataFrame filters
+rng = np.random.default_rng(0)
+n_rows = 2000
+df = pd.DataFrame({
+    'Species': rng.choice(['melpomene', 'erato'], n_rows),
+    'Subspecies': rng.choice(['nanna', 'guarica', 'rosina_N'], n_rows, p = [0.9, 0.08, 0.02]),
+    'View': rng.choice(['dorsal', 'ventral'], n_rows),
+    'Sex': rng.choice(['male', 'female', 'unknown'], n_rows),
+    'hybrid_stat': rng.choice(['valid subspecies', 'subspecies synonym'], n_rows),
+    'Image_filename': rng.choice(['image.png', 'unknown'], n_rows, p = [0.9, 0.1]),
+    'file_url': rng.choice(['https://example.com/', 'unknown'], n_rows, p = [0.9, 0.1])
+})
+index = build_index(df)
+filters = {'Subspecies': ['nanna', 'rosina_N'], 'View': ['dorsal'], 'Sex': ['male', 'female'], 'hybrid_stat': ['valid subspecies']}
+mask = np.ones(n_rows, dtype = bool)
+for feature, values in filters.items():
+    mask &= df[feature].isin(values).to_numpy()
+has_image = ((df.Image_filename != 'unknown') & (df.file_url != 'unknown')).to_numpy()
+
+
+def test_select_groups():
+    # Rows of the groups matching filters are the rows matching them
+    filters_list = [
+        filters,
+        {'Species': ['erato'], 'View': ['dorsal', 'ventral'], 'Sex': ['female', 'unknown'], 'hybrid_stat': ['valid subspecies', 'subspecies synonym']},
+        {'View': ['dorsal', 'ventral'], 'Sex': ['male', 'female', 'unknown']},
+        {'Subspecies': ['not in data'], 'View': ['dorsal']},
+        {'Subspecies': [], 'View': ['dorsal']},
+    ]
+    for selection in filters_list:
+        rows = np.ones(n_rows, dtype = bool)
+        for feature, values in selection.items():
+            rows &= df[feature].isin(values).to_numpy()
+        keys = select_groups(index, selection)
+        ids = np.sort(np.concatenate([index['groups'][key] for key in keys] + [np.array([], dtype = np.int32)]))
+        assert np.array_equal(ids, np.flatnonzero(rows & has_image))
+        assert sum(index['missing'][key] for key in keys) == (rows & ~has_image).sum()
+
+def test_sample_images():
+    ids, n_candidates, n_skipped = sample_images(index, filters, 20)
+    # Distinct matching rows with images, candidates and skipped rows counted from the groups
+    assert len(ids) == len(set(ids)) == 20
+    assert mask[ids].all() and has_image[ids].all()
+    assert n_candidates == (mask & has_image).sum()
+    assert n_skipped == (mask & ~has_image).sum()
+    # No more than available
+    ids, n_candidates, _ = sample_images(index, filters, 10**6)
+    assert sorted(ids) == np.flatnonzero(mask & has_image).tolist()
+    # No match
+    ids, n_candidates, n_skipped = sample_images(index, {'Subspecies': ['not in data']}, 5)
+    assert (len(ids), n_candidates, n_skipped) == (0, 0, 0)
+
+def test_sample_images_seed():
+    # Same seed, same images
+    assert np.array_equal(sample_images(index, filters, 10, seed = 3)[0], sample_images(index, filters, 10, seed = 3)[0])
+    assert not np.array_equal(sample_images(index, filters, 10, seed = 3)[0], sample_images(index, filters, 10, seed = 4)[0])
+
+def test_sample_images_stratify():
+    # Each selected subspecies and sex gets an even share of the images, up to what it has
+    available = df[mask & has_image].groupby(['Subspecies', 'Sex']).size()
+    assert available[('rosina_N', 'female')] == 1 and ('rosina_N', 'male') not in available
+    ids, _, _ = sample_images(index, filters, 12, seed = 0, stratify = True)
+    strata = df.iloc[ids].groupby(['Subspecies', 'Sex']).size()
+    assert len(ids) == 12
+    assert strata[('rosina_N', 'female')] == 1
+    assert sorted([strata[('nanna', 'female')], strata[('nanna', 'male')]]) == [5, 6]
+
+def test_sample_images_accept():
+    # Rejected rows are not selected
+    accept = lambda ids: ids % 2 == 0
+    ids, _, _ = sample_images(index, filters, 15, seed = 0, accept = accept)
+    assert len(ids) == 15 and (ids % 2 == 0).all()
+    # When most are rejected, a bounded number of candidates is checked, fewer are returned
+    checked = []
+    def accept_few(ids):
+        checked.append(len(ids))
+        return ids % 50 == 0
+    ids, n_candidates, _ = sample_images(index, filters, 5, seed = 0, accept = accept_few)
+    assert len(checked) <= MAX_ROUNDS and max(checked) <= MAX_BATCH_FACTOR * 5
+    assert len(ids) < 5 and (ids % 50 == 0).all()
+
+def test_allocate():
+    rng = np.random.default_rng(0)
+    assert allocate([100, 100, 100], 9, rng).tolist() == [3, 3, 3]
+    assert allocate([1, 100, 100], 9, rng).tolist() == [1, 4, 4]
+    assert allocate([1, 2, 3], 10, rng).tolist() == [1, 2, 3]
+    assert sorted(allocate([50, 50], 5, rng).tolist()) == [2, 3]
@@ -0,0 +1,27 @@
+import pandas as pd
+import pytest
+from components.serialize import serialize_df, deserialize_df
+
+df = pd.DataFrame({'Species': ['melpomene', 'erato', 'erato'],
+                   'lat': [10.75, -1.58, 4.35],
+                   'Samples_at_locality': [1, 2, 2]})
+
+
+@pytest.mark.parametrize("format", ['arrow', 'parquet', 'json'])
+def test_round_trip(format):
+    used_format, data = serialize_df(df, format)
+    assert used_format == format
+    pd.testing.assert_frame_equal(deserialize_df(used_format, data), df)
+
+
+def test_json_fallback():
+    # Column mixing numbers and strings can't be stored by Arrow, falls back to JSON
+    mixed_df = df.assign(lat = [10.75, 'unknown', 4.35])
+    used_format, data = serialize_df(mixed_df, 'arrow')
+    assert used_format == 'json'
+    assert deserialize_df(used_format, data)['lat'].tolist() == [10.75, 'unknown', 4.35]
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        serialize_df(df, 'csv')
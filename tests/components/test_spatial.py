@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+from components.spatial import get_cell_size, bin_markers, get_viewport, clean_viewport, in_viewport
+
+# Random markers (as from graphs.get_map_markers) to compare binning against DataFrame groupby
+rng = np.random.default_rng(0)
+n_markers = 1000
+markers = pd.DataFrame({
+    'lat': np.round(rng.uniform(-20, 20, n_markers), 2),
+    'lon': np.round(rng.uniform(-90, -40, n_markers), 2),
+    'Species': rng.choice(['melpomene', 'erato'], n_markers),
+    'Samples': rng.integers(1, 50, n_markers)
+})
+markers['lat-lon'] = markers.lat.astype(str) + '|' + markers.lon.astype(str)
+
+
+def test_bin_markers():
+    bins = bin_markers(markers, 'Species', 10)
+    cells = markers.assign(row = np.floor((markers.lat + 90) / 10), col = np.floor((markers.lon + 180) / 10))
+    grouped = cells.groupby(['row', 'col'])
+    assert len(bins) == grouped.ngroups
+    assert bins.Samples.sum() == markers.Samples.sum()
+    assert sorted(bins.Localities) == sorted(grouped['lat-lon'].nunique())
+    # Dominant value of each cell has the most samples in it
+    counts = cells.groupby(['row', 'col', 'Species']).Samples.sum().unstack(fill_value = 0)
+    assert sorted(zip(bins.Samples, bins.Share)) == sorted(zip(counts.sum(axis = 1), np.round(counts.max(axis = 1) / counts.sum(axis = 1), 3)))
+    # Cell positions lie within the data
+    assert bins.lat.between(-20, 20).all() and bins.lon.between(-90, -40).all()
+
+def test_get_cell_size():
+    # Finest level within the bin limit
+    size = get_cell_size(markers.lat, markers.lon, max_bins = 100)
+    assert len(bin_markers(markers, 'Species', size)) <= 100
+    assert size < 20
+
+def test_viewport():
+    lat, lon, scale = get_viewport(markers)
+    assert -20 <= lat <= 20 and -90 <= lon <= -40 and scale > 1
+    assert len(in_viewport(markers, (lat, lon, scale))) == n_markers
+    # Zoomed-in view only keeps nearby markers
+    zoomed = in_viewport(markers, (0, -65, 20), margin = 0)
+    assert zoomed.lat.abs().le(4.5).all() and (zoomed.lon + 65).abs().le(9).all()
+    # Views across the antimeridian
+    assert len(in_viewport(pd.DataFrame({'lat': [0], 'lon': [179.5]}), (0, -179.5, 100))) == 1
+
+def test_clean_viewport():
+    assert clean_viewport(None) is None
+    assert clean_viewport({'lat': 'a', 'lon': 0, 'scale': 1}) is None
+    assert clean_viewport({'lat': 0, 'lon': 0, 'scale': 0}) is None
+    # Nearby views are rounded to the same one
+    assert clean_viewport({'lat': 10.01, 'lon': -60.02, 'scale': 4}) == clean_viewport({'lat': 10.02, 'lon': -60.01, 'scale': 4})
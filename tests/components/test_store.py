@@ -0,0 +1,106 @@
+import os
+import time
+import pytest
+import numpy as np
+import pandas as pd
+from components.cache import LRUCache
+from components.store import DatasetStore, get_dataset_key
+from components.profile import get_profile
+from components.index import build_index
+
+
+def make_dataset(n_rows):
+    return {'processed_df': pd.DataFrame({'Species': ['melpomene'] * n_rows}),
+            'all_species': {'Melpomene': ['Any-Melpomene']},
+            'mapping': False,
+            'images': False}
+
+
+def test_lru_cache_eviction():
+    cache = LRUCache(max_items = 2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    # use 'a' so 'b' is least recently used
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+    # size bound evicts oldest entries, oversized values are not stored
+    sized = LRUCache(max_items = 10, max_bytes = 10, sizeof = len)
+    sized.put('x', 'aaaaaa')
+    sized.put('y', 'bbbbbb')
+    assert 'x' not in sized and sized.get('y') == 'bbbbbb'
+    sized.put('z', 'c' * 11)
+    assert 'z' not in sized
+    assert sized.total_bytes == 6
+
+
+def test_lru_cache_ttl():
+    cache = LRUCache(ttl = 0.01)
+    cache.put('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_dataset_store(tmp_path):
+    store = DatasetStore(cache_dir = str(tmp_path), max_items = 1)
+    key1 = get_dataset_key(b'Species\nmelpomene\n', 'one.csv')
+    key2 = get_dataset_key(b'Species\nmelpomene\n', 'two.csv')
+    assert key1 != key2
+    store.put(key1, make_dataset(3))
+    store.put(key2, make_dataset(5))
+
+    # key1 was evicted from memory, but is reloaded from the cache directory
+    assert key1 not in store.memory
+    assert len(store.get(key1)['processed_df']) == 3
+    # a second store (e.g., another worker) resolves the same key
+    other = DatasetStore(cache_dir = str(tmp_path))
+    assert len(other.get(key2)['processed_df']) == 5
+
+    # DataFrame is persisted in its own file (Arrow IPC by default)
+    assert (tmp_path / (key2 + '.arrow')).exists()
+
+    # unknown and malformed keys resolve to None
+    assert store.get('0' * 64) is None
+    assert store.get('../' + key1) is None
+
+def test_dataset_store_pin(tmp_path):
+    store = DatasetStore(cache_dir = str(tmp_path), max_items = 1)
+    key1 = get_dataset_key(b'Species\nmelpomene\n', 'one.csv')
+    key2 = get_dataset_key(b'Species\nmelpomene\n', 'two.csv')
+    store.put(key1, make_dataset(3))
+    pinned = store.pin(key1)
+    # pinned dataset stays in memory, out of the LRU bounds
+    store.put(key2, make_dataset(5))
+    assert len(store.memory) == 1
+    assert store.get(key1) is pinned
+    store.remove(key1)
+    assert key1 not in store
+    assert store.pin(key1) is None
+
+def test_dataset_store_files(tmp_path, monkeypatch):
+    # Profile and index are persisted without pickle, and read back as stored
+    df = pd.DataFrame({'Species': ['erato', 'melpomene', 'erato'], 'Subspecies': ['guarica', 'nanna', 'guarica'],
+                       'View': ['dorsal', 'ventral', 'dorsal'], 'Sex': ['male', 'female', 'male'],
+                       'hybrid_stat': ['valid subspecies'] * 3, 'Image_filename': ['1.png', 'unknown', '3.png'],
+                       'file_url': ['https://example.com/'] * 3})
+    dataset = {'processed_df': df, 'profile': get_profile(df, False, True), 'index': build_index(df)}
+    key = get_dataset_key(b'Species\nerato\n', 'one.csv')
+    DatasetStore(cache_dir = str(tmp_path / 'cache')).put(key, dataset)
+    assert sorted(path.suffix for path in (tmp_path / 'cache').iterdir()) == ['.arrow', '.json', '.npz']
+    assert (tmp_path / 'cache').stat().st_mode & 0o777 == 0o700
+    loaded = DatasetStore(cache_dir = str(tmp_path / 'cache')).get(key)
+    assert loaded['profile'] == dataset['profile']
+    assert loaded['index'].keys() == dataset['index'].keys()
+    assert np.array_equal(loaded['index']['images'], dataset['index']['images'])
+    for group, ids in dataset['index']['groups'].items():
+        assert np.array_equal(loaded['index']['groups'][group], ids)
+        assert loaded['index']['missing'][group] == dataset['index']['missing'][group]
+
+    # A directory of another user is not used
+    monkeypatch.setattr('os.getuid', lambda: os.stat(tmp_path).st_uid + 1)
+    assert DatasetStore(cache_dir = str(tmp_path / 'cache')).get(key) is None
+    with pytest.raises(PermissionError):
+        DatasetStore(cache_dir = str(tmp_path / 'cache')).put(key, dataset)
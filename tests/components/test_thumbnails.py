@@ -0,0 +1,102 @@
+import io
+import os
+import threading
+import functools
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+import pytest
+from PIL import Image
+from flask import Flask
+import components.thumbnails
+from components.thumbnails import thumbnail_bp, get_thumbnail_url, get_secret, prune_thumbnails
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def image_server(tmp_path):
+    # local stand-in for the image host, counting requests
+    image_dir = tmp_path / 'origin'
+    image_dir.mkdir()
+    Image.new('RGB', (1000, 600), 'orange').save(image_dir / 'wing.png')
+    (image_dir / 'notes.txt').write_text('not an image')
+    requests = []
+
+    class Handler(QuietHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            super().do_GET()
+
+    server = HTTPServer(('127.0.0.1', 0), functools.partial(Handler, directory = str(image_dir)))
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    yield f'http://127.0.0.1:{server.server_port}', requests
+    server.shutdown()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(components.thumbnails, 'THUMBNAIL_DIR', str(tmp_path / 'thumbnails'))
+    monkeypatch.setattr(components.thumbnails, 'THUMBNAILS', True)
+    app = Flask(__name__)
+    app.register_blueprint(thumbnail_bp)
+    return app.test_client()
+
+
+def test_thumbnail(client, image_server):
+    base_url, requests = image_server
+    thumbnail_url = get_thumbnail_url(base_url + '/wing.png', 256)
+    assert thumbnail_url.startswith('/thumbnail/256?')
+    response = client.get(thumbnail_url)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    assert response.cache_control.max_age == 365 * 24 * 60 * 60
+    assert Image.open(io.BytesIO(response.data)).size == (256, 154)
+    # other sizes are made from the same download, repeated requests are served from the cache
+    assert client.get(get_thumbnail_url(base_url + '/wing.png', 128)).status_code == 200
+    assert client.get(thumbnail_url).status_code == 200
+    assert requests == ['/wing.png']
+
+
+def test_thumbnail_errors(client, image_server):
+    base_url, requests = image_server
+    url = base_url + '/wing.png'
+    # unsigned URL or size not offered
+    assert client.get(get_thumbnail_url(url).replace('sig=', 'sig=0')).status_code == 403
+    assert client.get(get_thumbnail_url(url).replace('/256?', '/300?')).status_code == 404
+    # not an image, or not found: the browser is sent to the original
+    for name in ['notes.txt', 'missing.png']:
+        response = client.get(get_thumbnail_url(base_url + '/' + name))
+        assert response.status_code == 302
+        assert response.location == base_url + '/' + name
+    # only http(s) URLs are proxied
+    assert get_thumbnail_url('file:///etc/passwd') == 'file:///etc/passwd'
+
+
+def test_prune_thumbnails(client, image_server, tmp_path):
+    base_url, requests = image_server
+    client.get(get_thumbnail_url(base_url + '/wing.png'))
+    images_dir = tmp_path / 'thumbnails' / 'images'
+    sizes = {path.name: path.stat().st_size for path in images_dir.iterdir()}
+    # keep the most recently used (last written) thumbnail only
+    prune_thumbnails(str(tmp_path / 'thumbnails'), max_bytes = max(sizes.values()))
+    assert len(os.listdir(images_dir)) < len(sizes)
+    # evicted thumbnails are made again
+    assert client.get(get_thumbnail_url(base_url + '/wing.png', 128)).status_code == 200
+
+
+def test_get_secret(tmp_path):
+    # The signing key is kept in a directory only the server's user can access
+    thumbnail_dir = tmp_path / 'thumbnails'
+    secret = get_secret(str(thumbnail_dir))
+    assert len(secret) == 32 and get_secret(str(thumbnail_dir)) == secret
+    assert thumbnail_dir.stat().st_mode & 0o777 == 0o700
+    assert (thumbnail_dir / 'secret').stat().st_mode & 0o777 == 0o600
+    # a key others can read (or write) is refused
+    shared_dir = tmp_path / 'shared'
+    shared_dir.mkdir()
+    (shared_dir / 'secret').write_bytes(b'0' * 32)
+    (shared_dir / 'secret').chmod(0o644)
+    with pytest.raises(PermissionError):
+        get_secret(str(shared_dir))
@@ -0,0 +1,65 @@
+import os
+import pytest
+from flask import Flask
+import components.upload
+from components.upload import upload_bp, get_upload
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(components.upload, 'UPLOAD_DIR', str(tmp_path))
+    app = Flask(__name__)
+    app.register_blueprint(upload_bp)
+    return app.test_client()
+
+
+def upload_file(client, content, filename = 'data.csv', chunk_size = 4):
+    # Send file in chunks, returning the upload ID
+    info = client.post('/upload/init', json = {'filename': filename, 'size': len(content), 'fingerprint': '1'}).get_json()
+    offset = info['offset']
+    while offset < len(content):
+        response = client.put(f"/upload/{info['upload_id']}?offset={offset}", data = content[offset:offset + chunk_size])
+        assert response.status_code == 200
+        offset = response.get_json()['offset']
+    assert client.post(f"/upload/{info['upload_id']}/complete").status_code == 200
+    return info['upload_id']
+
+
+def test_chunked_upload(client, tmp_path):
+    content = b'Species,Subspecies\nmelpomene,nanna\nerato,guarica\n'
+    upload_id = upload_file(client, content)
+    filepath, filename = get_upload(upload_id, str(tmp_path))
+    assert filename == 'data.csv'
+    with open(filepath, 'rb') as file:
+        assert file.read() == content
+    # only the server's user can read the uploads, or add to them
+    assert os.stat(tmp_path).st_mode & 0o777 == 0o700
+    assert {entry.stat().st_mode & 0o777 for entry in os.scandir(tmp_path)} == {0o600}
+
+
+def test_resume_upload(client, tmp_path):
+    content = b'0123456789abcdef'
+    info = {'filename': 'data.csv', 'size': len(content), 'fingerprint': '2'}
+    upload_id = client.post('/upload/init', json = info).get_json()['upload_id']
+    client.put(f'/upload/{upload_id}?offset=0', data = content[:6])
+    # incomplete upload can't be completed, and gaps are rejected with the current offset
+    assert client.post(f'/upload/{upload_id}/complete').status_code == 409
+    response = client.put(f'/upload/{upload_id}?offset=10', data = content[10:])
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == 6
+    assert get_upload(upload_id, str(tmp_path)) is None
+
+    # restarting the same file resumes from the received offset
+    resumed = client.post('/upload/init', json = info).get_json()
+    assert resumed == {'upload_id': upload_id, 'offset': 6, 'complete': False}
+    # re-sent chunk overwrites the same bytes
+    assert client.put(f'/upload/{upload_id}?offset=4', data = content[4:12]).get_json()['offset'] == 12
+    client.put(f'/upload/{upload_id}?offset=12', data = content[12:])
+    assert client.post(f'/upload/{upload_id}/complete').status_code == 200
+    with open(get_upload(upload_id, str(tmp_path))[0], 'rb') as file:
+        assert file.read() == content
+
+
+def test_invalid_upload_id(client):
+    assert client.put('/upload/..%2Fdata?offset=0', data = b'a').status_code == 404
+    assert get_upload('../data') is None
@@ -0,0 +1,87 @@
+import os
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import pandas as pd
+import pytest
+from components.url_checks import check_urls, get_check_progress, get_broken_urls, start_url_checks
+from components.query import get_filenames, get_images
+
+
+@pytest.fixture
+def image_server():
+    # local stand-in for the image host: '/ok*' work, '/get-only*' refuse HEAD, other paths are not found
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def answer(self):
+            requests.append((self.command, self.path))
+            if self.path.startswith('/ok') or (self.path.startswith('/get-only') and self.command == 'GET'):
+                status = 200
+            elif self.path.startswith('/get-only'):
+                status = 405
+            else:
+                status = 404
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        do_HEAD = do_GET = answer
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    yield f'http://127.0.0.1:{server.server_port}', requests
+    server.shutdown()
+
+
+def test_check_urls(image_server, tmp_path):
+    base_url, requests = image_server
+    db_path = str(tmp_path / 'checks.sqlite')
+    urls = [base_url + path for path in ['/ok1.png', '/ok2.png', '/get-only.png', '/missing.png', '/ok1.png']]
+    results = check_urls(urls, 'dataset', db_path = db_path, max_workers = 2)
+    assert results == {urls[0]: True, urls[1]: True, urls[2]: True, urls[3]: False}
+    assert get_broken_urls(db_path = db_path) == {urls[3]}
+    assert get_broken_urls(urls[:3], db_path) == set()
+    assert get_broken_urls(urls[3:], db_path) == {urls[3]}
+    # only the server's user can read or change the results
+    assert os.stat(tmp_path).st_mode & 0o777 == 0o700
+    progress = get_check_progress('dataset', db_path)
+    assert (progress['total'], progress['checked'], progress['broken'], progress['finished']) == (4, 4, 1, True)
+    # results are kept, URLs are not requested again
+    n_requests = len(requests)
+    assert check_urls(urls, 'other dataset', db_path = db_path) == {}
+    assert len(requests) == n_requests
+    assert get_check_progress('other dataset', db_path)['broken'] == 1
+
+
+def test_start_url_checks(image_server, tmp_path):
+    base_url, requests = image_server
+    db_path = str(tmp_path / 'checks.sqlite')
+    thread = start_url_checks(lambda: [base_url + '/missing.png'], 'dataset', db_path)
+    thread.join()
+    assert get_check_progress('dataset', db_path)['broken'] == 1
+    # already checked
+    assert start_url_checks(lambda: [base_url + '/missing.png'], 'dataset', db_path) is None
+
+
+def test_sampling_skips_broken_urls():
+    df = pd.DataFrame({'Species': ['erato'] * 4,
+                       'Subspecies': ['guarica'] * 4,
+                       'View': ['dorsal'] * 4,
+                       'Sex': ['male'] * 4,
+                       'hybrid_stat': ['valid subspecies'] * 4,
+                       'Image_filename': ['1.png', '2.png', '3.png', '4.png'],
+                       'file_url': ['http://host/images/'] * 4})
+    broken_urls = {'http://host/images/1.png', 'http://host/images/3.png'}
+    for _ in range(5):
+        filenames, filepaths, limited = get_filenames(df, 'Any', ['dorsal'], ['male'], ['valid subspecies'], 4,
+                                             find_broken = broken_urls.intersection)
+        assert sorted(filenames) == ['2.png', '4.png'] and limited
+    # the gallery notes that images were left out
+    images = get_images(df, 'Any', ['dorsal'], ['male'], ['valid subspecies'], 4, find_broken = broken_urls.intersection)
+    assert 'broken links' in images[0].children and len(images) == 3
+    with pytest.raises(ValueError, match = 'Broken'):
+        get_filenames(df, 'Any', ['dorsal'], ['male'], ['valid subspecies'], 1,
+                      find_broken = {f'http://host/images/{i}.png' for i in range(1, 5)}.intersection)
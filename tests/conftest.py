@@ -0,0 +1,21 @@
+import pytest
+import components.jobs
+from components.store import dataset_store
+from components.catalog import catalog_store
+
+
+@pytest.fixture(autouse = True)
+def stores(tmp_path, monkeypatch):
+    # Each test starts with empty dataset stores saving to its own directories,
+    # so datasets processed by other tests or earlier runs are never reused
+    for store, name in [(dataset_store, 'datasets'), (catalog_store, 'catalog-cache')]:
+        monkeypatch.setattr(store, 'cache_dir', str(tmp_path / name))
+        monkeypatch.setattr(store, 'pinned', {})
+        store.memory.clear()
+    yield
+    for store in (dataset_store, catalog_store):
+        store.memory.clear()
+    # job processes are forked with the stores of the test, the next test forks its own
+    if components.jobs._executor is not None:
+        components.jobs._executor.shutdown()
+        components.jobs._executor = None
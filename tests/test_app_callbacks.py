@@ -1,30 +1,45 @@
+import io
 import json
+import dash
 import plotly
-from dashboard import update_dist_view, update_dist_plot, update_pie_plot, set_subspecies_options, update_display
+import pytest
+import pandas as pd
+from dash.exceptions import PreventUpdate
+from dashboard import get_visuals, update_dist_plot, update_dist_sort, update_pie_plot, update_display
+from components.store import dataset_store, get_dataset_key
+from components.profile import get_profile
 
 # Define test data
 data = {'processed_df': '{"columns":["Species","Subspecies","View","Sex","hybrid_stat","lat","lon","lat-lon","Samples_at_locality","Species_at_locality","Subspecies_at_locality"],"index":[0,1,2,3,4,5,6,7,8,9],"data":[["erato","notabilis","unknown","unknown","subspecies synonym",-1.583333333,-77.75,"-1.583333333|-77.75",1,"erato","notabilis"],["erato","petiverana","ventral","male","valid subspecies",18.66666667,-96.98333333,"18.66666667|-96.98333333",1,"erato","petiverana"],["unknown","petiverana","ventral","male","valid subspecies","unknown",-84.68333333,"unknown|-84.68333333",1,"unknown","petiverana"],["erato","phyllis","dorsal","male","subspecies synonym",-27.45,-58.98333333,"-27.45|-58.98333333",1,"erato","phyllis"],["unknown","plesseni","ventral","male","valid subspecies",-1.4,"unknown","-1.4|unknown",1,"unknown","plesseni"],["melpomene","unknown","ventral","male","subspecies synonym",-13.36666667,-70.95,"-13.36666667|-70.95",1,"melpomene","unknown"],["melpomene","rosina_S","dorsal","male","valid subspecies",9.883333333,-83.63333333,"9.883333333|-83.63333333",1,"melpomene","rosina_S"],["erato","guarica","dorsal","female","valid subspecies",4.35,-74.36666667,"4.35|-74.36666667",1,"erato","guarica"],["melpomene","plesseni","ventral","male","subspecies synonym",-1.583333333,"unknown","-1.583333333|unknown",1,"melpomene","plesseni"],["melpomene","nanna","unknown","male","valid subspecies",-20.33333333,-40.28333333,"-20.33333333|-40.28333333",1,"melpomene","nanna"]]}',
         'all_species': {'Erato': ['Any-Erato', 'notabilis', 'petiverana', 'phyllis', 'guarica'], 'Unknown': ['Any-Unknown', 'petiverana', 'plesseni'], 'Melpomene': ['Any-Melpomene', 'unknown', 'rosina_S', 'plesseni', 'nanna'], 'Any': ['Any', 'notabilis', 'petiverana', 'phyllis', 'plesseni', 'unknown', 'rosina_S', 'guarica', 'nanna']}, 
         'mapping': True, 
         'images': True}
-jsonified_data = json.dumps(data)
+# Save processed data server-side, callbacks receive its key
+processed_df = pd.read_json(io.StringIO(data['processed_df']), orient = 'split')
+dataset = {'processed_df': processed_df,
+           'profile': get_profile(processed_df, data['mapping'], data['images'])}
+dataset_key = get_dataset_key(data['processed_df'].encode('utf-8'), 'test_app_callbacks.csv')
+jsonified_data = json.dumps({'dataset': dataset_key})
 
+@pytest.fixture(autouse = True)
+def saved_dataset(stores):
+    # saved in the store of each test (see conftest.py)
+    dataset_store.put(dataset_key, dataset)
 
-def test_update_dist_view_call():
-    # Test hist div callback (no clicks or button)
-    output = update_dist_view(0, [], jsonified_data)
-    j_output = json.dumps(output, cls = plotly.utils.PlotlyJSONEncoder)
-    assert "Show Map View" in j_output
-    
-    # Test map div callback (1 click and "Show Map View")
-    output2 = update_dist_view(1, ["Show Map View"], jsonified_data)
-    j_output2 = json.dumps(output2, cls = plotly.utils.PlotlyJSONEncoder)
-    assert "Show Histogram" in j_output2
 
-    # Test hist div callback (clicks and "Show Histogram")
-    output3 = update_dist_view(2, children = "Show Histogram", jsonified_data = jsonified_data)
-    j_output3 = json.dumps(output3, cls = plotly.utils.PlotlyJSONEncoder)
-    assert "Show Map View" in j_output3
+def test_get_visuals():
+    # Main div carries the data for the browser-side callbacks (view switch and subspecies options)
+    output = get_visuals(jsonified_data)
+    j_output = json.loads(json.dumps(output, cls = plotly.utils.PlotlyJSONEncoder))
+    stores = {child['props']['id']: child['props']['data'] for child in j_output['props']['children']
+              if child['type'] == 'Store'}
+    assert stores['dataset-info'] == {'all_species': data['all_species'], 'mapping': True}
+    assert "Show Map View" in json.dumps(stores['dist-layouts']['hist'])
+    assert "Show Histogram" in json.dumps(stores['dist-layouts']['map'])
+
+    # Missing dataset shows error
+    output2 = get_visuals(json.dumps({'dataset': '0' * 64}))
+    assert "no longer available" in json.dumps(output2, cls = plotly.utils.PlotlyJSONEncoder)
 
 
 def test_update_dist_plot_call():
@@ -37,17 +52,32 @@ def test_update_dist_plot_call():
     assert output2['data', 0].type == "scattergeo"
 
 
+def test_update_dist_sort(monkeypatch):
+    # Categories on one page: only their order is sent
+    output, page = update_dist_sort('sum descending', 'Species', 'View', "Show Map View", jsonified_data, 0)
+    operations = output.to_plotly_json()['operations']
+    assert [operation['location'] for operation in operations] == [['layout', 'xaxis', 'categoryarray']]
+    assert operations[0]['params']['value'] == ['erato', 'melpomene', 'unknown']
+    assert page is dash.no_update
+
+    # Categories on several pages: new figure from the first page
+    monkeypatch.setattr('components.graphs.HIST_TOP_K', 2)
+    output, page = update_dist_sort('alpha', 'Subspecies', 'View', "Show Map View", jsonified_data, 0)
+    assert output['layout', 'meta'] == {'page': 0, 'pages': 4}
+    output, page = update_dist_sort('alpha', 'Subspecies', 'View', "Show Map View", jsonified_data, 2)
+    assert (output, page) == (dash.no_update, 0)
+
+    # Map unaffected
+    with pytest.raises(PreventUpdate):
+        update_dist_sort('alpha', 'Species', 'View', "Show Histogram", jsonified_data, 0)
+
+
 def test_update_pie_plot():
     output = update_pie_plot('Subspecies', jsonified_data)
     # Pie plot
     assert output['data', 0].type == "pie"
 
 
-def test_subspecies_options():
-    output = set_subspecies_options('Melpomene', jsonified_data)
-    assert output == [{'label': i, 'value': i} for i in ['Any-Melpomene', 'unknown', 'rosina_S', 'plesseni', 'nanna']]
-
-
 def test_update_display(mocker):
         mocker.patch('dashboard.get_images', return_value = ['image' + str(i) for i in range(5)])
         output = update_display(1, 
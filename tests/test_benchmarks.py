@@ -0,0 +1,28 @@
+from benchmarks.generate import make_dataset
+from benchmarks.bench_scaling import run_stages, STAGES
+from components.profile import check_features
+
+
+def test_make_dataset():
+    df = make_dataset(1000, n_species = 3, n_subspecies = 12, n_localities = 50, n_views = 3, seed = 1)
+    assert len(df) == 1000
+    included_features, mapping, images, missing = check_features(df.columns)
+    assert missing is None and mapping and images
+    assert df.Species.nunique() == 3
+    assert df.Subspecies.nunique() == 12
+    assert df.locality.nunique() <= 50
+    assert df.View.nunique() == 3
+    # each subspecies belongs to one species, each locality has one position
+    assert (df.groupby('Subspecies').Species.nunique() == 1).all()
+    assert (df.dropna(subset = ['lat']).groupby('locality').lat.nunique() == 1).all()
+    # same seed, same dataset
+    assert make_dataset(1000, 3, 12, 50, 3, seed = 1).equals(df)
+
+
+def test_run_stages():
+    df = make_dataset(500, seed = 2)
+    results = run_stages(df, memory = False)
+    assert [result['stage'] for result in results] == STAGES
+    for result in results:
+        assert result['seconds'] > 0
+        assert result['peak_bytes'] is None
@@ -1,7 +1,15 @@
 import base64
+import gc
 import json
+import time
+import dash
+import components.upload
+import components.catalog
+import dashboard
 import pandas as pd
-from dashboard import parse_contents
+from dashboard import (parse_contents, parse_upload, select_sheet, poll_job, list_catalog_options, select_catalog_dataset, load_dataset,
+                       preload_datasets)
+from components.store import dataset_store
 
 
 # Generate test data
@@ -19,6 +27,17 @@ def generate_mock_upload(filepath):
     contents = "".join([content_type, ",", content_string])
     return contents
 
+def wait_for_job(output, timeout = 60):
+    # Function to follow the upload processing job as the job interval does, returning its result
+    deadline = time.time() + timeout
+    while 'job' in json.loads(output):
+        result, stage, style, disabled = poll_job(0, output)
+        if result is not dash.no_update:
+            return result
+        assert time.time() < deadline, 'upload processing job did not finish'
+        time.sleep(0.05)
+    return output
+
 
 # Define Test Cases 
 test_cases = [
@@ -63,10 +82,130 @@ def test_parse_contents():
     # Test feature parsing pulls proper columns
     for case in test_cases:
         contents = generate_mock_upload(case['filepath'])
-        output = parse_contents(contents, case['filename'])
+        output = wait_for_job(parse_contents(contents, case['filename']))
         output = json.loads(output)
-        dff = pd.read_json(output['processed_df'], orient = 'split')
+        dataset = dataset_store.get(output['dataset'])
+        dff = dataset['processed_df']
 
         assert list(dff.columns) == case['expected_columns']
-        assert output['mapping'] == case['expected_mapping']
-        assert output['images'] == case['expected_images']
+        assert dataset['profile'].mapping == case['expected_mapping']
+        assert dataset['profile'].images == case['expected_images']
+        assert dataset['profile'].n_rows == len(dff)
+
+def test_parse_contents_error():
+    # Unsupported file type is reported in saved data, nothing is stored
+    contents = generate_mock_upload("test_data/HCGSD_testNA.csv")
+    output = json.loads(wait_for_job(parse_contents(contents, "HCGSD_testNA.txt")))
+    assert output == {'error': {'type': 'wrong file type'}}
+
+def test_parse_upload(tmp_path, monkeypatch):
+    # File uploaded in chunks is read from its path once the upload ID is in the URL
+    monkeypatch.setattr(components.upload, 'UPLOAD_DIR', str(tmp_path))
+    case = test_cases[0]
+    (tmp_path / ('0' * 32 + '.json')).write_text(json.dumps({'filename': case['filename'], 'size': 0}))
+    with open(case['filepath'], 'rb') as file:
+        (tmp_path / ('0' * 32 + '.data')).write_bytes(file.read())
+    output = json.loads(wait_for_job(parse_upload('?upload=' + '0' * 32 + '&n=1')))
+    dataset = dataset_store.get(output['dataset'])
+    assert list(dataset['processed_df'].columns) == case['expected_columns']
+    # Uploading the same file again changes only the nonce
+    assert json.loads(wait_for_job(parse_upload('?upload=' + '0' * 32 + '&n=2'))) == output
+    # Same content gets the same key as the regular upload
+    assert json.loads(wait_for_job(parse_contents(generate_mock_upload(case['filepath']), case['filename']))) == output
+
+def test_url_checks_after_job(monkeypatch):
+    # Image URLs of an upload processed in a job are checked from the web worker, once per upload
+    started = []
+    monkeypatch.setattr(dashboard, 'URL_CHECKS', True)
+    monkeypatch.setattr(dashboard, 'start_url_checks', lambda get_urls, dataset_key: started.append(dataset_key))
+    case = test_cases[0]
+    output = json.loads(wait_for_job(parse_contents(generate_mock_upload(case['filepath']), case['filename'])))
+    assert started == [output['dataset']]
+    # without image URLs, nothing to check
+    case = test_cases[1]
+    wait_for_job(parse_contents(generate_mock_upload(case['filepath']), case['filename']))
+    assert started == [output['dataset']]
+
+def test_select_sheet(tmp_path, monkeypatch):
+    # Workbooks are read from their first sheet, other sheets can be selected
+    df = pd.read_csv(test_cases[0]['filepath'])
+    path = tmp_path / 'data.xlsx'
+    with pd.ExcelWriter(path) as writer:
+        df.to_excel(writer, sheet_name = 'All', index = False)
+        df[df.Species == 'erato'].to_excel(writer, sheet_name = 'Erato', index = False)
+    contents = 'data:application/octet-stream;base64,' + base64.b64encode(path.read_bytes()).decode('utf-8')
+    # workbooks are parsed in a background job, even with background jobs off for other files
+    monkeypatch.setattr(dashboard, 'BACKGROUND_JOBS', False)
+    output = parse_contents(contents, 'data.xlsx')
+    assert 'job' in json.loads(output)
+    output = wait_for_job(output)
+    saved = json.loads(output)
+    assert (saved['sheets'], saved['sheet'], saved['upload']) == (['All', 'Erato'], 'All', None)
+    assert dataset_store.get(saved['dataset'])['profile'].n_rows == len(df)
+    erato = json.loads(wait_for_job(select_sheet('Erato', output, contents, 'data.xlsx')))
+    assert erato['sheet'] == 'Erato'
+    assert dataset_store.get(erato['dataset'])['profile'].n_rows == (df.Species == 'erato').sum()
+    # selecting the first sheet again gives back the first dataset
+    assert json.loads(wait_for_job(select_sheet('All', json.dumps(erato), contents, 'data.xlsx'))) == saved
+
+def test_select_catalog_dataset(tmp_path, monkeypatch):
+    # Catalog files are listed in the picker and processed once into the catalog store
+    catalog_dir = tmp_path / 'catalog'
+    catalog_dir.mkdir()
+    case = test_cases[0]
+    pd.read_csv(case['filepath']).to_parquet(catalog_dir / 'full.parquet')
+    monkeypatch.setattr(components.catalog, 'CATALOG_DIR', str(catalog_dir))
+    # processed in this process, the job processes don't see the patched catalog
+    monkeypatch.setattr(dashboard, 'BACKGROUND_JOBS', False)
+    options, style = list_catalog_options('/')
+    assert options == ['full.parquet'] and style.get('display') != 'none'
+
+    output = select_catalog_dataset('full.parquet')
+    dataset = load_dataset(output)
+    assert list(dataset['processed_df'].columns) == case['expected_columns']
+    assert components.catalog.catalog_store.get(json.loads(output)['dataset']) is not None
+    # other sessions share the processed dataset
+    monkeypatch.setattr(dashboard, 'load_data', None)
+    assert select_catalog_dataset('full.parquet') == output
+
+def test_preload_datasets(tmp_path, monkeypatch):
+    # Preloaded catalog datasets are processed and pinned in memory before any session selects them
+    catalog_dir = tmp_path / 'catalog'
+    catalog_dir.mkdir()
+    pd.read_csv(test_cases[0]['filepath']).to_parquet(catalog_dir / 'full.parquet')
+    monkeypatch.setattr(components.catalog, 'CATALOG_DIR', str(catalog_dir))
+    try:
+        keys = preload_datasets('full.parquet, missing.csv')
+        assert gc.get_freeze_count() > 0
+        assert list(components.catalog.catalog_store.pinned) == keys
+        assert preload_datasets('*') == keys
+    finally:
+        # the objects of the other tests are left to garbage collection
+        gc.unfreeze()
+    # selecting it reuses the preloaded dataset
+    monkeypatch.setattr(dashboard, 'load_data', None)
+    assert json.loads(select_catalog_dataset('full.parquet')) == {'dataset': keys[0]}
+
+def test_missing_feature_before_parse(monkeypatch):
+    # Missing required columns are reported from the header, without parsing the rows
+    monkeypatch.setattr(dashboard, 'BACKGROUND_JOBS', False)
+    monkeypatch.setattr(dashboard, 'read_data', None)
+    content = b'Species,Sex,lat,lon\nerato,male,10.5,-70.1\n'
+    contents = 'data:text/csv;base64,' + base64.b64encode(content).decode('utf-8')
+    assert json.loads(parse_contents(contents, 'no_subspecies.csv')) == {'error': {'feature': 'Subspecies'}}
+
+def test_append_upload(tmp_path):
+    # Uploads in append mode add their rows to the current dataset
+    df = pd.read_csv(test_cases[0]['filepath'])
+    df.iloc[:6].to_csv(tmp_path / 'first.csv', index = False)
+    df.iloc[6:].to_csv(tmp_path / 'batch.csv', index = False)
+    output = wait_for_job(parse_contents(generate_mock_upload(tmp_path / 'first.csv'), 'first.csv'))
+    appended = wait_for_job(parse_contents(generate_mock_upload(tmp_path / 'batch.csv'), 'batch.csv', ['append'], output))
+    dataset = load_dataset(appended)
+    assert dataset['profile'].n_rows == len(df) == dataset['index']['n_rows']
+    assert list(dataset['processed_df'].columns) == test_cases[0]['expected_columns']
+    # the current dataset is unchanged, append mode needs its features
+    assert load_dataset(output)['profile'].n_rows == 6
+    df.iloc[6:].drop(columns = 'Subspecies').to_csv(tmp_path / 'bad.csv', index = False)
+    error = wait_for_job(parse_contents(generate_mock_upload(tmp_path / 'bad.csv'), 'bad.csv', ['append'], output))
+    assert json.loads(error) == {'error': {'feature': 'Subspecies'}}